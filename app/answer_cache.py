@@ -0,0 +1,165 @@
+"""
+Semantic Answer Cache
+Functionalities Included:
+- Answers keyed on the set of retrieved chunk IDs plus query-embedding similarity
+- Configurable cosine-similarity threshold and TTL
+- Invalidation when the collection version changes
+- Hit / miss counters and generation time saved
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+from app.index_ledger import collection_version
+
+# -------------------------
+# CACHE CONFIG
+# -------------------------
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(".cache", "answers.sqlite3"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_stats = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0, "saved_seconds": 0.0}
+
+# -------------------------
+# CONNECTION
+# -------------------------
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(ANSWER_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(ANSWER_CACHE_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " collection TEXT NOT NULL,"
+            " context_key TEXT NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " query TEXT NOT NULL,"
+            " query_embedding BLOB NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " generation_seconds REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_context ON answers(collection, context_key)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+# -------------------------
+# KEYS / SIMILARITY
+# -------------------------
+def context_key(chunk_ids: List[str]) -> str:
+    """Order-independent key for the set of chunks an answer was grounded on"""
+    return hashlib.sha256("\n".join(sorted(set(chunk_ids))).encode("utf-8")).hexdigest()
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+# -------------------------
+# LOOKUP / STORE
+# -------------------------
+def lookup_answer(collection: str, query_embedding: List[float], chunk_ids: List[str]) -> Optional[Dict[str, Any]]:
+    """Return ``{"answer", "similarity", "query"}`` for a close enough earlier question, or None.
+
+    Only answers grounded on the same retrieved chunks, written at the current
+    collection version and younger than the TTL are considered.
+    """
+    if not ANSWER_CACHE_ENABLED or not query_embedding or not chunk_ids:
+        return None
+    version = collection_version(collection)
+    key = context_key(chunk_ids)
+    with _lock:
+        conn = _get_connection()
+        # Anything cached before the collection last changed can never hit again
+        stale = conn.execute("DELETE FROM answers WHERE collection = ? AND version < ?", (collection, version)).rowcount
+        _stats["invalidated"] += stale
+        rows = conn.execute(
+            "SELECT id, query, query_embedding, answer, generation_seconds FROM answers "
+            "WHERE collection = ? AND context_key = ? AND version = ? AND created_at >= ?",
+            (collection, key, version, time.time() - ANSWER_CACHE_TTL)
+        ).fetchall()
+
+        best = None
+        for entry_id, query, blob, answer, generation_seconds in rows:
+            vector = array("f")
+            vector.frombytes(blob)
+            similarity = _cosine(query_embedding, vector)
+            if similarity >= ANSWER_CACHE_THRESHOLD and (best is None or similarity > best[0]):
+                best = (similarity, entry_id, query, answer, generation_seconds)
+
+        if best is None:
+            _stats["misses"] += 1
+            if stale:
+                conn.commit()
+            return None
+        similarity, entry_id, query, answer, generation_seconds = best
+        conn.execute("UPDATE answers SET hits = hits + 1 WHERE id = ?", (entry_id,))
+        conn.commit()
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += generation_seconds
+        hit_rate = _stats["hits"] / (_stats["hits"] + _stats["misses"])
+    print(f"⚡ Answer cache hit (similarity {similarity:.3f}, hit rate {hit_rate:.0%}, "
+          f"{_stats['saved_seconds']:.0f}s of generation saved)")
+    return {"answer": answer, "similarity": similarity, "query": query}
+
+def store_answer(collection: str, query: str, query_embedding: List[float], chunk_ids: List[str],
+                 answer: str, generation_seconds: float) -> None:
+    """Cache a generated answer and evict the oldest overflow"""
+    if not ANSWER_CACHE_ENABLED or not query_embedding or not chunk_ids or not answer:
+        return
+    version = collection_version(collection)
+    with _lock:
+        conn = _get_connection()
+        conn.execute(
+            "INSERT INTO answers (collection, context_key, version, query, query_embedding, answer, "
+            "generation_seconds, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (collection, context_key(chunk_ids), version, query, array("f", query_embedding).tobytes(),
+             answer, generation_seconds, time.time())
+        )
+        _stats["stores"] += 1
+        overflow = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - ANSWER_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY created_at ASC LIMIT ?)",
+                (overflow,)
+            )
+        conn.commit()
+
+# -------------------------
+# STATS / MAINTENANCE
+# -------------------------
+def get_answer_cache_stats() -> Dict[str, float]:
+    """Hit/miss counters for this process plus the current cache size"""
+    with _lock:
+        stats = dict(_stats)
+        if ANSWER_CACHE_ENABLED:
+            stats["entries"] = _get_connection().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        else:
+            stats["entries"] = 0
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+def clear_answer_cache() -> None:
+    """Drop every cached answer"""
+    with _lock:
+        conn = _get_connection()
+        conn.execute("DELETE FROM answers")
+        conn.commit()
@@ -0,0 +1,182 @@
+"""
+Headless RAG API
+Functionalities Included:
+- Stateless HTTP query endpoint: retrieve -> prompt assembly -> LLM answer
+- Streaming answers as newline-delimited JSON events
+- Optional cross-encoder reranking of a wider candidate set before the prompt is built
+- Repeated questions served from the semantic answer cache
+- Liveness / readiness probes and cache metrics for running replicas behind a load balancer
+- API key (bearer token) authentication of the query and metrics endpoints
+
+Run with:
+    API_KEYS=<key> uvicorn app.api:app --host 127.0.0.1 --port 8000 --workers 4
+
+Clients send ``Authorization: Bearer <key>`` (or ``X-API-Key: <key>``). Bind
+to a public interface only behind TLS, e.g. a reverse proxy.
+
+Every worker and replica must share the state directory of the process that
+ingests documents (``.cache`` by default, or the INDEX_LEDGER_PATH,
+LEXICAL_INDEX_DIR, ANSWER_CACHE_PATH and EMBEDDING_CACHE_PATH overrides): the
+collection version that invalidates cached answers and retrievals lives in
+the index ledger there, next to the BM25 index. A replica with its own copy
+never sees ingests, so it keeps serving stale answers and keyword matches.
+Run replicas on the ingest host or mount one shared volume on all of them.
+"""
+
+import hmac
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from app.answer_cache import get_answer_cache_stats, lookup_answer, store_answer
+from app.chat_utils import CHAT_ERROR_RESPONSE, NO_CONTEXT_RESPONSE, ask_chat_model, build_rag_prompt, \
+    get_chat_model, get_sources, stream_chat_model
+from app.embedding_cache import get_cache_stats
+from app.reranker import get_rerank_stats, get_reranker, retrieve_reranked_docs
+from app.vectorstore_utils import CHROMA_COLLECTION, build_where, ensure_collection_exists, get_embedding_batch_stats, \
+    get_query_cache_stats, get_query_embedding
+
+# -------------------------
+# API CONFIG
+# -------------------------
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_DEFAULT_K = int(os.getenv("API_DEFAULT_K", "4"))
+# Comma-separated, so a key can be rotated without downtime; with none set the protected routes refuse every request
+API_KEYS = [key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the cross-encoder (when enabled) before serving, so no query pays for it
+    await run_in_threadpool(get_reranker)
+    yield
+
+app = FastAPI(title="MediChat RAG API", lifespan=lifespan)
+
+class QueryRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    k: int = Field(API_DEFAULT_K, ge=1, le=50)
+    stream: bool = True
+    # Optional scope: only these S3 keys and/or this patient's documents
+    sources: Optional[List[str]] = None
+    patient_id: Optional[str] = None
+
+def require_api_key(authorization: Optional[str] = Header(None), x_api_key: Optional[str] = Header(None)) -> None:
+    """Dependency: the request carries one of API_KEYS as a bearer token or X-API-Key header"""
+    if not API_KEYS:
+        raise HTTPException(status_code=503, detail="No API_KEYS configured")
+    scheme, _, token = (authorization or "").partition(" ")
+    supplied = (token.strip() if scheme.lower() == "bearer" else x_api_key) or ""
+    # Constant-time comparison, so response timing doesn't leak key prefixes
+    if not any(hmac.compare_digest(supplied.encode("utf-8"), key.encode("utf-8")) for key in API_KEYS):
+        raise HTTPException(status_code=401, detail="Invalid or missing API key",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+def _event(payload: Dict[str, Any]) -> bytes:
+    return (json.dumps(payload) + "\n").encode("utf-8")
+
+def _retrieve(question: str, k: int, where: Optional[Dict[str, Any]] = None):
+    """Embed the question once and retrieve (and, if enabled, rerank) its context"""
+    query_embedding = get_query_embedding(question)
+    rerank_stats: Dict[str, Any] = {}
+    context_docs = retrieve_reranked_docs(question, k, query_embedding=query_embedding, where=where, stats=rerank_stats)
+    return query_embedding, context_docs, rerank_stats.get("ms")
+
+def _stream_answer(question: str, query_embedding, context_docs, retrieval_ms: float,
+                   rerank_ms: Optional[float]) -> Iterator[bytes]:
+    """NDJSON events: context, then one per token, then done with timings"""
+    cached = None
+    if context_docs:
+        chunk_ids = [doc.id for doc in context_docs]
+        cached = lookup_answer(CHROMA_COLLECTION, query_embedding, chunk_ids)
+    yield _event({"type": "context", "chunks": len(context_docs), "retrieval_ms": retrieval_ms,
+                  "rerank_ms": rerank_ms, "cached": cached is not None, "sources": get_sources(context_docs)})
+    if not context_docs or cached:
+        yield _event({"type": "token", "text": cached["answer"] if cached else NO_CONTEXT_RESPONSE})
+        yield _event({"type": "done", "ttft": None, "total": 0.0})
+        return
+    stats: Dict[str, Any] = {}
+    answer = []
+    for delta in stream_chat_model(get_chat_model(), build_rag_prompt(question, context_docs), stats=stats):
+        answer.append(delta)
+        yield _event({"type": "token", "text": delta})
+    if not stats.get("error"):
+        store_answer(CHROMA_COLLECTION, question, query_embedding, chunk_ids, "".join(answer), stats["total"])
+    yield _event({"type": "done", "ttft": stats.get("ttft"), "total": stats.get("total")})
+
+# -------------------------
+# ROUTES
+# -------------------------
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    collection = await run_in_threadpool(ensure_collection_exists)
+    if not collection:
+        return JSONResponse({"status": "unavailable"}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics", dependencies=[Depends(require_api_key)])
+async def metrics():
+    """Per-process cache counters; scrape every replica to aggregate"""
+    return {
+        "answer_cache": await run_in_threadpool(get_answer_cache_stats),
+        "embedding_cache": await run_in_threadpool(get_cache_stats),
+        "embedding_batches": get_embedding_batch_stats(),
+        "rerank": get_rerank_stats(),
+        **get_query_cache_stats(),
+    }
+
+@app.post("/v1/query", dependencies=[Depends(require_api_key)])
+async def query(request: QueryRequest):
+    """Answer a question from the indexed documents; every request is self-contained"""
+    start = time.perf_counter()
+    # Retrieval and the LLM client are blocking, so they run on the threadpool
+    where = build_where(request.sources, request.patient_id)
+    query_embedding, context_docs, rerank_ms = await run_in_threadpool(_retrieve, request.question, request.k, where)
+    retrieval_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    if request.stream:
+        return StreamingResponse(
+            _stream_answer(request.question, query_embedding, context_docs, retrieval_ms, rerank_ms),
+            media_type="application/x-ndjson"
+        )
+
+    cached = None
+    if context_docs:
+        chunk_ids = [doc.id for doc in context_docs]
+        cached = await run_in_threadpool(lookup_answer, CHROMA_COLLECTION, query_embedding, chunk_ids)
+    if not context_docs:
+        answer = NO_CONTEXT_RESPONSE
+    elif cached:
+        answer = cached["answer"]
+    else:
+        generation_start = time.perf_counter()
+        answer = await run_in_threadpool(ask_chat_model, get_chat_model(), build_rag_prompt(request.question, context_docs))
+        if answer != CHAT_ERROR_RESPONSE:
+            await run_in_threadpool(store_answer, CHROMA_COLLECTION, request.question, query_embedding, chunk_ids,
+                                    answer, time.perf_counter() - generation_start)
+    return {
+        "answer": answer,
+        "chunks": len(context_docs),
+        "sources": get_sources(context_docs),
+        "cached": cached is not None,
+        "retrieval_ms": retrieval_ms,
+        "rerank_ms": rerank_ms,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    from dotenv import load_dotenv
+    load_dotenv()
+    uvicorn.run("app.api:app", host=API_HOST, port=API_PORT)
@@ -10,15 +10,18 @@
 #     return response.content 
 
 import openai 
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Iterator, Optional
 import re 
 from app.config import OPENAI_API_BASE, OPENAI_API_KEY, LLM_MODEL
+from app.context_packing import pack_context
 
 ## Configuring the OpenAI API
 openai.api_base = OPENAI_API_BASE
 openai.api_key = OPENAI_API_KEY
 
 TEMPERTAURE=0.7
+CHAT_ERROR_RESPONSE="Error: Unable to get response from the AI model. Please try again."
 
 def get_chat_model(api_key:str=None):
     """Get a chat model config from self hosted LLM"""
@@ -29,6 +32,17 @@ def get_chat_model(api_key:str=None):
         'api_base': OPENAI_API_BASE,
     }
 
+def _extract_choice_content(choice) -> str:
+    """Pull the text out of a completion choice, whatever shape the server returned"""
+    # Streaming chunks carry a delta, full completions carry a message
+    if hasattr(choice, 'delta'):
+        return choice.delta.get('content') or ''
+    if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
+        return choice.message.content or ''
+    if hasattr(choice, 'text'):
+        return choice.text or ''
+    return str(choice)
+
 def ask_chat_model(chat_model,prompt:str):
     """Ask a chat model a question"""
     try:
@@ -40,18 +54,65 @@ def ask_chat_model(chat_model,prompt:str):
         )
         # Handle different response formats
         if hasattr(response, 'choices') and len(response.choices) > 0:
-            choice = response.choices[0]
-            if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
-                return choice.message.content
-            elif hasattr(choice, 'text'):
-                return choice.text
-            else:
-                return str(choice)
+            return _extract_choice_content(response.choices[0])
         else:
             return str(response)
     except Exception as e:
         print(f"Error calling self-hosted LLM: {e}")
-        return f"Error: Unable to get response from the AI model. Please try again."
+        return CHAT_ERROR_RESPONSE
+
+def stream_chat_model(chat_model, prompt:str, stats:Optional[Dict[str,Any]]=None) -> Iterator[str]:
+    """Ask a chat model a question and yield the answer as it is generated.
+
+    If a ``stats`` dict is passed it is filled with ``ttft`` (seconds to the
+    first non-empty delta) and ``total`` (seconds for the whole answer), plus
+    ``error`` if the request failed.
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    stats['ttft'] = None
+    try:
+        response=openai.ChatCompletion.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=TEMPERTAURE,
+            stream=True
+        )
+        for chunk in response:
+            # Keep-alive and usage chunks carry no choices, nothing to show
+            if not getattr(chunk, 'choices', None):
+                continue
+            delta = _extract_choice_content(chunk.choices[0])
+            if not delta:
+                continue
+            if stats['ttft'] is None:
+                stats['ttft'] = time.perf_counter() - start
+                print(f"⏱️  Time to first token: {stats['ttft']:.2f}s")
+            yield delta
+    except Exception as e:
+        print(f"Error streaming from self-hosted LLM: {e}")
+        stats['error'] = str(e)
+        yield CHAT_ERROR_RESPONSE
+    finally:
+        stats['total'] = time.perf_counter() - start
+
+NO_CONTEXT_RESPONSE="I'm sorry, but I couldn't find any information related to your question in the uploaded documents. Could you please ask something else?"
+
+def build_rag_prompt(question:str, context_docs:List[Any])->str:
+    """Assemble the grounded prompt from retrieved documents, packed into the context token budget"""
+    context_text=pack_context(context_docs)["text"]
+    return f"""Based on this context:{context_text}\n\n Answer this question: {question}"""
+
+def get_sources(context_docs:List[Any])->List[Dict[str,Any]]:
+    """Distinct ``{"source", "page"}`` citations of the retrieved documents, in rank order"""
+    sources=[]
+    for doc in context_docs:
+        metadata=getattr(doc,"metadata",None) or {}
+        if metadata.get("source"):
+            source={"source":metadata["source"],"page":metadata.get("page")}
+            if source not in sources:
+                sources.append(source)
+    return sources
 
 def generate_medical_insights(text:str)->Dict[str,Any]:
     """Generate medical insights from the text analysis of the medical report"""
@@ -0,0 +1,190 @@
+"""
+Document Chunking
+Functionalities Included:
+- One text splitter per process, configured once from the environment and reused
+- Chunk metadata: source, page, chunk offset and any document fields (upload time, patient)
+- Optional page-boundary splitting so no chunk straddles two PDF pages
+- Chunking across documents on a process pool, yielded lazily in input order
+"""
+
+import itertools
+import json
+import os
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.pdf_utils import CleanText, join_pages
+
+# -------------------------
+# CHUNKING CONFIG
+# -------------------------
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+CHUNK_SEPARATORS = ["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+# "document" splits the joined text of all pages; "page" splits every page on its own
+CHUNK_BOUNDARY = os.getenv("CHUNK_BOUNDARY", "document").lower()
+# Recorded with each object in the index ledger, like the embedding model: changing it re-indexes on the next import
+CHUNKING_CONFIG = json.dumps({"size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP, "boundary": CHUNK_BOUNDARY,
+                              "separators": CHUNK_SEPARATORS})
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", str(os.cpu_count() or 1)))
+# Smaller inputs are split in-process; the pickling round-trip would cost more than it saves
+CHUNK_PARALLEL_MIN_CHARS = int(os.getenv("CHUNK_PARALLEL_MIN_CHARS", str(1024 * 1024)))
+CHUNK_TASK_DOCUMENTS = int(os.getenv("CHUNK_TASK_DOCUMENTS", "16"))
+
+_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """The process-wide splitter; it keeps no per-call state, so every caller shares it"""
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=CHUNK_SEPARATORS
+        )
+    return _splitter
+
+# -------------------------
+# SINGLE DOCUMENT
+# -------------------------
+def _split_joined(text: str, page_starts: List[Tuple[int, int]]) -> Iterator[Tuple[Optional[int], str]]:
+    """Split a whole document, mapping each chunk's start offset back to its page"""
+    offsets = [offset for offset, _ in page_starts]
+    cursor = 0
+    for chunk in get_text_splitter().split_text(text):
+        # Chunks come out in document order, so each one starts after the previous start
+        start = text.find(chunk, cursor)
+        start = cursor if start < 0 else start
+        cursor = start + 1
+        page = page_starts[max(0, bisect_right(offsets, start) - 1)][1] if page_starts else None
+        yield page, chunk
+
+def document_metadata(document: Dict[str, Any]) -> Dict[str, Any]:
+    """The document-level fields ``chunk_document`` copies into every chunk's metadata"""
+    return {field: value for field, value in document.items()
+            if field not in ("key", "pages", "text") and value is not None}
+
+def chunk_document(document: Dict[str, Any], boundary: str = None) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Split one document into ``(chunk, key, metadata)`` triples.
+
+    ``document`` has a ``key`` and either ``pages`` (cleaned ``(page_number, text)``
+    pairs) or ``text``; any other non-None fields (e.g. ``uploaded_at``,
+    ``patient_id``) are copied into every chunk's metadata next to ``source``,
+    ``chunk_offset`` and ``page``. With ``boundary="page"`` each page is split
+    on its own, so no chunk crosses a page break.
+    """
+    boundary = boundary or CHUNK_BOUNDARY
+    key = document["key"]
+    extra = document_metadata(document)
+    if "pages" in document and boundary == "page":
+        clean = True
+        pieces = ((page_number, chunk) for page_number, text in document["pages"]
+                  for chunk in get_text_splitter().split_text(text))
+    elif "pages" in document:
+        clean = True
+        pieces = _split_joined(*join_pages(document["pages"]))
+    else:
+        # Stripped slices of clean text are clean too; skip re-cleaning them
+        clean = isinstance(document["text"], CleanText)
+        pieces = _split_joined(document["text"], [])
+
+    chunks = []
+    for chunk_offset, (page, chunk) in enumerate(pieces):
+        metadata = {"source": key, "chunk_offset": chunk_offset, **extra}
+        if page is not None:
+            metadata["page"] = page
+        chunks.append((CleanText(chunk) if clean else chunk, key, metadata))
+    return chunks
+
+def _chunk_documents(documents: List[Dict[str, Any]], boundary: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Worker task: chunk a handful of documents in one round-trip"""
+    return [chunk for document in documents for chunk in chunk_document(document, boundary)]
+
+def _document_chars(documents: List[Dict[str, Any]]) -> int:
+    return sum(sum(len(text) for _, text in doc["pages"]) if "pages" in doc else len(doc["text"])
+               for doc in documents)
+
+# -------------------------
+# PROCESS POOL
+# -------------------------
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+def get_chunking_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """Reuse one process pool (and each worker's splitter) across calls"""
+    global _pool, _pool_workers
+    max_workers = max(1, max_workers or CHUNK_WORKERS)
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pool_workers = max_workers
+        return _pool
+
+def iter_document_chunks(documents: Iterable[Dict[str, Any]], max_workers: int = None,
+                         boundary: str = None) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """Lazily yield ``(chunk, key, metadata)`` for each document, in input order.
+
+    ``documents`` may itself be a generator. Documents are sent to the chunking
+    pool CHUNK_TASK_DOCUMENTS at a time with at most two tasks per worker in
+    flight, so memory stays bounded and the embedder can start on the first
+    chunks while later documents are still being split. Inputs smaller than
+    CHUNK_PARALLEL_MIN_CHARS are split in-process.
+    """
+    boundary = boundary or CHUNK_BOUNDARY
+    max_workers = max(1, max_workers or CHUNK_WORKERS)
+    documents = iter(documents)
+    tasks = iter(lambda: list(itertools.islice(documents, CHUNK_TASK_DOCUMENTS)), [])
+    first = next(tasks, None)
+    if first is None:
+        return
+    second = next(tasks, None)
+    if max_workers == 1 or (second is None and _document_chars(first) < CHUNK_PARALLEL_MIN_CHARS):
+        for task in itertools.chain([first], [second] if second else [], tasks):
+            yield from _chunk_documents(task, boundary)
+        return
+
+    pool = get_chunking_pool(max_workers)
+    pending = deque()
+    for task in itertools.chain([first], [second] if second else [], tasks):
+        pending.append(pool.submit(_chunk_documents, task, boundary))
+        if len(pending) >= 2 * max_workers:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+# -------------------------
+# LIST HELPERS
+# -------------------------
+def get_document_chunks(texts):
+    """Split documents into chunks for vectorstore"""
+    chunks, _ = get_document_chunks_with_keys(texts)
+    return chunks
+
+def get_document_chunks_with_keys(texts, keys=None):
+    """Split documents into chunks and return each chunk's source document key"""
+    if keys is None:
+        keys = [f"text_{i}" for i in range(len(texts))]
+    chunks, chunk_keys, _ = get_document_chunks_with_metadata(
+        {"key": key, "text": text} for text, key in zip(texts, keys)
+    )
+    return chunks, chunk_keys
+
+def get_document_chunks_with_metadata(documents):
+    """Split documents into chunks and return the chunks, their source keys and their metadata.
+
+    See ``chunk_document`` for the document format; chunk boundaries (and so
+    chunk IDs) match ``get_document_chunks_with_keys`` on the joined text.
+    """
+    chunks, chunk_keys, metadatas = [], [], []
+    for chunk, key, metadata in iter_document_chunks(documents):
+        chunks.append(chunk)
+        chunk_keys.append(key)
+        metadatas.append(metadata)
+    return chunks, chunk_keys, metadatas
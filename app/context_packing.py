@@ -0,0 +1,180 @@
+"""
+Context Packing
+Functionalities Included:
+- Merge adjacent chunks of the same document, dropping their overlap
+- Near-duplicate removal with word-shingle Jaccard similarity
+- Greedy packing into a token budget measured with the LLM's tokenizer
+- Source / page labels on each block so answers can cite them
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character estimate
+    tiktoken = None
+
+# -------------------------
+# PACKING CONFIG
+# -------------------------
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# gpt-oss uses the o200k vocabulary
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "o200k_base")
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Don't bother squeezing in a truncated block smaller than this
+CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("CONTEXT_MIN_TRUNCATED_TOKENS", "64"))
+CONTEXT_SEPARATOR = "\n\n"
+
+_MIN_OVERLAP_CHARS = 20
+_WORD_RE = re.compile(r"\w+")
+_encoding = None
+
+# -------------------------
+# TOKENIZER
+# -------------------------
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        except Exception as e:
+            print(f"⚠️ Tokenizer '{CONTEXT_TOKENIZER}' unavailable, estimating tokens from length: {e}")
+            _encoding = False
+    return _encoding or None
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+# -------------------------
+# MERGE / DEDUPLICATE
+# -------------------------
+def _parse_chunk_id(chunk_id: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """``key::offset::digest`` -> (key, offset); IDs in other formats are never merged"""
+    parts = chunk_id.rsplit("::", 2) if chunk_id else []
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None, None
+    return parts[0], int(parts[1])
+
+def _join_overlapping(left: str, right: str) -> str:
+    """Concatenate two neighbouring chunks, removing the text they share"""
+    for size in range(min(len(left), len(right)), _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + " " + right
+
+def merge_adjacent(docs: List[Any]) -> List[Dict[str, Any]]:
+    """Merge consecutive chunks of the same document into blocks, ranked by their best member"""
+    blocks: List[Dict[str, Any]] = []
+    by_key: Dict[str, List[Tuple[int, int, str, Dict[str, Any]]]] = {}
+    for rank, doc in enumerate(docs):
+        key, offset = _parse_chunk_id(getattr(doc, "id", None))
+        metadata = getattr(doc, "metadata", None) or {}
+        if key is None:
+            blocks.append({"text": doc.page_content, "rank": rank, "chunks": 1, "metadata": metadata})
+        else:
+            by_key.setdefault(key, []).append((offset, rank, doc.page_content, metadata))
+
+    for members in by_key.values():
+        members.sort(key=lambda member: member[:2])
+        current = None
+        for offset, rank, text, metadata in members:
+            if current is not None and offset == current["last_offset"] + 1:
+                current["text"] = _join_overlapping(current["text"], text)
+                current["rank"] = min(current["rank"], rank)
+                current["chunks"] += 1
+                current["last_offset"] = offset
+            elif current is not None and offset == current["last_offset"]:
+                continue
+            else:
+                # A merged block cites the page its first chunk starts on
+                current = {"text": text, "rank": rank, "chunks": 1, "last_offset": offset, "metadata": metadata}
+                blocks.append(current)
+    for block in blocks:
+        block.pop("last_offset", None)
+    return sorted(blocks, key=lambda block: block["rank"])
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def drop_near_duplicates(blocks: List[Dict[str, Any]], threshold: float = None) -> List[Dict[str, Any]]:
+    """Keep the best-ranked of any blocks whose shingle Jaccard similarity or containment reaches ``threshold``"""
+    threshold = CONTEXT_DEDUP_THRESHOLD if threshold is None else threshold
+    kept: List[Tuple[Dict[str, Any], set]] = []
+    for block in blocks:
+        shingles = _shingles(block["text"])
+        duplicate = False
+        for _, other in kept:
+            overlap = len(shingles & other)
+            if not shingles or overlap / len(shingles | other) >= threshold or overlap / len(shingles) >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append((block, shingles))
+    return [block for block, _ in kept]
+
+# -------------------------
+# PACKING
+# -------------------------
+def _source_label(metadata: Dict[str, Any]) -> str:
+    """``[Source: report.pdf, page 3]`` header so answers can cite where a passage came from"""
+    if not metadata.get("source"):
+        return ""
+    label = os.path.basename(metadata["source"])
+    if metadata.get("page"):
+        label += f", page {metadata['page']}"
+    return f"[Source: {label}]\n"
+
+def pack_context(docs: List[Any], token_budget: int = None) -> Dict[str, Any]:
+    """Merge, deduplicate and fit retrieved documents into ``token_budget`` tokens.
+
+    Returns the packed ``text`` plus ``tokens``, ``blocks``, ``chunks_in``,
+    ``duplicates_dropped`` and ``truncated`` for logging.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    merged = merge_adjacent(docs)
+    blocks = drop_near_duplicates(merged)
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+
+    parts, used, truncated = [], 0, False
+    for block in blocks:
+        text = _source_label(block["metadata"]) + block["text"]
+        cost = count_tokens(text) + (separator_tokens if parts else 0)
+        if used + cost <= token_budget:
+            parts.append(text)
+            used += cost
+            continue
+        # Blocks are in rank order: cut the first one that doesn't fit, then stop
+        remaining = token_budget - used - (separator_tokens if parts else 0)
+        if remaining >= CONTEXT_MIN_TRUNCATED_TOKENS or (not parts and remaining > 0):
+            text = truncate_to_tokens(text, remaining)
+            used += count_tokens(text) + (separator_tokens if parts else 0)
+            parts.append(text)
+            truncated = True
+        break
+
+    stats = {
+        "text": CONTEXT_SEPARATOR.join(parts),
+        "tokens": used,
+        "blocks": len(parts),
+        "chunks_in": len(docs),
+        "duplicates_dropped": len(merged) - len(blocks),
+        "truncated": truncated,
+    }
+    print(f"📦 Packed {len(docs)} chunk(s) into {len(parts)} block(s), {used}/{token_budget} tokens "
+          f"({stats['duplicates_dropped']} near-duplicate(s) dropped{', last block truncated' if truncated else ''})")
+    return stats
@@ -0,0 +1,152 @@
+"""
+Adaptive Embedding Batching
+Functionalities Included:
+- Token-aware packing of texts into requests under the server's per-request token limit
+- Batch size that grows while requests are fast and shrinks on slow or failed ones
+- Retries with exponential backoff and jitter for transient errors (timeouts, 429, 5xx)
+- Bisection of rejected batches so one bad chunk can't take its neighbours down with it
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from app.context_packing import count_tokens
+
+# -------------------------
+# BATCHING CONFIG
+# -------------------------
+# Token limit per request (e.g. TEI's --max-batch-tokens). Counts use the
+# CONTEXT_TOKENIZER, so leave some headroom for the embedding model's tokenizer.
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "8192"))
+EMBEDDING_MIN_BATCH_SIZE = int(os.getenv("EMBEDDING_MIN_BATCH_SIZE", "1"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "128"))
+EMBEDDING_INITIAL_BATCH_SIZE = int(os.getenv("EMBEDDING_INITIAL_BATCH_SIZE", "16"))
+# Requests slower than this shrink the batch; faster ones grow it
+EMBEDDING_TARGET_LATENCY = float(os.getenv("EMBEDDING_TARGET_LATENCY", "2.0"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "4"))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", "0.5"))
+
+class EmbeddingRequestError(Exception):
+    """An embedding request failed; ``retryable`` says whether the same request may succeed later"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = True):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+# -------------------------
+# BATCH SIZE CONTROLLER
+# -------------------------
+class AdaptiveBatchSizer:
+    """Additive-increase / multiplicative-decrease batch size, shared by concurrent requests"""
+
+    def __init__(self, initial: int = None, minimum: int = None, maximum: int = None,
+                 target_latency: float = None):
+        self.minimum = max(1, minimum or EMBEDDING_MIN_BATCH_SIZE)
+        self.maximum = max(self.minimum, maximum or EMBEDDING_MAX_BATCH_SIZE)
+        self.target_latency = target_latency or EMBEDDING_TARGET_LATENCY
+        self._size = float(min(self.maximum, max(self.minimum, initial or EMBEDDING_INITIAL_BATCH_SIZE)))
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "retries": 0, "failures": 0, "bisections": 0, "unembedded": 0,
+                       "seconds": 0.0}
+
+    @property
+    def size(self) -> int:
+        return int(self._size)
+
+    def record_success(self, batch_size: int, seconds: float) -> None:
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["texts"] += batch_size
+            self._stats["seconds"] += seconds
+            if seconds > self.target_latency:
+                self._size = max(self.minimum, self._size * 0.75)
+            elif batch_size >= self.size:
+                # Only full batches prove the server keeps up at this size
+                self._size = min(self.maximum, self._size + max(1.0, self._size * 0.1))
+
+    def record_failure(self, overloaded: bool = True) -> None:
+        """Count a failed request; only signs of overload (timeouts, 408/429, 5xx) halve the batch size"""
+        with self._lock:
+            self._stats["failures"] += 1
+            if overloaded:
+                self._size = max(self.minimum, self._size / 2)
+
+    def count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += amount
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["batch_size"] = self.size
+        stats["texts_per_second"] = stats["texts"] / stats["seconds"] if stats["seconds"] else 0.0
+        return stats
+
+# -------------------------
+# PACKING
+# -------------------------
+def next_batch_length(texts: Sequence[str], limit: int, max_tokens: int = None,
+                      token_counts: Optional[Sequence[int]] = None) -> int:
+    """How many leading ``texts`` fit in one request: at most ``limit`` texts and ``max_tokens`` tokens.
+
+    A text over the token limit on its own still goes out alone; the server
+    either truncates it or rejects it and it is reported as failed.
+    """
+    max_tokens = max_tokens or EMBEDDING_MAX_BATCH_TOKENS
+    length, tokens = 0, 0
+    for index in range(min(limit, len(texts))):
+        text_tokens = token_counts[index] if token_counts is not None else count_tokens(texts[index])
+        if length and tokens + text_tokens > max_tokens:
+            break
+        length += 1
+        tokens += text_tokens
+    return max(1, length) if texts else 0
+
+# -------------------------
+# RETRY / BISECT
+# -------------------------
+def embed_with_retry(texts: List[str], embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+                     sizer: AdaptiveBatchSizer) -> List[Optional[Sequence[float]]]:
+    """Embed ``texts`` in one request, retrying and bisecting until every text is accounted for.
+
+    Transient errors are retried with exponential backoff; a request the server
+    rejects (4xx, wrong number of vectors) is split in half and each half is
+    embedded on its own. The result always lines up with ``texts``: a text that
+    fails alone, or every text once transient retries run out, is None.
+    """
+    if not texts:
+        return []
+    error = None
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            vectors = embed_fn(texts)
+            if len(vectors) != len(texts):
+                raise EmbeddingRequestError(f"Got {len(vectors)} embeddings for {len(texts)} texts", retryable=False)
+            sizer.record_success(len(texts), time.perf_counter() - start)
+            # A list of rows (views into a matrix response) so halves concatenate with +
+            return list(vectors)
+        except EmbeddingRequestError as e:
+            error = e
+            # A rejected text says nothing about load; bisection isolates it without shrinking later batches
+            sizer.record_failure(overloaded=e.retryable)
+            if not e.retryable or attempt == EMBEDDING_MAX_RETRIES:
+                break
+            sizer.count("retries")
+            delay = EMBEDDING_RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"🔁 Embedding request failed ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    if error.retryable or len(texts) == 1:
+        # Splitting won't help a server that stays down, or a text it can't embed
+        print(f"❌ Failed to embed {len(texts)} text(s): {error}")
+        sizer.count("unembedded", len(texts))
+        return [None] * len(texts)
+    sizer.count("bisections")
+    middle = len(texts) // 2
+    print(f"✂️  Embedding server rejected a batch of {len(texts)} ({error}), splitting it in two")
+    return embed_with_retry(texts[:middle], embed_fn, sizer) + embed_with_retry(texts[middle:], embed_fn, sizer)
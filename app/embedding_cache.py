@@ -0,0 +1,219 @@
+"""
+Persistent Embedding Cache
+Functionalities Included:
+- Content-addressed keys (embedding model + SHA-256 of the text)
+- SQLite storage of float32 vectors, optionally quantized to float16 or int8
+- LRU eviction bounded by entry count, run in batches off a tracked count instead of a COUNT(*) per write
+- Access times refreshed at most once per interval
+- Hit / miss counters; database errors degrade to misses instead of failing the embedding path
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.embedding_codec import CODECS, encode, from_bytes
+
+# -------------------------
+# CACHE CONFIG
+# -------------------------
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# Eviction trims the cache this fraction below the maximum, so the next one is that many writes away
+EMBEDDING_CACHE_EVICTION_SLACK = float(os.getenv("EMBEDDING_CACHE_EVICTION_SLACK", "0.1"))
+# float32 (lossless), float16 or int8; entries already stored keep their own encoding
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32").lower()
+if EMBEDDING_CACHE_DTYPE not in CODECS:
+    raise ValueError(f"EMBEDDING_CACHE_DTYPE must be one of: {', '.join(CODECS)}")
+# A hit only rewrites last_access when the stored one is older than this, so reads rarely write
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "3600"))
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+# Row count as of this process's last count plus every row it has written since (replaced keys
+# included); recounted only once it passes the maximum. Other processes' writes show up at that recount.
+_entries: Optional[int] = None
+
+# -------------------------
+# CONNECTION
+# -------------------------
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(EMBEDDING_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " encoding TEXT NOT NULL DEFAULT 'float32')"
+        )
+        # Caches written before quantization hold float32 blobs only
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(embeddings)")]
+        if "encoding" not in columns:
+            conn.execute("ALTER TABLE embeddings ADD COLUMN encoding TEXT NOT NULL DEFAULT 'float32'")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+# -------------------------
+# KEYS / ENCODING
+# -------------------------
+def cache_key(model: str, text: str) -> str:
+    """Content address of an embedding: model name + SHA-256 of the text"""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+def _encode(embeddings: Sequence[Sequence[float]]) -> List[bytes]:
+    return [row.tobytes() for row in encode(embeddings, EMBEDDING_CACHE_DTYPE)]
+
+def _decode(blob: bytes, encoding: str) -> np.ndarray:
+    return from_bytes(blob, encoding)
+
+# -------------------------
+# LOOKUP / STORE
+# -------------------------
+def _read(keys: List[str]) -> Tuple[Dict[str, tuple], List[str]]:
+    """Stored ``(blob, encoding)`` for each key found, plus the keys due an access-time refresh. Caller holds _lock"""
+    conn = _get_connection()
+    found: Dict[str, tuple] = {}
+    stale = []
+    now = time.time()
+    # Stay well below SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT key, vector, encoding, last_access FROM embeddings WHERE key IN ({placeholders})", chunk
+        ).fetchall()
+        for key, blob, encoding, last_access in rows:
+            found[key] = (blob, encoding)
+            if last_access < now - EMBEDDING_CACHE_TOUCH_INTERVAL:
+                stale.append(key)
+    return found, stale
+
+def _touch(keys: List[str]) -> None:
+    """Refresh access times of hits; best effort, since it only steers eviction. Caller holds _lock"""
+    try:
+        conn = _get_connection()
+        now = time.time()
+        conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in keys])
+        conn.commit()
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️ Embedding cache access-time update skipped: {e}")
+        _stats["errors"] += 1
+
+def get_cached(model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+    """Return cached float32 embeddings aligned with ``texts`` (None where missing or unreadable)"""
+    if not EMBEDDING_CACHE_ENABLED or not texts:
+        return [None] * len(texts)
+
+    keys = [cache_key(model, text) for text in texts]
+    with _lock:
+        try:
+            found, stale = _read(list(dict.fromkeys(keys)))
+        except (sqlite3.Error, OSError) as e:
+            # A locked, read-only or full database costs a re-embed, never the request
+            print(f"⚠️ Embedding cache read failed, treating as misses: {e}")
+            _stats["errors"] += 1
+            found, stale = {}, []
+        if stale:
+            _touch(stale)
+
+        results = [_decode(*found[key]) if key in found else None for key in keys]
+        hits = sum(1 for vector in results if vector is not None)
+        _stats["hits"] += hits
+        _stats["misses"] += len(results) - hits
+    return results
+
+def put_cached(model: str, texts: List[str], embeddings: Sequence[Sequence[float]]) -> None:
+    """Store embeddings (lists, float32 rows or a matrix) for ``texts`` in EMBEDDING_CACHE_DTYPE
+    and evict the least recently used rows once the cache outgrows EMBEDDING_CACHE_MAX_ENTRIES"""
+    if not EMBEDDING_CACHE_ENABLED or not texts:
+        return
+
+    global _entries
+    now = time.time()
+    rows = [(cache_key(model, text), blob, now, EMBEDDING_CACHE_DTYPE)
+            for text, blob in zip(texts, _encode(embeddings))]
+    with _lock:
+        try:
+            conn = _get_connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access, encoding) VALUES (?, ?, ?, ?)", rows
+            )
+            evicted = _evict_overflow(conn, len(rows))
+            conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ Embedding cache write failed, skipping it: {e}")
+            _stats["errors"] += 1
+            _entries = None
+            if _conn is not None:
+                _conn.rollback()
+            return
+        _stats["writes"] += len(rows)
+        _stats["evictions"] += evicted
+
+def _evict_overflow(conn: sqlite3.Connection, written: int) -> int:
+    """Account for ``written`` new rows and, once the cache may be over its bound, evict the least
+    recently used rows down to EMBEDDING_CACHE_EVICTION_SLACK below it. Returns rows evicted. Caller holds _lock"""
+    global _entries
+    if _entries is None:
+        _entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    else:
+        _entries += written
+    if _entries <= EMBEDDING_CACHE_MAX_ENTRIES:
+        return 0
+    total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    overflow = 0
+    if total > EMBEDDING_CACHE_MAX_ENTRIES:
+        target = int(EMBEDDING_CACHE_MAX_ENTRIES * (1 - EMBEDDING_CACHE_EVICTION_SLACK))
+        overflow = total - target
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (overflow,)
+        )
+        total = target
+    _entries = total
+    return overflow
+
+# -------------------------
+# STATS / MAINTENANCE
+# -------------------------
+def get_cache_stats() -> Dict[str, float]:
+    """Hit/miss counters for this process plus the current cache size"""
+    global _entries
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = 0
+        if EMBEDDING_CACHE_ENABLED:
+            try:
+                stats["entries"] = _entries = _get_connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except (sqlite3.Error, OSError) as e:
+                print(f"⚠️ Embedding cache size unavailable: {e}")
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+def clear_cache() -> None:
+    """Drop every cached embedding"""
+    global _entries
+    with _lock:
+        conn = _get_connection()
+        conn.execute("DELETE FROM embeddings")
+        conn.commit()
+        _entries = 0
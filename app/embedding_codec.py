@@ -0,0 +1,96 @@
+"""
+Compact Embedding Representation
+Functionalities Included:
+- Contiguous float32 matrices in place of nested lists of Python floats
+- Decoding of base64 (``encoding_format="base64"``) embedding responses
+- float16 and int8 scalar quantization for locally stored vectors
+- Blocked inner products over encoded (e.g. memory-mapped) matrices
+
+Codecs, bytes per vector of dimension d:
+- float32: 4·d, lossless
+- float16: 2·d, ~3 significant digits per component
+- int8:    d + 4, symmetric per-vector scale (max |x| / 127) stored next to the codes
+"""
+
+import base64
+from typing import Sequence
+
+import numpy as np
+
+CODECS = ("float32", "float16", "int8")
+# Rows dequantized at a time when scoring an int8/float16 matrix
+SCORE_BLOCK_ROWS = 65536
+
+# -------------------------
+# FLOAT32 MATRICES
+# -------------------------
+def as_matrix(vectors) -> np.ndarray:
+    """Vectors (nested lists, a list of rows or a matrix) as one C-contiguous float32 ``(n, dim)`` matrix"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+    return np.ascontiguousarray(matrix)
+
+def decode_base64(data: str) -> np.ndarray:
+    """An OpenAI-style base64 embedding (little-endian float32) as a float32 vector"""
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+# -------------------------
+# CODECS
+# -------------------------
+def storage_dtype(codec: str, dim: int) -> np.dtype:
+    """The NumPy dtype of one encoded vector; arrays of it have shape ``(n, dim)`` or, for int8, ``(n,)`` records"""
+    if codec == "float32":
+        return np.dtype(("<f4", (dim,)))
+    if codec == "float16":
+        return np.dtype(("<f2", (dim,)))
+    if codec == "int8":
+        return np.dtype([("scale", "<f4"), ("codes", "i1", (dim,))])
+    raise ValueError(f"Unknown embedding codec '{codec}' (expected one of: {', '.join(CODECS)})")
+
+def encode(vectors, codec: str) -> np.ndarray:
+    """Encode vectors with ``codec``; ``.tobytes()`` of the result (or of one row) is its storage format"""
+    matrix = as_matrix(vectors)
+    dtype = storage_dtype(codec, matrix.shape[1])
+    if codec != "int8":
+        return matrix.astype(dtype.base, copy=False)
+    encoded = np.empty(len(matrix), dtype=dtype)
+    scales = np.abs(matrix).max(axis=1) / 127 if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+    scales[scales == 0] = 1.0
+    encoded["scale"] = scales
+    encoded["codes"] = np.rint(matrix / scales[:, None])
+    return encoded
+
+def decode(encoded: np.ndarray, codec: str) -> np.ndarray:
+    """Encoded vectors back to a float32 ``(n, dim)`` matrix"""
+    if codec == "int8":
+        return encoded["codes"].astype(np.float32) * encoded["scale"][:, None]
+    storage_dtype(codec, 0)
+    return np.asarray(encoded, dtype=np.float32)
+
+def to_bytes(vector: Sequence[float], codec: str) -> bytes:
+    return encode(vector, codec).tobytes()
+
+def from_bytes(blob: bytes, codec: str) -> np.ndarray:
+    """One vector stored with ``to_bytes`` as a float32 vector"""
+    if codec == "int8":
+        return decode(np.frombuffer(blob, dtype=storage_dtype(codec, len(blob) - 4)), codec)[0]
+    return decode(np.frombuffer(blob, dtype=storage_dtype(codec, 1).base), codec)
+
+def inner_products(encoded: np.ndarray, query: np.ndarray, codec: str) -> np.ndarray:
+    """``encoded @ query`` for a float32 query.
+
+    float32 matrices (including memory maps) are multiplied in one pass;
+    quantized ones are dequantized SCORE_BLOCK_ROWS at a time, so scoring
+    never holds a float32 copy of the whole matrix.
+    """
+    if codec == "float32":
+        return np.asarray(encoded @ query, dtype=np.float32)
+    scores = np.empty(len(encoded), dtype=np.float32)
+    for start in range(0, len(encoded), SCORE_BLOCK_ROWS):
+        block = encoded[start:start + SCORE_BLOCK_ROWS]
+        if codec == "int8":
+            scores[start:start + len(block)] = (block["codes"] @ query) * block["scale"]
+        else:
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+    return scores
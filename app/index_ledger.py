@@ -0,0 +1,178 @@
+"""
+Index Ledger
+Functionalities Included:
+- Per-object record of what is in the vector store: S3 key -> ETag -> chunk IDs -> embedding model, chunking
+  and the document-level metadata (e.g. patient ID) its chunks carry
+- Import planning: which objects are new, modified or unchanged
+- Lookup of indexed keys so chunks of removed objects can be deleted
+- A per-collection version counter, bumped on every write, for cache invalidation
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# -------------------------
+# LEDGER CONFIG
+# -------------------------
+INDEX_LEDGER_PATH = os.getenv("INDEX_LEDGER_PATH", os.path.join(".cache", "index_ledger.sqlite3"))
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+# -------------------------
+# CONNECTION
+# -------------------------
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(INDEX_LEDGER_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(INDEX_LEDGER_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ledger ("
+            " collection TEXT NOT NULL,"
+            " s3_key TEXT NOT NULL,"
+            " etag TEXT,"
+            " embedding_model TEXT NOT NULL,"
+            " chunk_ids TEXT NOT NULL,"
+            " indexed_at REAL NOT NULL,"
+            " chunking TEXT,"
+            " metadata TEXT,"
+            " PRIMARY KEY (collection, s3_key))"
+        )
+        # Entries from before these were recorded count as indexed with an unknown chunking / metadata
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(ledger)")]
+        for column in ("chunking", "metadata"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE ledger ADD COLUMN {column} TEXT")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions ("
+            " collection TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL)"
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+# -------------------------
+# READ / WRITE
+# -------------------------
+def get_entries(collection: str, s3_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Ledger entries for ``s3_keys`` that have been indexed, keyed by S3 key"""
+    entries = {}
+    with _lock:
+        conn = _get_connection()
+        for start in range(0, len(s3_keys), 500):
+            chunk = s3_keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for key, etag, model, chunk_ids, indexed_at, chunking, metadata in conn.execute(
+                "SELECT s3_key, etag, embedding_model, chunk_ids, indexed_at, chunking, metadata FROM ledger "
+                f"WHERE collection = ? AND s3_key IN ({placeholders})", [collection] + chunk
+            ):
+                entries[key] = {
+                    "etag": etag,
+                    "embedding_model": model,
+                    "chunk_ids": json.loads(chunk_ids),
+                    "indexed_at": indexed_at,
+                    "chunking": chunking,
+                    "metadata": json.loads(metadata) if metadata else None
+                }
+    return entries
+
+def record_indexed(collection: str, s3_key: str, etag: Optional[str], embedding_model: str,
+                   chunk_ids: List[str], chunking: str, metadata: Optional[Dict[str, Any]]) -> None:
+    """Remember that ``s3_key`` at ``etag`` is fully indexed as ``chunk_ids``, split with ``chunking``.
+
+    ``metadata`` is the document-level metadata every chunk was stored with
+    (None if unknown, which makes the next import re-index the object).
+    """
+    with _lock:
+        conn = _get_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO ledger "
+            "(collection, s3_key, etag, embedding_model, chunk_ids, indexed_at, chunking, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (collection, s3_key, etag, embedding_model, json.dumps(chunk_ids), time.time(), chunking,
+             json.dumps(metadata) if metadata is not None else None)
+        )
+        conn.commit()
+
+def remove_entries(collection: str, s3_keys: List[str]) -> None:
+    with _lock:
+        conn = _get_connection()
+        conn.executemany(
+            "DELETE FROM ledger WHERE collection = ? AND s3_key = ?",
+            [(collection, key) for key in s3_keys]
+        )
+        conn.commit()
+
+def clear_ledger(collection: str) -> None:
+    """Forget everything indexed into ``collection`` (e.g. after it is dropped)"""
+    with _lock:
+        conn = _get_connection()
+        conn.execute("DELETE FROM ledger WHERE collection = ?", (collection,))
+        conn.commit()
+
+def indexed_keys(collection: str, prefix: str = "") -> List[str]:
+    """Every S3 key under ``prefix`` that the ledger says is indexed"""
+    with _lock:
+        rows = _get_connection().execute(
+            "SELECT s3_key FROM ledger WHERE collection = ? AND substr(s3_key, 1, ?) = ?",
+            (collection, len(prefix), prefix)
+        ).fetchall()
+    return [key for (key,) in rows]
+
+# -------------------------
+# COLLECTION VERSION
+# -------------------------
+def collection_version(collection: str) -> int:
+    """Current write version of ``collection`` (0 if it was never written)"""
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT version FROM versions WHERE collection = ?", (collection,)
+        ).fetchone()
+    return row[0] if row else 0
+
+def bump_collection_version(collection: str) -> int:
+    """Record that ``collection`` changed; caches built on older versions are stale"""
+    with _lock:
+        conn = _get_connection()
+        conn.execute(
+            "INSERT INTO versions (collection, version) VALUES (?, 1) "
+            "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+            (collection,)
+        )
+        conn.commit()
+        return conn.execute("SELECT version FROM versions WHERE collection = ?", (collection,)).fetchone()[0]
+
+# -------------------------
+# PLANNING
+# -------------------------
+def plan_import(collection: str, documents: List[Dict[str, Any]], embedding_model: str,
+                chunking: str) -> Dict[str, List]:
+    """Split S3 documents into ``new``, ``modified`` and ``unchanged`` against the ledger.
+
+    An object is unchanged only if its ETag, the embedding model, the
+    chunking config and its document-level ``metadata`` all match what was
+    indexed; switching models or chunk settings re-indexes everything. A
+    metadata change (e.g. a new patient ID) re-chunks the object, which
+    updates the metadata of its stored chunks without re-embedding them.
+    """
+    entries = get_entries(collection, [doc["key"] for doc in documents])
+    plan = {"new": [], "modified": [], "unchanged": []}
+    for doc in documents:
+        entry = entries.get(doc["key"])
+        if entry is None:
+            plan["new"].append(doc)
+        elif (doc.get("etag") and entry["etag"] == doc["etag"] and entry["embedding_model"] == embedding_model
+              and entry["chunking"] == chunking and entry["metadata"] == doc.get("metadata", {})):
+            plan["unchanged"].append(doc)
+        else:
+            plan["modified"].append(doc)
+    return plan
@@ -0,0 +1,345 @@
+"""
+Async Ingestion Pipeline
+Functionalities Included:
+- Concurrent stages: extract -> S3 upload -> chunk -> embed -> vector write
+- Bounded queues between stages for backpressure
+- Per-stage throughput and queue-depth metrics
+- A synchronous progress-event iterator for the Streamlit handler
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Tuple
+
+from app.pdf_utils import PDF_TIMEOUT, PDF_WORKERS, discard_extraction_pool, \
+    extract_pages_from_source, get_extraction_pool, is_retired_pool
+from app.s3_utils import upload_to_s3
+from app.chunk_utils import CHUNKING_CONFIG, document_metadata, get_document_chunks_with_metadata
+from app.embedding_codec import as_matrix
+from app.vectorstore_utils import CHROMA_COLLECTION, EMBEDDING_MAX_IN_FLIGHT, embed_texts, \
+    ensure_collection_exists, finish_document, next_embedding_batch, prepare_chunks, reset_chroma_connection, \
+    stale_chunk_ids, store_chunks
+
+# -------------------------
+# PIPELINE CONFIG
+# -------------------------
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+INGEST_UPLOAD_CONCURRENCY = int(os.getenv("INGEST_UPLOAD_CONCURRENCY", "4"))
+# Caps the adaptive embedding batch size; 0 leaves it to the batcher
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "0"))
+
+_DONE = object()
+
+# -------------------------
+# METRICS
+# -------------------------
+class StageMetrics:
+    """Counters for one pipeline stage"""
+
+    def __init__(self, name: str, in_queue: "asyncio.Queue" = None):
+        self.name = name
+        self.in_queue = in_queue
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.started_at = time.perf_counter()
+
+    def sample_queue(self) -> None:
+        if self.in_queue is not None:
+            self.max_queue_depth = max(self.max_queue_depth, self.in_queue.qsize())
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items / self.busy_seconds, 2) if self.busy_seconds else 0.0,
+            "utilization": round(self.busy_seconds / elapsed, 2) if elapsed else 0.0,
+            "queue_depth": self.in_queue.qsize() if self.in_queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+# -------------------------
+# PIPELINE
+# -------------------------
+class IngestionPipeline:
+    """Streams uploaded files through extraction, upload, chunking, embedding and storage"""
+
+    def __init__(self, files: List[Tuple[str, bytes]], emit, batch_size: int = None,
+                 cancel: threading.Event = None, metadata: Dict[str, Any] = None):
+        self.files = files
+        self.emit = emit
+        # Extra metadata (e.g. patient_id) stored on every chunk of these files
+        self.metadata = metadata or {}
+        # Once set, stages drain their queues without doing any more work
+        self.cancel = cancel or threading.Event()
+        self.batch_size = batch_size or INGEST_BATCH_SIZE or None
+        size = max(1, INGEST_QUEUE_SIZE)
+        self.queues = {name: asyncio.Queue(maxsize=size) for name in ("extract", "upload", "chunk", "embed", "write")}
+        self.metrics = {name: StageMetrics(name, q) for name, q in self.queues.items()}
+        self.summary = {"uploaded": [], "failed": [], "stored": 0, "skipped": 0, "failed_chunks": 0}
+        # S3 key -> {"etag", "ids", "remaining", "failed", "stale", "metadata"} for the index ledger
+        self.documents: Dict[str, Dict[str, Any]] = {}
+
+    def metrics_snapshot(self) -> List[Dict[str, Any]]:
+        return [metric.snapshot() for metric in self.metrics.values()]
+
+    async def _timed(self, stage: str, func, *args):
+        metric = self.metrics[stage]
+        metric.sample_queue()
+        start = time.perf_counter()
+        try:
+            return await func(*args)
+        finally:
+            metric.busy_seconds += time.perf_counter() - start
+            metric.items += 1
+
+    async def _workers(self, stage: str, concurrency: int, handle, next_stage: str = None) -> None:
+        """Run ``concurrency`` workers over a stage queue and close the next queue when done"""
+        in_queue = self.queues[stage]
+
+        async def worker():
+            while True:
+                item = await in_queue.get()
+                if item is _DONE:
+                    # Let sibling workers see the end marker too
+                    await in_queue.put(_DONE)
+                    return
+                if not self.cancel.is_set():
+                    await self._timed(stage, handle, item)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        if next_stage:
+            await self.queues[next_stage].put(_DONE)
+
+    # ---- stages ----
+    async def _feed(self) -> None:
+        for filename, file_bytes in self.files:
+            if self.cancel.is_set():
+                break
+            await self.queues["extract"].put((filename, file_bytes))
+        await self.queues["extract"].put(_DONE)
+
+    async def _extract(self, item) -> None:
+        filename, file_bytes = item
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = get_extraction_pool()
+            try:
+                pages = await asyncio.wait_for(
+                    loop.run_in_executor(pool, extract_pages_from_source, file_bytes),
+                    timeout=PDF_TIMEOUT
+                )
+                break
+            except asyncio.TimeoutError:
+                discard_extraction_pool()
+                self._fail(filename, f"Text extraction exceeded {PDF_TIMEOUT:.0f}s", "extract")
+                return
+            except (BrokenProcessPool, asyncio.CancelledError) as e:
+                # Another file's timeout discarded the pool under this one; try once more on a fresh pool.
+                # Any other cancellation is the pipeline being torn down and must propagate.
+                if isinstance(e, asyncio.CancelledError) and not is_retired_pool(pool):
+                    raise
+                if attempt:
+                    self._fail(filename, f"Text extraction was interrupted: {type(e).__name__}", "extract")
+                    return
+            except Exception as e:
+                self._fail(filename, str(e), "extract")
+                return
+        self.emit({"type": "extracted", "filename": filename, "characters": sum(len(text) for _, text in pages)})
+        await self.queues["upload"].put((filename, file_bytes, pages))
+
+    async def _upload(self, item) -> None:
+        filename, file_bytes, pages = item
+        try:
+            result = await asyncio.to_thread(upload_to_s3, file_bytes, filename)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        if result["success"]:
+            self.documents[result["s3_key"]] = {"etag": result.get("etag"), "ids": [], "remaining": 0, "failed": False,
+                                                "stale": []}
+            self.summary["uploaded"].append({"filename": filename, "s3_key": result["s3_key"]})
+            self.emit({"type": "uploaded", "filename": filename, "s3_key": result["s3_key"]})
+        else:
+            self._fail(filename, result["error"], "upload")
+        # Text is indexed even if the S3 upload failed, as before; uploaded_at is the
+        # object's LastModified, as an S3 import of the same object records it
+        last_modified = result.get("last_modified")
+        uploaded_at = last_modified.timestamp() if last_modified else time.time()
+        document = {"key": result.get("s3_key", f"documents/{filename}"), "pages": pages,
+                    "uploaded_at": uploaded_at, **self.metadata}
+        await self.queues["chunk"].put(document)
+
+    async def _chunk(self) -> None:
+        """Split documents, drop already indexed chunks and regroup the rest into embedding batches"""
+        in_queue = self.queues["chunk"]
+        metric = self.metrics["chunk"]
+        collection = await asyncio.to_thread(ensure_collection_exists)
+        pending: List[Tuple[str, str, Dict[str, Any]]] = []
+        while True:
+            item = await in_queue.get()
+            if item is _DONE:
+                break
+            if self.cancel.is_set():
+                continue
+            metric.sample_queue()
+            start = time.perf_counter()
+            key = item["key"]
+            try:
+                if not collection:
+                    raise RuntimeError("Vector store is unavailable")
+                chunks, chunk_keys, metadatas = await asyncio.to_thread(get_document_chunks_with_metadata, [item])
+                # Already stored chunks keep their vectors but take this upload's metadata (e.g. patient ID)
+                prepared = await asyncio.to_thread(prepare_chunks, collection, chunks, chunk_keys, metadatas)
+            except Exception as e:
+                # One document's chunking or lookup error fails that document, not the whole pipeline
+                if key in self.documents:
+                    self.documents[key]["failed"] = True
+                self._fail(os.path.basename(key), str(e), "chunk")
+                continue
+            existing = prepared["existing"]
+            self.summary["skipped"] += len(existing)
+            pending.extend(prepared["pending"])
+            await self._track_document(key, prepared["ids"], len(prepared["pending"]), document_metadata(item))
+            metric.busy_seconds += time.perf_counter() - start
+            metric.items += 1
+            self.emit({"type": "chunked", "s3_key": key, "chunks": len(chunks), "skipped": len(existing)})
+
+            # Send a batch once the next chunk would no longer fit in it
+            while pending:
+                length = next_embedding_batch([text for _, text, _ in pending], self.batch_size)
+                if length == len(pending):
+                    break
+                await self.queues["embed"].put(pending[:length])
+                pending = pending[length:]
+        while pending and not self.cancel.is_set():
+            length = next_embedding_batch([text for _, text, _ in pending], self.batch_size)
+            await self.queues["embed"].put(pending[:length])
+            pending = pending[length:]
+        await self.queues["embed"].put(_DONE)
+
+    async def _embed(self, batch) -> None:
+        embeddings = await asyncio.to_thread(embed_texts, [text for _, text, _ in batch])
+        # Retries and bisection already ran; whatever is still None can't be embedded
+        failed = [item for item, vector in zip(batch, embeddings) if vector is None]
+        if failed:
+            self.summary["failed_chunks"] += len(failed)
+            await self._settle(failed, False)
+            self.emit({"type": "batch_failed", "chunks": len(failed)})
+        embedded = [(item, vector) for item, vector in zip(batch, embeddings) if vector is not None]
+        if embedded:
+            await self.queues["write"].put(([item for item, _ in embedded], as_matrix([vector for _, vector in embedded])))
+
+    async def _write(self, item) -> None:
+        batch, embeddings = item
+        collection = await asyncio.to_thread(ensure_collection_exists)
+        if not collection:
+            self.summary["failed_chunks"] += len(batch)
+            await self._settle(batch, False)
+            self.emit({"type": "batch_failed", "chunks": len(batch)})
+            return
+        try:
+            await asyncio.to_thread(store_chunks, collection, [chunk_id for chunk_id, _, _ in batch],
+                                    [text for _, text, _ in batch], [metadata for _, _, metadata in batch], embeddings)
+        except Exception as e:
+            print(f"❌ Failed to store batch: {e}")
+            reset_chroma_connection()
+            self.summary["failed_chunks"] += len(batch)
+            await self._settle(batch, False)
+            self.emit({"type": "batch_failed", "chunks": len(batch), "error": str(e)})
+            return
+        self.summary["stored"] += len(batch)
+        await self._settle(batch, True)
+        self.emit({"type": "stored", "chunks": len(batch), "total_stored": self.summary["stored"],
+                   "metrics": self.metrics_snapshot()})
+
+    # ---- index ledger ----
+    async def _track_document(self, key: str, ids: List[str], new_chunks: int, metadata: Dict[str, Any]) -> None:
+        """Start tracking an uploaded document and note the chunks only its previous version had"""
+        document = self.documents.get(key)
+        if document is None:
+            # The upload failed, so there is no ETag to record
+            return
+        document["ids"] = ids
+        document["remaining"] = new_chunks
+        document["metadata"] = metadata
+        document["stale"] = (await asyncio.to_thread(stale_chunk_ids, {key: ids}))[key]
+        await self._record_if_complete(key)
+
+    async def _settle(self, batch, stored: bool) -> None:
+        """Count a batch against its documents and record the ones now fully indexed"""
+        for chunk_id, _, _ in batch:
+            key = chunk_id.rsplit("::", 2)[0]
+            document = self.documents.get(key)
+            if document is None:
+                continue
+            document["remaining"] -= 1
+            document["failed"] = document["failed"] or not stored
+            await self._record_if_complete(key)
+
+    async def _record_if_complete(self, key: str) -> None:
+        document = self.documents[key]
+        if document["remaining"] == 0 and not document["failed"] and document["ids"]:
+            # The old version stays searchable until every chunk of the new one is stored
+            await asyncio.to_thread(finish_document, key, document["etag"], document["ids"], document["stale"],
+                                    CHUNKING_CONFIG, document["metadata"])
+            document["stale"] = []
+
+    def _fail(self, filename: str, error: str, stage: str) -> None:
+        self.summary["failed"].append({"filename": filename, "error": error, "stage": stage})
+        self.emit({"type": "failed", "filename": filename, "error": error, "stage": stage})
+
+    async def run(self) -> Dict[str, Any]:
+        await asyncio.gather(
+            self._feed(),
+            self._workers("extract", PDF_WORKERS, self._extract, "upload"),
+            self._workers("upload", INGEST_UPLOAD_CONCURRENCY, self._upload, "chunk"),
+            self._chunk(),
+            self._workers("embed", EMBEDDING_MAX_IN_FLIGHT, self._embed, "write"),
+            # A single writer keeps vector store writes ordered and uncontended
+            self._workers("write", 1, self._write),
+        )
+        print(f"🎉 Pipeline stored {self.summary['stored']} chunk(s) in '{CHROMA_COLLECTION}' "
+              f"({self.summary['skipped']} unchanged, {self.summary['failed_chunks']} failed)")
+        for metric in self.metrics_snapshot():
+            print(f"📊 {metric['stage']:<8} {metric['items']:>5} items  {metric['items_per_second']:>8} items/s  "
+                  f"util {metric['utilization']:.0%}  max queue {metric['max_queue_depth']}")
+        return self.summary
+
+# -------------------------
+# SYNC ENTRY POINT
+# -------------------------
+def iter_ingestion_events(files: List[Tuple[str, bytes]], batch_size: int = None,
+                          cancel: threading.Event = None, metadata: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+    """Run the pipeline on a background event loop and yield its progress events.
+
+    The last event has type ``done`` and carries the summary and final metrics
+    (or type ``error`` if the pipeline crashed). Setting ``cancel`` makes the
+    pipeline wind down early; it still ends with ``done``. ``metadata`` is
+    stored on every chunk alongside its source, page and upload time.
+    """
+    events: "queue.Queue" = queue.Queue()
+
+    def run():
+        try:
+            pipeline = IngestionPipeline(files, events.put, batch_size, cancel, metadata)
+            summary = asyncio.run(pipeline.run())
+            events.put({"type": "done", "summary": summary, "metrics": pipeline.metrics_snapshot()})
+        except BaseException as e:
+            # CancelledError and friends are BaseExceptions; the consumer must still get a terminal event
+            print(f"❌ Ingestion pipeline failed: {e!r}")
+            events.put({"type": "error", "error": str(e) or type(e).__name__})
+
+    thread = threading.Thread(target=run, name="ingest-pipeline", daemon=True)
+    thread.start()
+    while True:
+        event = events.get()
+        yield event
+        if event["type"] in ("done", "error"):
+            break
+    thread.join()
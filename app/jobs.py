@@ -0,0 +1,543 @@
+"""
+Background Ingestion Jobs
+Functionalities Included:
+- SQLite-backed job queue shared by every Streamlit session and worker process
+- Worker processes that run the upload pipeline and S3 imports outside the script run
+- Job IDs, progress, automatic retry with backoff, manual retry and cancellation
+- ``python -m app.jobs --workers N`` to run workers standalone
+"""
+
+import argparse
+import atexit
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# -------------------------
+# JOB CONFIG
+# -------------------------
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(".cache", "jobs.sqlite3"))
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join(".cache", "jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "10"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "120"))
+# Past this much heartbeat silence a job is lost even if a process with its worker's PID exists (PIDs get reused)
+JOB_LOST_AFTER = float(os.getenv("JOB_LOST_AFTER", "1800"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+# Start workers inside the Streamlit server unless they run as a separate service
+JOB_EMBEDDED_WORKERS = os.getenv("JOB_EMBEDDED_WORKERS", "true").lower() in ("1", "true", "yes")
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+class JobCancelled(Exception):
+    """Raised inside a handler when the job's cancellation was requested"""
+
+# -------------------------
+# CONNECTION
+# -------------------------
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(JOB_DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; claiming a job opens its own IMMEDIATE transaction
+        conn = sqlite3.connect(JOB_DB_PATH, check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " progress REAL NOT NULL DEFAULT 0,"
+            " message TEXT,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " max_attempts INTEGER NOT NULL,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " not_before REAL NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " heartbeat_at REAL,"
+            " worker_pid INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, not_before, created_at)")
+        _conn = conn
+    return _conn
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+def _execute(sql: str, params: Tuple = ()) -> int:
+    """Run one statement and return how many rows it changed"""
+    with _lock:
+        return _get_connection().execute(sql, params).rowcount
+
+def _fetch(sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+    """Run one query and read all of its rows while holding the connection"""
+    with _lock:
+        cursor = _get_connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        return cursor.execute(sql, params).fetchall()
+
+# -------------------------
+# SUBMIT / INSPECT / CONTROL
+# -------------------------
+def submit_job(kind: str, payload: Dict[str, Any], max_attempts: int = None) -> str:
+    """Queue a job for the workers and return its ID"""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job_id = uuid.uuid4().hex
+    _execute(
+        "INSERT INTO jobs (id, kind, status, payload, message, max_attempts, created_at) "
+        "VALUES (?, ?, 'queued', ?, 'Waiting for a worker', ?, ?)",
+        (job_id, kind, json.dumps(payload), max_attempts or JOB_MAX_ATTEMPTS, time.time())
+    )
+    print(f"🧵 Queued {kind} job {job_id}")
+    return job_id
+
+def submit_upload_job(files: List[Tuple[str, bytes]], patient_id: Optional[str] = None) -> str:
+    """Spool uploaded PDFs to disk and queue them for extract → upload → index"""
+    job_dir = os.path.join(JOB_SPOOL_DIR, uuid.uuid4().hex)
+    os.makedirs(job_dir, exist_ok=True)
+    spooled = []
+    for index, (filename, file_bytes) in enumerate(files):
+        path = os.path.join(job_dir, f"{index:04d}.pdf")
+        with open(path, "wb") as handle:
+            handle.write(file_bytes)
+        spooled.append({"filename": filename, "path": path})
+    return submit_job("upload", {"files": spooled, "spool_dir": job_dir, "patient_id": patient_id})
+
+def submit_s3_import_job(documents: List[Dict[str, Any]], patient_id: Optional[str] = None) -> str:
+    """Queue S3 objects (manifest rows) for download → extract → index"""
+    keep = ("key", "filename", "size", "etag")
+    payload = []
+    for doc in documents:
+        item = {field: doc.get(field) for field in keep}
+        # Becomes the chunks' upload time
+        item["uploaded_at"] = doc["last_modified"].timestamp() if doc.get("last_modified") else None
+        payload.append(item)
+    return submit_job("s3_import", {"documents": payload, "patient_id": patient_id})
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    rows = _fetch("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    return _row_to_job(rows[0]) if rows else None
+
+def list_jobs(limit: int = 20, statuses: Optional[List[str]] = None,
+              job_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Most recent jobs first, optionally only those in ``statuses`` and/or among ``job_ids``"""
+    conditions: List[str] = []
+    params: List[Any] = []
+    if statuses:
+        conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if job_ids is not None:
+        conditions.append(f"id IN ({','.join('?' * len(job_ids))})")
+        params.extend(job_ids)
+    sql = "SELECT * FROM jobs" + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    return [_row_to_job(row) for row in _fetch(sql, tuple(params))]
+
+def cancel_job(job_id: str) -> bool:
+    """Cancel a queued job at once, or ask a running one to stop at its next checkpoint"""
+    now = time.time()
+    if _execute(
+        "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ?, message = 'Cancelled' "
+        "WHERE id = ? AND status = 'queued'",
+        (now, job_id)
+    ):
+        return True
+    return bool(_execute(
+        "UPDATE jobs SET cancel_requested = 1, message = 'Cancelling...' WHERE id = ? AND status = 'running'",
+        (job_id,)
+    ))
+
+def retry_job(job_id: str) -> bool:
+    """Put a failed or cancelled job back in the queue with a fresh attempt budget"""
+    return bool(_execute(
+        "UPDATE jobs SET status = 'queued', attempts = 0, cancel_requested = 0, error = NULL, not_before = 0, "
+        "progress = 0, message = 'Waiting for a worker', finished_at = NULL "
+        "WHERE id = ? AND status IN ('failed', 'cancelled')",
+        (job_id,)
+    ))
+
+# -------------------------
+# WORKER SIDE
+# -------------------------
+class JobContext:
+    """Handed to job handlers to report progress and honour cancellation"""
+
+    def __init__(self, job: Dict[str, Any]):
+        self.job_id = job["id"]
+        self.payload = job["payload"]
+        self.attempt = job["attempts"]
+
+    def cancelled(self) -> bool:
+        rows = _fetch("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,))
+        return bool(rows and rows[0]["cancel_requested"])
+
+    def update(self, progress: float, message: str) -> None:
+        """Record progress; raises JobCancelled if the job should stop"""
+        _execute(
+            "UPDATE jobs SET progress = ?, message = ?, heartbeat_at = ? WHERE id = ?",
+            (min(max(progress, 0.0), 1.0), message, time.time(), self.job_id)
+        )
+        if self.cancelled():
+            raise JobCancelled()
+
+def _worker_alive(pid: Optional[int]) -> bool:
+    """Whether a worker process still exists (on Windows only the heartbeat is known)"""
+    if not pid or os.name == "nt":  # os.kill(pid, 0) would terminate the process on Windows
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # exists, owned by another user
+        return True
+    except OSError:
+        return False
+    return True
+
+def _requeue_stale_jobs() -> None:
+    """Jobs whose worker died go back in the queue, or fail once they have used up their attempts"""
+    now = time.time()
+    cutoff = now - JOB_STALE_AFTER
+    stale = _fetch(
+        "SELECT id, attempts, max_attempts, worker_pid, heartbeat_at FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+        (cutoff,)
+    )
+    requeued = failed = 0
+    for job in stale:
+        # A live worker that missed heartbeats is slow (e.g. a long blocking call), not lost,
+        # unless it has been silent so long that the PID more likely belongs to another process
+        if job["heartbeat_at"] >= now - JOB_LOST_AFTER and _worker_alive(job["worker_pid"]):
+            continue
+        if job["attempts"] >= job["max_attempts"]:
+            # A job that keeps killing its worker must not be retried forever
+            failed += _execute(
+                "UPDATE jobs SET status = 'failed', message = ?, error = ?, finished_at = ?, worker_pid = NULL "
+                "WHERE id = ? AND status = 'running' AND heartbeat_at < ?",
+                (f"Failed after {job['attempts']} attempt(s)", "Worker lost", now, job["id"], cutoff)
+            )
+        else:
+            requeued += _execute(
+                "UPDATE jobs SET status = 'queued', message = 'Worker lost, requeued', worker_pid = NULL "
+                "WHERE id = ? AND status = 'running' AND heartbeat_at < ?",
+                (job["id"], cutoff)
+            )
+    if requeued:
+        print(f"♻️  Requeued {requeued} job(s) from lost workers")
+    if failed:
+        print(f"❌ Failed {failed} job(s) whose workers were lost on every attempt")
+
+def _claim_next_job() -> Optional[Dict[str, Any]]:
+    now = time.time()
+    with _lock:
+        conn = _get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            row = cursor.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ? ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                cursor.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, "
+                    "heartbeat_at = ?, worker_pid = ?, message = 'Starting' WHERE id = ?",
+                    (now, now, os.getpid(), row["id"])
+                )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    if row is None:
+        return None
+    job = _row_to_job(row)
+    job["attempts"] += 1
+    return job
+
+def _heartbeat(job_id: str, stop: threading.Event) -> None:
+    while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+        _execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+def _finish(job: Dict[str, Any], status: str, message: str, result: Any = None, error: str = None) -> None:
+    _execute(
+        "UPDATE jobs SET status = ?, message = ?, result = ?, error = ?, finished_at = ?, "
+        "progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END WHERE id = ?",
+        (status, message, json.dumps(result) if result is not None else None, error, time.time(), status, job["id"])
+    )
+    if status == "succeeded":
+        _discard_spool(job["payload"])
+
+def run_job(job: Dict[str, Any]) -> None:
+    """Run one claimed job to a terminal state, or requeue it for another attempt"""
+    context = JobContext(job)
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job["id"], stop), daemon=True)
+    beat.start()
+    start = time.perf_counter()
+    try:
+        result = HANDLERS[job["kind"]](context)
+        _finish(job, "succeeded", f"Done in {time.perf_counter() - start:.1f}s", result=result)
+        print(f"✅ Job {job['id']} ({job['kind']}) finished in {time.perf_counter() - start:.1f}s")
+    except JobCancelled:
+        _finish(job, "cancelled", "Cancelled")
+        print(f"🛑 Job {job['id']} cancelled")
+    except Exception as e:
+        traceback.print_exc()
+        if context.cancelled():
+            _finish(job, "cancelled", "Cancelled", error=str(e))
+        elif job["attempts"] < job["max_attempts"]:
+            delay = JOB_RETRY_BACKOFF * (2 ** (job["attempts"] - 1))
+            _execute(
+                "UPDATE jobs SET status = 'queued', error = ?, not_before = ?, message = ? WHERE id = ?",
+                (str(e), time.time() + delay, f"Attempt {job['attempts']} failed, retrying in {delay:.0f}s", job["id"])
+            )
+            print(f"🔁 Job {job['id']} failed (attempt {job['attempts']}/{job['max_attempts']}): {e}")
+        else:
+            _finish(job, "failed", f"Failed after {job['attempts']} attempt(s)", error=str(e))
+            print(f"❌ Job {job['id']} failed: {e}")
+    finally:
+        stop.set()
+
+def worker_loop(stop_event=None, parent_pid: Optional[int] = None) -> None:
+    """Claim and run jobs until ``stop_event`` is set or the parent process goes away"""
+    print(f"🧵 Job worker {os.getpid()} started")
+    purge_jobs()
+    while not (stop_event is not None and stop_event.is_set()):
+        if parent_pid is not None and os.getppid() != parent_pid:
+            break
+        try:
+            _requeue_stale_jobs()
+            job = _claim_next_job()
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Job queue busy: {e}")
+            job = None
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        run_job(job)
+    print(f"🧵 Job worker {os.getpid()} stopped")
+
+# -------------------------
+# WORKER PROCESSES
+# -------------------------
+_workers: List[multiprocessing.Process] = []
+_workers_lock = threading.Lock()
+_stop_event = None
+
+def start_workers(count: int = None) -> int:
+    """Start the worker processes once per server process; returns how many are alive"""
+    global _stop_event
+    count = JOB_WORKERS if count is None else count
+    with _workers_lock:
+        alive = [worker for worker in _workers if worker.is_alive()]
+        if len(alive) >= count:
+            return len(alive)
+        # Spawn, not fork: the Streamlit server is multi-threaded. Workers are
+        # non-daemonic so they can run their own PDF extraction pools.
+        context = multiprocessing.get_context("spawn")
+        if _stop_event is None:
+            _stop_event = context.Event()
+            atexit.register(stop_workers)
+        for _ in range(count - len(alive)):
+            worker = context.Process(target=worker_loop, args=(_stop_event, os.getpid()), name="ingest-job-worker")
+            worker.start()
+            alive.append(worker)
+        _workers[:] = alive
+        return len(alive)
+
+def stop_workers(timeout: float = 10) -> None:
+    with _workers_lock:
+        if _stop_event is not None:
+            _stop_event.set()
+        for worker in _workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        _workers.clear()
+
+# -------------------------
+# SPOOL
+# -------------------------
+def _discard_spool(payload: Dict[str, Any]) -> None:
+    spool_dir = payload.get("spool_dir")
+    if spool_dir:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def purge_jobs(max_age: float = None) -> int:
+    """Delete finished jobs older than ``max_age`` seconds along with their spooled files.
+
+    Failed and cancelled jobs keep their files until then so they can be retried.
+    """
+    cutoff = time.time() - (JOB_RETENTION if max_age is None else max_age)
+    with _lock:
+        conn = _get_connection()
+        rows = conn.execute(
+            f"SELECT id, payload FROM jobs WHERE status IN ({','.join('?' * len(TERMINAL_STATUSES))}) AND finished_at < ?",
+            TERMINAL_STATUSES + (cutoff,)
+        ).fetchall()
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id, _ in rows])
+    for _, payload in rows:
+        _discard_spool(json.loads(payload))
+    return len(rows)
+
+# -------------------------
+# HANDLERS
+# -------------------------
+def _index_documents(context: JobContext, chunks: Iterable[Tuple[str, str, Dict[str, Any]]], total: int,
+                     etags: Dict[str, Optional[str]], metadata: Dict[str, Dict[str, Any]],
+                     start: float, end: float) -> Dict[str, int]:
+    """Index chunks one source document at a time so progress and cancellation stay responsive.
+
+    ``chunks`` yields ``(chunk, key, metadata)`` grouped by document, as
+    ``iter_document_chunks`` does, so indexing starts before chunking finishes.
+    """
+    from app.chunk_utils import CHUNKING_CONFIG
+    from app.vectorstore_utils import index_s3_documents
+
+    totals = {"stored": 0, "skipped": 0, "failed_chunks": 0, "stale_deleted": 0}
+    for done, (key, group) in enumerate(itertools.groupby(chunks, key=lambda item: item[1])):
+        group = list(group)
+        context.update(start + (end - start) * done / total, f"Indexing {done + 1}/{total}: {key}")
+        result = index_s3_documents([chunk for chunk, _, _ in group], [key] * len(group), {key: etags.get(key)},
+                                    CHUNKING_CONFIG, metadatas=[chunk_metadata for _, _, chunk_metadata in group],
+                                    document_metadata={key: metadata.get(key)})
+        if result["collection"] is None:
+            raise RuntimeError("Vector store is unavailable")
+        totals["stored"] += result["stored"]
+        totals["skipped"] += result["skipped"]
+        totals["failed_chunks"] += len(result["failed_ids"])
+        totals["stale_deleted"] += result["stale_deleted"]
+    return totals
+
+def _run_upload_job(context: JobContext) -> Dict[str, Any]:
+    """Run spooled uploads through the extract → upload → chunk → embed → store pipeline"""
+    from app.ingest_pipeline import iter_ingestion_events
+
+    files = []
+    for item in context.payload["files"]:
+        with open(item["path"], "rb") as handle:
+            files.append((item["filename"], handle.read()))
+
+    cancel = threading.Event()
+    finished_files = 0
+    summary = None
+    metadata = {"patient_id": context.payload["patient_id"]} if context.payload.get("patient_id") else None
+    for event in iter_ingestion_events(files, cancel=cancel, metadata=metadata):
+        # A file is finished once it is chunked, or if its extraction failed
+        if event["type"] == "chunked" or (event["type"] == "failed" and event["stage"] == "extract"):
+            finished_files += 1
+        elif event["type"] == "done":
+            summary = event["summary"]
+        elif event["type"] == "error":
+            raise RuntimeError(event["error"])
+        if cancel.is_set():
+            continue
+        try:
+            stored = f", {event['total_stored']} chunk(s) stored" if event["type"] == "stored" else ""
+            context.update(0.9 * finished_files / len(files), f"Processed {finished_files}/{len(files)} file(s){stored}")
+        except JobCancelled:
+            # Let the pipeline wind down before giving the worker back
+            cancel.set()
+    if cancel.is_set():
+        raise JobCancelled()
+    return summary
+
+def _run_s3_import_job(context: JobContext) -> Dict[str, Any]:
+    """Download, extract and index S3 objects, skipping ones the ledger says are unchanged"""
+    from app.chunk_utils import CHUNKING_CONFIG, document_metadata, iter_document_chunks
+    from app.config import EMBEDDING_MODEL
+    from app.index_ledger import plan_import
+    from app.pdf_utils import extract_pages_parallel
+    from app.s3_utils import download_many_to_files
+    from app.vectorstore_utils import CHROMA_COLLECTION
+
+    patient_id = context.payload.get("patient_id")
+    for doc in context.payload["documents"]:
+        # What chunk_document will copy into every chunk; a change re-plans the object as modified
+        doc["metadata"] = document_metadata({"uploaded_at": doc.get("uploaded_at"), "patient_id": patient_id})
+    plan = plan_import(CHROMA_COLLECTION, context.payload["documents"], EMBEDDING_MODEL, CHUNKING_CONFIG)
+    documents = plan["new"] + plan["modified"]
+    result = {"imported": [], "failed": [], "unchanged": [doc["key"] for doc in plan["unchanged"]]}
+    if not documents:
+        return {**result, "stored": 0, "skipped": 0, "failed_chunks": 0, "stale_deleted": 0}
+
+    context.update(0.05, f"Downloading {len(documents)} file(s)")
+    # Pinned to the listed ETag, so the text indexed under it is that exact version
+    downloads = download_many_to_files([doc["key"] for doc in documents], etags=[doc.get("etag") for doc in documents])
+    downloaded = []
+    for doc, download in zip(documents, downloads):
+        if download["success"]:
+            downloaded.append((doc, download["path"]))
+        else:
+            result["failed"].append({"filename": doc["filename"], "error": download.get("error", "Unknown error")})
+
+    try:
+        context.update(0.25, f"Extracting text from {len(downloaded)} file(s)")
+        extracted = extract_pages_parallel([path for _, path in downloaded])
+    finally:
+        for _, path in downloaded:
+            os.unlink(path)
+
+    imported = []
+    for (doc, _), pages in zip(downloaded, extracted):
+        if pages:
+            imported.append({"key": doc["key"], "pages": pages, **doc["metadata"]})
+            result["imported"].append(doc["filename"])
+        else:
+            error = "Text extraction failed or timed out" if pages is None else "No text extracted"
+            result["failed"].append({"filename": doc["filename"], "error": error})
+
+    context.update(0.5, "Chunking documents")
+    etags = {doc["key"]: doc.get("etag") for doc in documents}
+    metadata = {doc["key"]: doc["metadata"] for doc in documents}
+    chunks = iter_document_chunks(imported)
+    return {**result, **_index_documents(context, chunks, len(imported), etags, metadata, 0.5, 1.0)}
+
+HANDLERS: Dict[str, Callable[[JobContext], Dict[str, Any]]] = {
+    "upload": _run_upload_job,
+    "s3_import": _run_s3_import_job,
+}
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Run background ingestion job workers")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+    if args.workers <= 1:
+        worker_loop()
+    else:
+        start_workers(args.workers)
+        try:
+            for worker in list(_workers):
+                worker.join()
+        except KeyboardInterrupt:
+            stop_workers()
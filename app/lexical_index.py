@@ -0,0 +1,353 @@
+"""
+Lexical (BM25) Inverted Index
+Functionalities Included:
+- Tokenizer that keeps lab codes, drug names and dosages ("hba1c", "500", "7.2")
+- Array-backed postings (doc numbers + term frequencies) persisted in SQLite as append-only segments
+- Incremental adds and tombstoned deletes, picked up incrementally by other processes
+- Compaction that drops tombstones and merges each term's segments into one
+- BM25 search and reciprocal rank fusion with dense results
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# -------------------------
+# LEXICAL INDEX CONFIG
+# -------------------------
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(".cache", "lexical"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word/number tokens; decimals, ratios and hyphenated codes stay whole"""
+    return _TOKEN_RE.findall(text.lower())
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = None) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank)"""
+    k = RRF_K if k is None else k
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+# -------------------------
+# INDEX
+# -------------------------
+class LexicalIndex:
+    """BM25 index over chunk IDs, persisted to SQLite and mirrored in memory.
+
+    Postings are ``array('I')`` doc numbers with matching ``array('I')`` term
+    frequencies. Each add stores only its own postings as a new ``(term,
+    segment)`` row, so a write costs the size of the batch rather than of
+    every touched term's full list, and other processes load just the new
+    segments. Deletes only tombstone doc numbers; compaction drops them and
+    merges each term's segments into one once most docs are dead.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.RLock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Under the write lock, so two processes opening an old index don't both migrate it
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " doc_no INTEGER PRIMARY KEY,"
+            " chunk_id TEXT NOT NULL,"
+            " length INTEGER NOT NULL,"
+            " live INTEGER NOT NULL DEFAULT 1,"
+            # Generation that tombstoned the doc, so other processes only re-read new deletes
+            " deleted_in INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_chunk ON docs(chunk_id)")
+        self._migrate()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " segment INTEGER NOT NULL,"
+            " doc_nos BLOB,"
+            " tfs BLOB,"
+            " PRIMARY KEY (term, segment))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_segment ON postings(segment)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.commit()
+        self._loaded_generation = -1
+        self._loaded_epoch = -1
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._chunk_ids: List[Optional[str]] = []
+        self._lengths = array("I")
+        self._live = bytearray()
+        self._live_by_chunk: Dict[str, int] = {}
+        self._total_length = 0
+
+    def _migrate(self) -> None:
+        """Bring indexes written before posting segments up to the current schema"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(docs)")]
+        if "deleted_in" not in columns:
+            self._conn.execute("ALTER TABLE docs ADD COLUMN deleted_in INTEGER NOT NULL DEFAULT 0")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(postings)")]
+        if columns and "segment" not in columns:
+            # One postings row per term becomes that term's segment 0
+            self._conn.execute("ALTER TABLE postings RENAME TO postings_unsegmented")
+            self._conn.execute(
+                "CREATE TABLE postings (term TEXT NOT NULL, segment INTEGER NOT NULL, doc_nos BLOB, tfs BLOB,"
+                " PRIMARY KEY (term, segment))"
+            )
+            self._conn.execute("INSERT INTO postings SELECT term, 0, doc_nos, tfs FROM postings_unsegmented")
+            self._conn.execute("DROP TABLE postings_unsegmented")
+
+    # ---- generation / loading ----
+    def _meta(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, key: str, value: int) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _generation(self) -> int:
+        return self._meta("generation")
+
+    def _bump_generation(self) -> int:
+        generation = self._generation() + 1
+        self._set_meta("generation", generation)
+        return generation
+
+    def _bump_epoch(self) -> None:
+        """Mark a rewrite (compaction or clear) that other processes can only pick up by reloading"""
+        self._set_meta("epoch", self._meta("epoch") + 1)
+
+    def _refresh(self) -> None:
+        """Catch up with writes from other processes: new docs, deletes and posting segments since the last load"""
+        generation = self._generation()
+        if generation == self._loaded_generation:
+            return
+        epoch = self._meta("epoch")
+        if epoch != self._loaded_epoch:
+            self._chunk_ids, self._lengths, self._live = [], array("I"), bytearray()
+            self._live_by_chunk, self._total_length = {}, 0
+            self._postings = {}
+            self._loaded_generation = -1
+        loaded = self._loaded_generation
+        known_docs = len(self._chunk_ids)
+        for doc_no, chunk_id, length, live in self._conn.execute(
+            "SELECT doc_no, chunk_id, length, live FROM docs WHERE doc_no >= ? ORDER BY doc_no", (known_docs,)
+        ):
+            self._append_doc(doc_no, chunk_id, length, bool(live))
+        for (doc_no,) in self._conn.execute(
+            "SELECT doc_no FROM docs WHERE live = 0 AND deleted_in > ? AND doc_no < ?", (loaded, known_docs)
+        ):
+            self._tombstone_doc(doc_no)
+        # Segments are written in doc order, so appending keeps every posting list sorted
+        for term, doc_blob, tf_blob in self._conn.execute(
+            "SELECT term, doc_nos, tfs FROM postings WHERE segment > ? ORDER BY segment", (loaded,)
+        ):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("I"))
+            postings[0].frombytes(doc_blob)
+            postings[1].frombytes(tf_blob)
+        self._loaded_generation = generation
+        self._loaded_epoch = epoch
+
+    def _append_doc(self, doc_no: int, chunk_id: str, length: int, live: bool) -> None:
+        while len(self._chunk_ids) < doc_no:
+            # Gaps can only come from rows removed by compaction in another process
+            self._chunk_ids.append(None)
+            self._lengths.append(0)
+            self._live.append(0)
+        self._chunk_ids.append(chunk_id)
+        self._lengths.append(length)
+        self._live.append(1 if live else 0)
+        if live:
+            self._live_by_chunk[chunk_id] = doc_no
+            self._total_length += length
+
+    def _tombstone_doc(self, doc_no: int) -> None:
+        if not self._live[doc_no]:
+            return
+        self._live[doc_no] = 0
+        self._live_by_chunk.pop(self._chunk_ids[doc_no], None)
+        self._total_length -= self._lengths[doc_no]
+
+    def _reset(self) -> None:
+        """Forget the in-memory mirror; the next read reloads it from disk"""
+        self._loaded_generation = -1
+        self._loaded_epoch = -1
+
+    # ---- writes ----
+    def _begin_write(self) -> None:
+        """Take the database write lock, then catch up with writes from other processes"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._refresh()
+
+    def add(self, ids: List[str], texts: List[str]) -> int:
+        """Index new chunks; IDs already live are skipped (IDs are content-addressed)"""
+        with self._lock:
+            self._begin_write()
+            try:
+                added = self._add(ids, texts)
+            except Exception:
+                self._conn.rollback()
+                self._reset()
+                raise
+            return added
+
+    def _add(self, ids: List[str], texts: List[str]) -> int:
+        segment: Dict[str, Tuple[array, array]] = {}
+        rows = []
+        for chunk_id, text in zip(ids, texts):
+            if chunk_id in self._live_by_chunk:
+                continue
+            doc_no = len(self._chunk_ids)
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._append_doc(doc_no, chunk_id, length, True)
+            rows.append((doc_no, chunk_id, length))
+            for term, tf in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("I"), array("I"))
+                postings[0].append(doc_no)
+                postings[1].append(tf)
+                new = segment.get(term)
+                if new is None:
+                    new = segment[term] = (array("I"), array("I"))
+                new[0].append(doc_no)
+                new[1].append(tf)
+        if not rows:
+            self._conn.rollback()
+            return 0
+        generation = self._bump_generation()
+        self._conn.executemany("INSERT INTO docs (doc_no, chunk_id, length, live) VALUES (?, ?, ?, 1)", rows)
+        # Only this batch's postings, as segment ``generation``; earlier segments are never rewritten
+        self._conn.executemany(
+            "INSERT INTO postings (term, segment, doc_nos, tfs) VALUES (?, ?, ?, ?)",
+            [(term, generation, doc_nos.tobytes(), tfs.tobytes()) for term, (doc_nos, tfs) in segment.items()]
+        )
+        self._loaded_generation = generation
+        self._conn.commit()
+        return len(rows)
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock:
+            self._begin_write()
+            try:
+                return self._delete(ids)
+            except Exception:
+                self._conn.rollback()
+                self._reset()
+                raise
+
+    def _delete(self, ids: List[str]) -> int:
+        doc_nos = [self._live_by_chunk.pop(chunk_id) for chunk_id in ids if chunk_id in self._live_by_chunk]
+        if not doc_nos:
+            self._conn.rollback()
+            return 0
+        for doc_no in doc_nos:
+            self._live[doc_no] = 0
+            self._total_length -= self._lengths[doc_no]
+        generation = self._bump_generation()
+        self._conn.executemany("UPDATE docs SET live = 0, deleted_in = ? WHERE doc_no = ?",
+                               [(generation, doc_no) for doc_no in doc_nos])
+        self._loaded_generation = generation
+        # In the same write transaction, so no other process adds to the docs being renumbered
+        self._maybe_compact()
+        self._conn.commit()
+        return len(doc_nos)
+
+    def clear(self) -> None:
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM docs")
+                self._conn.execute("DELETE FROM postings")
+                self._bump_epoch()
+                self._bump_generation()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                self._reset()
+            self._refresh()
+
+    def _maybe_compact(self) -> None:
+        """Renumber live docs and merge postings into one segment per term once more than half are tombstones"""
+        live_docs = len(self._live_by_chunk)
+        if len(self._chunk_ids) < 1000 or live_docs * 2 >= len(self._chunk_ids):
+            return
+        remap = {}
+        for doc_no, chunk_id in enumerate(self._chunk_ids):
+            if self._live[doc_no]:
+                remap[doc_no] = len(remap)
+        postings = {}
+        for term, (doc_nos, tfs) in self._postings.items():
+            kept = [(remap[doc_no], tf) for doc_no, tf in zip(doc_nos, tfs) if doc_no in remap]
+            if kept:
+                postings[term] = (array("I", [doc_no for doc_no, _ in kept]), array("I", [tf for _, tf in kept]))
+        docs = [(remap[doc_no], self._chunk_ids[doc_no], self._lengths[doc_no]) for doc_no in remap]
+        self._conn.execute("DELETE FROM docs")
+        self._conn.execute("DELETE FROM postings")
+        self._conn.executemany("INSERT INTO docs (doc_no, chunk_id, length, live) VALUES (?, ?, ?, 1)", docs)
+        self._bump_epoch()
+        generation = self._bump_generation()
+        self._conn.executemany(
+            "INSERT INTO postings (term, segment, doc_nos, tfs) VALUES (?, ?, ?, ?)",
+            [(term, generation, doc_nos.tobytes(), tfs.tobytes()) for term, (doc_nos, tfs) in postings.items()]
+        )
+        # The next read reloads the renumbered docs
+        self._reset()
+
+    # ---- reads ----
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._live_by_chunk)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top ``k`` live chunks by BM25 score as ``(chunk_id, score)``"""
+        with self._lock:
+            self._refresh()
+            live_docs = len(self._live_by_chunk)
+            if not live_docs:
+                return []
+            avg_length = self._total_length / live_docs
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                doc_nos, tfs = postings
+                # Document frequency counts tombstoned docs too; it is only an IDF estimate
+                idf = math.log(1 + (live_docs - len(doc_nos) + 0.5) / (len(doc_nos) + 0.5))
+                for doc_no, tf in zip(doc_nos, tfs):
+                    if not self._live[doc_no]:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_no] / avg_length)
+                    scores[doc_no] = scores.get(doc_no, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            top = sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:k]
+            return [(self._chunk_ids[doc_no], score) for doc_no, score in top]
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(collection: str) -> LexicalIndex:
+    """Process-wide index for ``collection``"""
+    with _indexes_lock:
+        index = _indexes.get(collection)
+        if index is None:
+            index = _indexes[collection] = LexicalIndex(os.path.join(LEXICAL_INDEX_DIR, f"{collection}.sqlite3"))
+        return index
@@ -1,32 +1,210 @@
 from pypdf import  PdfReader
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple, Union
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import os
 import re
+import threading
+import time
+import weakref
+
+# Parallel extraction configuration
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(os.cpu_count() or 1)))
+PDF_TIMEOUT = float(os.getenv('PDF_TIMEOUT', '120'))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '50'))
+PDF_SPLIT_MIN_BYTES = int(os.getenv('PDF_SPLIT_MIN_BYTES', str(2 * 1024 * 1024)))
+
+# HTML tags and whitespace runs are removed in one pass: a run that contains
+# whitespace collapses to a single space, a run of bare tags disappears.
+_TAG_OR_SPACE_RE = re.compile(r'(?:<[^>]+>)*(\s)(?:<[^>]+>|\s)*|(?:<[^>]+>)+')
+_SPACE_RE = re.compile(r'\s+')
+
+def _replace_tag_or_space(match) -> str:
+    return ' ' if match.group(1) else ''
+
+class CleanText(str):
+    """A ``str`` that has already been through ``clean_text``.
+
+    ``clean_text`` returns it unchanged, so text that is cleaned at extraction
+    time isn't re-scanned when it is cleaned again further down the pipeline.
+    """
+    __slots__ = ()
 
 def clean_text(text: str) -> str:
     """Clean text by removing HTML tags and normalizing whitespace"""
+    if isinstance(text, CleanText):
+        return text
     if not text:
-        return ""
-    
-    # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
+        return CleanText("")
     
-    # Replace multiple whitespace with single space
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remove extra line breaks
-    text = re.sub(r'\n\s*\n', '\n', text)
+    # Without a '<' there are no tags, so plain whitespace collapsing is enough
+    if '<' in text:
+        text = _TAG_OR_SPACE_RE.sub(_replace_tag_or_space, text)
+    else:
+        text = _SPACE_RE.sub(' ', text)
     
     # Strip leading/trailing whitespace
-    text = text.strip()
-    
-    return text
+    return CleanText(text.strip())
 
-def extract_text_from_pdf(file):
+def iter_pdf_pages(file, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page_number, text)`` for each page of a PDF, one page at a time.
+
+    Page numbers are 1-based. Pages without extractable text are skipped.
+    """
     reader = PdfReader(file)
-    text = ' '
-    for page in reader.pages:
-        text = text + page.extract_text() or ''
-    
-    # Clean the extracted text
-    return clean_text(text)
\ No newline at end of file
+    for index, page in enumerate(reader.pages[start:end], start=start):
+        text = page.extract_text()
+        if text:
+            yield index + 1, text
+
+def iter_clean_pages(file, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page_number, cleaned_text)`` for each non-empty page of a PDF"""
+    for page_number, text in iter_pdf_pages(file, start, end):
+        text = clean_text(text)
+        if text:
+            yield page_number, text
+
+def extract_text_from_pdf(file):
+    """Extract and clean the text of a whole PDF"""
+    return clean_text(' '.join(text for _, text in iter_pdf_pages(file)))
+
+# -------------------------
+# PARALLEL EXTRACTION
+# -------------------------
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+# Pools shut down under running callers, whose queued tasks were cancelled with them
+_retired_pools = weakref.WeakSet()
+
+def get_extraction_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """Reuse one process pool across calls instead of paying worker start-up each time"""
+    global _pool, _pool_workers
+    max_workers = max(1, max_workers or PDF_WORKERS)
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _retired_pools.add(_pool)
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pool_workers = max_workers
+        return _pool
+
+def discard_extraction_pool():
+    """Drop the pool after a timeout and kill its workers; a stuck worker must not block later batches"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            # shutdown(wait=False) alone leaves a worker stuck in a pathological PDF running
+            processes = list((getattr(_pool, "_processes", None) or {}).values())
+            _retired_pools.add(_pool)
+            _pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            _pool = None
+
+def is_retired_pool(pool: ProcessPoolExecutor) -> bool:
+    """Whether ``pool`` was shut down by a timeout or resize, cancelling the tasks still queued on it"""
+    return pool in _retired_pools
+
+def _open_source(source: Union[bytes, str]):
+    return BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+def _source_size(source: Union[bytes, str]) -> int:
+    return len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+
+def extract_text_from_source(source: Union[bytes, str], start: int = 0, end: Optional[int] = None) -> str:
+    """Extract raw text of pages [start, end) from a PDF given as bytes or a file path"""
+    return ' '.join(text for _, text in iter_pdf_pages(_open_source(source), start, end))
+
+def extract_pages_from_source(source: Union[bytes, str], start: int = 0, end: Optional[int] = None) -> List[Tuple[int, str]]:
+    """Extract cleaned ``(page_number, text)`` pairs of pages [start, end) from a PDF given as bytes or a file path"""
+    return list(iter_clean_pages(_open_source(source), start, end))
+
+def join_pages(pages: List[Tuple[int, str]]) -> Tuple[str, List[Tuple[int, int]]]:
+    """Join cleaned pages into one document text.
+
+    Also returns ``(start_offset, page_number)`` for each page so positions in
+    the joined text can be mapped back to the page they came from.
+    """
+    parts, page_starts, offset = [], [], 0
+    for page_number, text in pages:
+        page_starts.append((offset, page_number))
+        parts.append(text)
+        offset += len(text) + 1
+    return CleanText(' '.join(parts)), page_starts
+
+def _page_ranges(source: Union[bytes, str], pages_per_task: int):
+    """Split large PDFs into page ranges so one file can use several workers"""
+    if _source_size(source) < PDF_SPLIT_MIN_BYTES:
+        return [(0, None)]
+    num_pages = len(PdfReader(_open_source(source)).pages)
+    return [(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)] or [(0, None)]
+
+def extract_texts_parallel(sources: List[Union[bytes, str]], max_workers: int = None,
+                           timeout: float = None) -> List[Optional[str]]:
+    """Extract and clean text from many PDFs on a process pool.
+
+    ``sources`` are PDF bytes or file paths. Results come back in input order;
+    a file that fails or overruns its deadline yields None. Deadlines start at
+    submission: each wave of ``max_workers`` files gets another ``timeout``
+    seconds, so the whole call is bounded by ceil(N / max_workers) × timeout.
+    """
+    return [join_pages(pages)[0] if pages is not None else None
+            for pages in extract_pages_parallel(sources, max_workers, timeout)]
+
+def extract_pages_parallel(sources: List[Union[bytes, str]], max_workers: int = None,
+                           timeout: float = None) -> List[Optional[List[Tuple[int, str]]]]:
+    """Like ``extract_texts_parallel``, but keep each file's cleaned ``(page_number, text)`` pairs"""
+    if not sources:
+        return []
+    max_workers = max(1, max_workers or PDF_WORKERS)
+    timeout = timeout or PDF_TIMEOUT
+
+    # A single small file isn't worth the inter-process round-trip
+    if max_workers == 1 or (len(sources) == 1 and _source_size(sources[0]) < PDF_SPLIT_MIN_BYTES):
+        results = []
+        for source in sources:
+            try:
+                results.append(extract_pages_from_source(source))
+            except Exception as e:
+                print(f"❌ Error extracting PDF text: {e}")
+                results.append(None)
+        return results
+
+    pool = get_extraction_pool(max_workers)
+    submitted = []
+    # Deadlines run from submission: file i may wait behind i // max_workers earlier waves
+    submitted_at = time.monotonic()
+    for source in sources:
+        try:
+            ranges = _page_ranges(source, PDF_PAGES_PER_TASK)
+            submitted.append([pool.submit(extract_pages_from_source, source, start, end) for start, end in ranges])
+        except Exception as e:
+            print(f"❌ Error reading PDF: {e}")
+            submitted.append(None)
+
+    results = []
+    timed_out = False
+    for index, futures in enumerate(submitted):
+        if futures is None:
+            results.append(None)
+            continue
+        deadline = submitted_at + timeout * (1 + index // max_workers)
+        try:
+            parts = [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+            results.append([page for part in parts for page in part])
+        except FutureTimeoutError:
+            print(f"⏱️  PDF {index + 1} exceeded the {timeout:.0f}s extraction timeout")
+            timed_out = True
+            for future in futures:
+                future.cancel()
+            results.append(None)
+        except Exception as e:
+            print(f"❌ Error extracting PDF {index + 1}: {e}")
+            results.append(None)
+
+    if timed_out:
+        discard_extraction_pool()
+    return results
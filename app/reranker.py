@@ -0,0 +1,151 @@
+"""
+Cross-Encoder Reranking
+Functionalities Included:
+- Optional second retrieval stage: a wide candidate set scored by a small CPU cross-encoder
+- Only the best few chunks reach the LLM, which shortens prompt prefill
+- Batched scoring under a per-query time budget, keeping retrieval order for anything left unscored
+- Memoized orderings plus latency / budget counters for monitoring
+- sentence-transformers is imported only when reranking is enabled; apps preload the model at startup
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.query_cache import LRUCache
+from app.vectorstore_utils import retrieve_relevant_docs
+
+# -------------------------
+# RERANK CONFIG
+# -------------------------
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "40"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+# Seconds of scoring per query; candidates not scored in time keep their retrieval order
+RERANK_TIME_BUDGET = float(os.getenv("RERANK_TIME_BUDGET", "0.5"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "256"))
+
+_model_lock = threading.Lock()
+_model = None
+_model_failed = False
+# Keyed by query and candidate IDs, so a changed collection (new candidates) misses
+_rerank_cache = LRUCache("rerank", RERANK_CACHE_SIZE)
+_stats_lock = threading.Lock()
+_stats = {"queries": 0, "pairs": 0, "budget_exceeded": 0, "failures": 0, "seconds": 0.0}
+
+# -------------------------
+# MODEL
+# -------------------------
+def get_reranker():
+    """The process-wide cross-encoder, loaded on first use; None when reranking is off or unavailable.
+
+    Loading takes seconds and is not covered by RERANK_TIME_BUDGET, so
+    the apps call this once at startup instead of on the first query.
+    """
+    global _model, _model_failed
+    if not RERANK_ENABLED or _model_failed:
+        return None
+    with _model_lock:
+        if _model is None and not _model_failed:
+            try:
+                start = time.perf_counter()
+                # Imported here: torch and transformers take seconds to import and are only needed when enabled
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL, max_length=RERANK_MAX_LENGTH, device="cpu")
+                print(f"🏅 Loaded reranker '{RERANK_MODEL}' in {time.perf_counter() - start:.1f}s")
+            except Exception as e:  # missing package, broken install, download or model errors alike
+                print(f"⚠️ Failed to load reranker '{RERANK_MODEL}', keeping retrieval order: {e}")
+                _model_failed = True
+        return _model
+
+# -------------------------
+# RERANKING
+# -------------------------
+def _seconds_per_pair() -> float:
+    with _stats_lock:
+        return _stats["seconds"] / _stats["pairs"] if _stats["pairs"] else 0.0
+
+def rerank(query: str, docs: List[Any], top_n: int, time_budget: Optional[float] = None,
+           stats: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """Reorder retrieved ``docs`` by cross-encoder score and keep the best ``top_n``.
+
+    Pairs are scored RERANK_BATCH_SIZE at a time in retrieval order. A batch
+    that is not expected to finish within ``time_budget`` seconds (judged by
+    the batches before it, or by earlier queries) is not started: the scored
+    prefix is reordered and the rest follow in retrieval order. Without a
+    model, or if scoring fails, ``docs[:top_n]`` comes back unchanged.
+    ``stats`` receives the candidate and scored counts and the time taken.
+    """
+    stats = {} if stats is None else stats
+    stats.update({"candidates": len(docs), "scored": 0, "ms": 0.0, "cached": False})
+    model = get_reranker()
+    if model is None or len(docs) <= 1:
+        return docs[:top_n]
+    time_budget = RERANK_TIME_BUDGET if time_budget is None else time_budget
+
+    key = (query, tuple(doc.id for doc in docs))
+    order = _rerank_cache.get(key)
+    if order is not None:
+        stats.update({"scored": len(docs), "cached": True})
+        return [docs[i] for i in order[:top_n]]
+
+    start = time.perf_counter()
+    scores: List[float] = []
+    try:
+        for batch_start in range(0, len(docs), RERANK_BATCH_SIZE):
+            batch = docs[batch_start:batch_start + RERANK_BATCH_SIZE]
+            elapsed = time.perf_counter() - start
+            per_pair = elapsed / len(scores) if scores else _seconds_per_pair()
+            if elapsed + per_pair * len(batch) > time_budget:
+                break
+            pairs = [(query, doc.page_content) for doc in batch]
+            scores.extend(float(score) for score in model.predict(pairs, batch_size=len(pairs),
+                                                                  show_progress_bar=False))
+    except Exception as e:
+        print(f"⚠️ Reranking failed, keeping retrieval order: {e}")
+        with _stats_lock:
+            _stats["failures"] += 1
+        return docs[:top_n]
+    elapsed = time.perf_counter() - start
+
+    # sorted() is stable, so ties keep their retrieval order
+    order = sorted(range(len(scores)), key=lambda i: -scores[i]) + list(range(len(scores), len(docs)))
+    complete = len(scores) == len(docs)
+    if complete:
+        _rerank_cache.put(key, order)
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats["pairs"] += len(scores)
+        _stats["seconds"] += elapsed
+        _stats["budget_exceeded"] += 0 if complete else 1
+    print(f"🏅 Reranked {len(scores)}/{len(docs)} candidates in {elapsed * 1000:.0f} ms"
+          + ("" if complete else f" (time budget {time_budget * 1000:.0f} ms reached)"))
+    stats.update({"scored": len(scores), "ms": round(elapsed * 1000, 1)})
+    return [docs[i] for i in order[:top_n]]
+
+def retrieve_reranked_docs(query: str, k: int = 4, query_embedding: Optional[List[float]] = None,
+                           where: Optional[Dict[str, Any]] = None,
+                           stats: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """``retrieve_relevant_docs``, widened to RERANK_CANDIDATES and cut back to ``k`` by the cross-encoder.
+
+    With reranking off (or the model unavailable) this is a plain top-``k`` retrieval.
+    """
+    if get_reranker() is None:
+        return retrieve_relevant_docs(query, k, query_embedding=query_embedding, where=where)
+    candidates = retrieve_relevant_docs(query, max(k, RERANK_CANDIDATES), query_embedding=query_embedding, where=where)
+    return rerank(query, candidates, k, stats=stats)
+
+# -------------------------
+# STATS
+# -------------------------
+def get_rerank_stats() -> Dict[str, Any]:
+    """Reranking counters for this process: average latency, budget overruns and the ordering memo"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["enabled"] = RERANK_ENABLED and not _model_failed
+    stats["avg_ms"] = stats["seconds"] * 1000 / stats["queries"] if stats["queries"] else 0.0
+    stats["cache"] = _rerank_cache.stats()
+    return stats
@@ -0,0 +1,204 @@
+"""
+Local S3 Manifest Cache
+Functionalities Included:
+- SQLite copy of the bucket listing (key, size, LastModified, ETag)
+- Incremental refresh: only new or changed objects are written, removed ones deleted
+- Prefix, filename and date filters with paging for the sidebar
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.s3_utils import S3_CONFIG, iter_s3_documents
+
+# -------------------------
+# MANIFEST CONFIG
+# -------------------------
+S3_MANIFEST_PATH = os.getenv("S3_MANIFEST_PATH", os.path.join(".cache", "s3_manifest.sqlite3"))
+S3_MANIFEST_TTL = float(os.getenv("S3_MANIFEST_TTL", "300"))
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+# -------------------------
+# CONNECTION
+# -------------------------
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(S3_MANIFEST_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(S3_MANIFEST_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " bucket TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " filename TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_modified REAL NOT NULL,"
+            " etag TEXT,"
+            " PRIMARY KEY (bucket, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_objects_modified ON objects(bucket, last_modified)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS refreshes ("
+            " bucket TEXT NOT NULL,"
+            " prefix TEXT NOT NULL,"
+            " refreshed_at REAL NOT NULL,"
+            " PRIMARY KEY (bucket, prefix))"
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+def _row_to_document(row: Tuple) -> Dict[str, Any]:
+    key, filename, size, last_modified, etag = row
+    return {
+        "key": key,
+        "filename": filename,
+        "size": size,
+        "last_modified": datetime.fromtimestamp(last_modified, tz=timezone.utc),
+        "etag": etag
+    }
+
+# -------------------------
+# REFRESH
+# -------------------------
+def refresh_manifest(prefix: str = "documents/") -> Dict[str, Any]:
+    """Re-list ``prefix`` and apply only the differences to the local manifest.
+
+    Objects whose ETag and LastModified are unchanged are not rewritten. Keys
+    that no longer exist are removed only after a complete, successful listing.
+    """
+    bucket = S3_CONFIG["bucket"]
+    stats = {"added": 0, "updated": 0, "removed": 0, "total": 0, "success": True}
+    start = time.perf_counter()
+
+    with _lock:
+        conn = _get_connection()
+        known = {
+            key: (etag, last_modified)
+            for key, etag, last_modified in conn.execute(
+                "SELECT key, etag, last_modified FROM objects WHERE bucket = ? AND key LIKE ? ESCAPE '\\'",
+                (bucket, _like_prefix(prefix))
+            )
+        }
+
+    seen = set()
+    changed = []
+    try:
+        for doc in iter_s3_documents(prefix):
+            seen.add(doc["key"])
+            modified = doc["last_modified"].timestamp()
+            previous = known.get(doc["key"])
+            if previous is None:
+                stats["added"] += 1
+            elif previous != (doc["etag"], modified):
+                stats["updated"] += 1
+            else:
+                continue
+            changed.append((bucket, doc["key"], doc["filename"], doc["size"], modified, doc["etag"]))
+    except (ClientError, BotoCoreError) as e:
+        print(f"❌ Error refreshing S3 manifest: {e}")
+        stats["success"] = False
+
+    removed = [] if not stats["success"] else [key for key in known if key not in seen]
+    stats["removed"] = len(removed)
+
+    with _lock:
+        conn = _get_connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO objects (bucket, key, filename, size, last_modified, etag) VALUES (?, ?, ?, ?, ?, ?)",
+            changed
+        )
+        conn.executemany("DELETE FROM objects WHERE bucket = ? AND key = ?", [(bucket, key) for key in removed])
+        if stats["success"]:
+            conn.execute(
+                "INSERT OR REPLACE INTO refreshes (bucket, prefix, refreshed_at) VALUES (?, ?, ?)",
+                (bucket, prefix, time.time())
+            )
+        conn.commit()
+
+    stats["total"] = len(seen) if stats["success"] else len(known) + stats["added"]
+    print(f"🗂️  S3 manifest refreshed in {time.perf_counter() - start:.1f}s: "
+          f"{stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, {stats['total']} total")
+    return stats
+
+def manifest_keys(prefix: str = "documents/") -> Set[str]:
+    """Every cached key under ``prefix``"""
+    with _lock:
+        rows = _get_connection().execute(
+            "SELECT key FROM objects WHERE bucket = ? AND key LIKE ? ESCAPE '\\'",
+            (S3_CONFIG["bucket"], _like_prefix(prefix))
+        ).fetchall()
+    return {key for (key,) in rows}
+
+def manifest_age(prefix: str = "documents/") -> Optional[float]:
+    """Seconds since ``prefix`` was last refreshed, or None if it never was"""
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT refreshed_at FROM refreshes WHERE bucket = ? AND prefix = ?",
+            (S3_CONFIG["bucket"], prefix)
+        ).fetchone()
+    return time.time() - row[0] if row else None
+
+def ensure_manifest(prefix: str = "documents/", max_age: float = None) -> Optional[Dict[str, Any]]:
+    """Refresh the manifest only if it is missing or older than ``max_age`` seconds.
+
+    Returns the refresh stats, or None if the cached manifest was fresh enough.
+    """
+    max_age = S3_MANIFEST_TTL if max_age is None else max_age
+    age = manifest_age(prefix)
+    if age is None or age > max_age:
+        return refresh_manifest(prefix)
+    return None
+
+# -------------------------
+# QUERY
+# -------------------------
+def _like_prefix(prefix: str) -> str:
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+def _filters(prefix: str, name_contains: Optional[str], modified_after: Optional[datetime],
+             modified_before: Optional[datetime]) -> Tuple[str, List[Any]]:
+    clauses = ["bucket = ?", "key LIKE ? ESCAPE '\\'"]
+    params: List[Any] = [S3_CONFIG["bucket"], _like_prefix(prefix)]
+    if name_contains:
+        clauses.append("filename LIKE ? ESCAPE '\\'")
+        params.append("%" + _like_prefix(name_contains))
+    if modified_after:
+        clauses.append("last_modified >= ?")
+        params.append(modified_after.timestamp())
+    if modified_before:
+        clauses.append("last_modified < ?")
+        params.append(modified_before.timestamp())
+    return " AND ".join(clauses), params
+
+def query_manifest(prefix: str = "documents/", name_contains: Optional[str] = None,
+                   modified_after: Optional[datetime] = None, modified_before: Optional[datetime] = None,
+                   limit: int = 200, offset: int = 0) -> List[Dict[str, Any]]:
+    """Return one page of cached documents matching the filters, newest first"""
+    where, params = _filters(prefix, name_contains, modified_after, modified_before)
+    with _lock:
+        rows = _get_connection().execute(
+            f"SELECT key, filename, size, last_modified, etag FROM objects WHERE {where} "
+            "ORDER BY last_modified DESC, key LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+    return [_row_to_document(row) for row in rows]
+
+def count_manifest(prefix: str = "documents/", name_contains: Optional[str] = None,
+                   modified_after: Optional[datetime] = None, modified_before: Optional[datetime] = None) -> int:
+    """Number of cached documents matching the filters"""
+    where, params = _filters(prefix, name_contains, modified_after, modified_before)
+    with _lock:
+        return _get_connection().execute(f"SELECT COUNT(*) FROM objects WHERE {where}", params).fetchone()[0]
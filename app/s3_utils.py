@@ -3,16 +3,23 @@ Minimal S3 Utilities for RAG Applications
 Functionalities Included:
 - Upload PDF to S3
 - Download PDF from S3
-- List documents in S3
-- Process uploaded files (extract text + upload)
+- Concurrent bulk download
+- Streaming downloads into spooled / temporary files
+- List documents in S3 (paginated)
 """
 
 import boto3
-from botocore.exceptions import ClientError
+from boto3.exceptions import Boto3Error
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 import os
-from typing import List, Dict, Any
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional
 from io import BytesIO
-from app.pdf_utils import clean_text
 
 # -------------------------
 # S3 CONFIG
@@ -21,19 +28,54 @@ S3_CONFIG = {
     "access_key": os.getenv("S3_ACCESS_KEY", ""),
     "secret_key": os.getenv("S3_SECRET_KEY", ""),
     "bucket": os.getenv("S3_BUCKET_NAME", "medibot-bucket"),
-    "region": os.getenv("S3_REGION", "us-east-1")
+    "region": os.getenv("S3_REGION", "us-east-1"),
+    # Point at MinIO, moto_server or another S3-compatible endpoint
+    "endpoint_url": os.getenv("S3_ENDPOINT_URL") or None,
+    "max_pool_connections": int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32")),
+    "transfer_workers": int(os.getenv("S3_TRANSFER_WORKERS", "8")),
+    "multipart_threshold": int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))),
+    "multipart_chunksize": int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024))),
+    "range_size": int(os.getenv("S3_RANGE_SIZE", str(8 * 1024 * 1024))),
+    "stream_chunk_size": int(os.getenv("S3_STREAM_CHUNK_SIZE", str(256 * 1024))),
+    "spool_max_memory": int(os.getenv("S3_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024))),
 }
 
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_CONFIG["multipart_threshold"],
+    multipart_chunksize=S3_CONFIG["multipart_chunksize"],
+    max_concurrency=S3_CONFIG["transfer_workers"],
+    use_threads=True
+)
+
 # -------------------------
 # CLIENT
 # -------------------------
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
 def get_s3_client():
-    return boto3.client(
-        "s3",
-        aws_access_key_id=S3_CONFIG["access_key"],
-        aws_secret_access_key=S3_CONFIG["secret_key"],
-        region_name=S3_CONFIG["region"]
-    )
+    """Return the shared S3 client, building it on first use.
+
+    boto3 clients are thread-safe once built, but building one through the
+    default session is not, so construction happens under a lock.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                session = boto3.session.Session()
+                _s3_client = session.client(
+                    "s3",
+                    aws_access_key_id=S3_CONFIG["access_key"],
+                    aws_secret_access_key=S3_CONFIG["secret_key"],
+                    region_name=S3_CONFIG["region"],
+                    endpoint_url=S3_CONFIG["endpoint_url"],
+                    config=Config(
+                        max_pool_connections=S3_CONFIG["max_pool_connections"],
+                        retries={"max_attempts": 5, "mode": "adaptive"}
+                    )
+                )
+    return _s3_client
 
 # -------------------------
 # UPLOAD TO S3
@@ -43,89 +85,181 @@ def upload_to_s3(file_bytes: bytes, filename: str) -> Dict[str, Any]:
     key = f"documents/{filename}"
 
     try:
-        s3.put_object(
-            Bucket=S3_CONFIG["bucket"],
-            Key=key,
-            Body=file_bytes,
-            ContentType="application/pdf"
-        )
-        return {"success": True, "s3_key": key}
-    except ClientError as e:
+        if len(file_bytes) >= S3_CONFIG["multipart_threshold"]:
+            # Large PDFs go up as parallel multipart parts
+            s3.upload_fileobj(
+                BytesIO(file_bytes),
+                S3_CONFIG["bucket"],
+                key,
+                ExtraArgs={"ContentType": "application/pdf"},
+                Config=TRANSFER_CONFIG
+            )
+            written = {}
+        else:
+            response = s3.put_object(
+                Bucket=S3_CONFIG["bucket"],
+                Key=key,
+                Body=file_bytes,
+                ContentType="application/pdf"
+            )
+            written = {"IfMatch": response["ETag"]}
+        # Neither call returns LastModified, which S3 imports record as uploaded_at
+        response = s3.head_object(Bucket=S3_CONFIG["bucket"], Key=key, **written)
+        return {"success": True, "s3_key": key, "etag": response.get("ETag", "").strip('"'),
+                "last_modified": response.get("LastModified")}
+    except (ClientError, BotoCoreError, Boto3Error) as e:
+        # upload_fileobj wraps failures in S3UploadFailedError, a Boto3Error
         return {"success": False, "error": str(e)}
 
 # -------------------------
 # DOWNLOAD FROM S3
 # -------------------------
-def download_from_s3(s3_key: str) -> Dict[str, Any]:
+def download_from_s3(s3_key: str, size: Optional[int] = None) -> Dict[str, Any]:
     s3 = get_s3_client()
 
     try:
-        response = s3.get_object(
-            Bucket=S3_CONFIG["bucket"],
-            Key=s3_key
-        )
+        if size is not None and size >= S3_CONFIG["multipart_threshold"]:
+            # Large PDFs come down as parallel ranged GETs
+            buffer = BytesIO()
+            s3.download_fileobj(S3_CONFIG["bucket"], s3_key, buffer, Config=TRANSFER_CONFIG)
+            content = buffer.getvalue()
+        else:
+            response = s3.get_object(
+                Bucket=S3_CONFIG["bucket"],
+                Key=s3_key
+            )
+            content = response["Body"].read()
         return {
             "success": True,
-            "content": response["Body"].read(),
+            "content": content,
             "filename": s3_key.split("/")[-1]
         }
-    except ClientError as e:
+    except (ClientError, BotoCoreError) as e:
         return {"success": False, "error": str(e)}
 
+def download_many_from_s3(s3_keys: List[str], sizes: Optional[List[int]] = None,
+                          max_workers: int = None) -> List[Dict[str, Any]]:
+    """Download several objects concurrently; results keep the input order"""
+    if not s3_keys:
+        return []
+    sizes = sizes or [None] * len(s3_keys)
+    max_workers = max(1, min(max_workers or S3_CONFIG["transfer_workers"], len(s3_keys)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-download") as executor:
+        return list(executor.map(download_from_s3, s3_keys, sizes))
+
 # -------------------------
-# LIST ALL DOCUMENTS
+# STREAMING DOWNLOADS
 # -------------------------
-def list_s3_documents() -> List[Dict[str, Any]]:
+def _stream_object_into(s3_key: str, fileobj, etag: Optional[str] = None) -> Dict[str, Any]:
+    """Copy one version of an object into ``fileobj`` with ranged GETs, one small chunk at a time.
+
+    The size comes from the first response's Content-Range, not from a listing
+    that may be stale. Every range is sent with If-Match on ``etag`` (or, if
+    none is given, on the ETag of the first response), so an object replaced
+    mid-download fails with PreconditionFailed instead of yielding a truncated
+    or mixed-version file. Returns the ``size`` and ``etag`` that were read.
+    """
     s3 = get_s3_client()
+    range_size = S3_CONFIG["range_size"]
+    start, size = 0, None
+    while size is None or start < size:
+        request = {"Bucket": S3_CONFIG["bucket"], "Key": s3_key, "Range": f"bytes={start}-{start + range_size - 1}"}
+        if etag:
+            request["IfMatch"] = f'"{etag}"'
+        try:
+            response = s3.get_object(**request)
+        except ClientError as e:
+            if size is None and e.response.get("Error", {}).get("Code") == "InvalidRange":
+                # Empty objects have no byte 0 to range over
+                size = 0
+                break
+            raise
+        # "bytes 0-8388607/52428800"; a server that ignores Range sends the whole object
+        content_range = response.get("ContentRange")
+        if size is None:
+            size = int(content_range.rsplit("/", 1)[1]) if content_range else response["ContentLength"]
+            etag = etag or response.get("ETag", "").strip('"')
+        for chunk in response["Body"].iter_chunks(chunk_size=S3_CONFIG["stream_chunk_size"]):
+            fileobj.write(chunk)
+        if not content_range:
+            break
+        start += range_size
+    fileobj.seek(0)
+    return {"size": size, "etag": etag}
+
+def open_s3_document(s3_key: str, etag: Optional[str] = None):
+    """Download an object into a SpooledTemporaryFile that PdfReader can read directly.
 
+    Small files stay in memory; anything over S3_SPOOL_MAX_MEMORY rolls over to
+    disk, so a large PDF is never held as one bytes object. The caller closes it.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=S3_CONFIG["spool_max_memory"])
     try:
-        response = s3.list_objects_v2(
-            Bucket=S3_CONFIG["bucket"],
-            Prefix="documents/"
-        )
-        documents = []
-
-        for obj in response.get("Contents", []):
-            documents.append({
-                "key": obj["Key"],
-                "filename": obj["Key"].split("/")[-1],
-                "size": obj["Size"],
-                "last_modified": obj["LastModified"]
-            })
+        _stream_object_into(s3_key, spool, etag)
+        return spool
+    except Exception:
+        spool.close()
+        raise
 
-        return documents
+def download_s3_to_file(s3_key: str, etag: Optional[str] = None, directory: Optional[str] = None) -> Dict[str, Any]:
+    """Stream an object to a temporary file on disk and return its path and ETag.
 
-    except Exception:
+    Paths can be handed to extract_texts_parallel without the PDF ever being
+    loaded into this process. With ``etag`` the download fails unless that
+    exact version is still stored. The caller deletes the file.
+    """
+    handle = tempfile.NamedTemporaryFile(suffix=".pdf", dir=directory, delete=False)
+    try:
+        with handle:
+            streamed = _stream_object_into(s3_key, handle, etag)
+        return {"success": True, "path": handle.name, "filename": s3_key.split("/")[-1], "etag": streamed["etag"]}
+    except (ClientError, BotoCoreError, OSError) as e:
+        os.unlink(handle.name)
+        return {"success": False, "error": str(e)}
+
+def download_many_to_files(s3_keys: List[str], etags: Optional[List[Optional[str]]] = None,
+                           max_workers: int = None) -> List[Dict[str, Any]]:
+    """Stream several objects to temporary files concurrently; results keep the input order"""
+    if not s3_keys:
         return []
+    etags = etags or [None] * len(s3_keys)
+    max_workers = max(1, min(max_workers or S3_CONFIG["transfer_workers"], len(s3_keys)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-stream") as executor:
+        return list(executor.map(download_s3_to_file, s3_keys, etags))
 
 # -------------------------
-# PROCESS UPLOADED FILES (Extract Text + Upload)
+# LIST ALL DOCUMENTS
 # -------------------------
-def process_uploaded_files(uploaded_files: List, extract_text_func):
-    results = {"uploaded": [], "failed": [], "texts": []}
-
-    for file in uploaded_files:
-        try:
-            file_bytes = file.read()
-            text = clean_text(extract_text_func(BytesIO(file_bytes)))
-
-            # Upload to S3
-            upload_result = upload_to_s3(file_bytes, file.name)
+def iter_s3_documents(prefix: str = "documents/", modified_after: Optional[datetime] = None,
+                      modified_before: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """Yield every document under ``prefix``, one listing page at a time.
 
-            if upload_result["success"]:
-                results["uploaded"].append({
-                    "filename": file.name,
-                    "s3_key": upload_result["s3_key"]
-                })
-            else:
-                results["failed"].append({
-                    "filename": file.name,
-                    "error": upload_result["error"]
-                })
-
-            results["texts"].append(text)
+    Date filters are applied client-side because S3 can only filter by prefix.
+    Listing errors are raised so callers can tell a failure from an empty bucket.
+    """
+    s3 = get_s3_client()
+    paginator = s3.get_paginator("list_objects_v2")
 
-        except Exception as e:
-            results["failed"].append({"filename": file.name, "error": str(e)})
+    for page in paginator.paginate(Bucket=S3_CONFIG["bucket"], Prefix=prefix, PaginationConfig={"PageSize": 1000}):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith("/"):
+                continue
+            if modified_after and obj["LastModified"] < modified_after:
+                continue
+            if modified_before and obj["LastModified"] >= modified_before:
+                continue
+            yield {
+                "key": obj["Key"],
+                "filename": obj["Key"].split("/")[-1],
+                "size": obj["Size"],
+                "last_modified": obj["LastModified"],
+                "etag": obj.get("ETag", "").strip('"')
+            }
 
-    return results
+def list_s3_documents(prefix: str = "documents/", modified_after: Optional[datetime] = None,
+                      modified_before: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    try:
+        return list(iter_s3_documents(prefix, modified_after, modified_before))
+    except (ClientError, BotoCoreError) as e:
+        print(f"❌ Error listing S3 documents: {e}")
+        return []
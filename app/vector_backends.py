@@ -0,0 +1,611 @@
+"""
+Pluggable Vector Store Backends
+Functionalities Included:
+- Backend selection via the VECTOR_BACKEND environment variable
+- chroma_cloud: ChromaDB Cloud (default)
+- chroma_local: persistent on-disk ChromaDB, no network needed
+- flat: memory-mapped NumPy flat index (float32, float16 or int8) with optional HNSW acceleration
+- Writes serialized across processes (SQLite's write lock for flat, a lock file for chroma_local)
+
+Every backend exposes a Chroma-style client (get_collection / create_collection /
+delete_collection / heartbeat) whose collections support add, upsert, update,
+get, query, delete and count, so vectorstore_utils works unchanged on top of them.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.embedding_codec import CODECS, decode, encode, inner_products, storage_dtype
+
+# -------------------------
+# BACKEND CONFIG
+# -------------------------
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma_cloud").lower()
+CHROMA_API_KEY = os.getenv("CHROMA_API_KEY", "")
+CHROMA_TENANT = os.getenv("CHROMA_TENANT", "")
+CHROMA_DATABASE = os.getenv("CHROMA_DATABASE", "medibot")
+CHROMA_LOCAL_PATH = os.getenv("CHROMA_LOCAL_PATH", os.path.join(".cache", "chroma"))
+FLAT_INDEX_PATH = os.getenv("FLAT_INDEX_PATH", os.path.join(".cache", "flat_index"))
+FLAT_INDEX_HNSW = os.getenv("FLAT_INDEX_HNSW", "false").lower() in ("1", "true", "yes")
+FLAT_INDEX_HNSW_MIN_SIZE = int(os.getenv("FLAT_INDEX_HNSW_MIN_SIZE", "5000"))
+# Vector encoding of new flat collections; existing ones keep the encoding they were created with
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32").lower()
+
+try:
+    import hnswlib  # shipped with chromadb as chroma-hnswlib
+except ImportError:  # pragma: no cover - optional acceleration
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: local Chroma writes are serialized per process only
+    fcntl = None
+
+# -------------------------
+# FACTORY
+# -------------------------
+def get_backend_client(backend: Optional[str] = None):
+    """Build the vector store client for the configured backend"""
+    backend = (backend or VECTOR_BACKEND).lower()
+
+    if backend == "chroma_cloud":
+        import chromadb
+        return chromadb.CloudClient(
+            api_key=CHROMA_API_KEY,
+            tenant=CHROMA_TENANT,
+            database=CHROMA_DATABASE
+        )
+    if backend == "chroma_local":
+        import chromadb
+        # Job workers and the app write from separate processes; Chroma's local store expects one writer
+        return LockedClient(chromadb.PersistentClient(path=CHROMA_LOCAL_PATH),
+                            os.path.join(CHROMA_LOCAL_PATH, "write.lock"))
+    if backend == "flat":
+        return FlatClient(FLAT_INDEX_PATH, use_hnsw=FLAT_INDEX_HNSW)
+
+    raise ValueError(f"Unknown VECTOR_BACKEND '{backend}' (expected chroma_cloud, chroma_local or flat)")
+
+# -------------------------
+# WHERE FILTERS
+# -------------------------
+def _where_to_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate a Chroma-style metadata filter into a SQL condition"""
+    clauses, params = [], []
+    for field, condition in where.items():
+        if field in ("$and", "$or"):
+            parts = [_where_to_sql(sub) for sub in condition]
+            if not parts:
+                # An empty list constrains nothing (and "()" is not valid SQL)
+                continue
+            joiner = " AND " if field == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, sub_params in parts:
+                params.extend(sub_params)
+            continue
+
+        column = "json_extract(metadata, ?)"
+        path = f"$.{field}"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                placeholders = ",".join("?" * len(value))
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({placeholders})")
+                params.extend([path, *value])
+            else:
+                sql_op = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[op]
+                clauses.append(f"{column} {sql_op} ?")
+                params.extend([path, value])
+    return " AND ".join(clauses) or "1", params
+
+# -------------------------
+# FLAT INDEX
+# -------------------------
+class FlatCollection:
+    """Append-only vector file plus a SQLite table of ids, documents and metadata.
+
+    Upserts append a new row and tombstone the old one, so writes never rewrite
+    the vector file; the file is memory-mapped for queries and compacted once
+    more than half of it is dead. Vectors are stored as float32, float16 or
+    int8 (see app/embedding_codec.py); quantized files are scored block by block.
+
+    Compaction writes a new vector file and names it in ``meta`` in the same
+    transaction that renumbers the rows, so a reader's snapshot of the rows
+    always matches the file it maps.
+    """
+
+    VECTOR_FILES = {"float32": "vectors.f32", "float16": "vectors.f16", "int8": "vectors.i8"}
+
+    def __init__(self, name: str, path: str, use_hnsw: bool = False, dtype: Optional[str] = None):
+        self.name = name
+        self.path = path
+        self.use_hnsw = use_hnsw and hnswlib is not None
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "rows.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY,"
+            " id TEXT NOT NULL,"
+            " document TEXT,"
+            " metadata TEXT,"
+            " live INTEGER NOT NULL DEFAULT 1)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_id ON rows(id) WHERE live = 1")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        # Indexes written before quantization have a dimension but no dtype: they are float32
+        self.dtype = self._meta("dtype") or ("float32" if self._dim() else (dtype or FLAT_INDEX_DTYPE).lower())
+        if self.dtype not in CODECS:
+            raise ValueError(f"Unknown flat index dtype '{self.dtype}' (expected one of: {', '.join(CODECS)})")
+        self._loaded_generation = None
+        self._matrix = None
+        self._live_rows = None
+        self._hnsw = None
+
+    # ---- bookkeeping ----
+    def _meta(self, key: str, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _bump_generation(self) -> None:
+        self._set_meta("generation", int(self._meta("generation", 0)) + 1)
+
+    def _dim(self) -> Optional[int]:
+        dim = self._meta("dim")
+        return int(dim) if dim else None
+
+    def _vectors_path(self) -> str:
+        """The current vector file; indexes never compacted since files were versioned use the plain name"""
+        return os.path.join(self.path, self._meta("vectors_file", self.VECTOR_FILES[self.dtype]))
+
+    @contextmanager
+    def _reading(self):
+        """One read transaction, so every statement in it sees the same snapshot of rows and meta"""
+        if self._conn.in_transaction:
+            yield
+            return
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self._conn.rollback()
+
+    def _refresh(self) -> None:
+        """Re-map the vector file if another writer (or process) changed the index.
+
+        Call it inside ``_reading()`` or ``_writing()``: generation, row count
+        and vector file name must come from one snapshot.
+        """
+        generation = self._meta("generation", "0")
+        if generation == self._loaded_generation:
+            return
+        dim = self._dim()
+        total_rows = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+        if dim and total_rows:
+            self._matrix = np.memmap(self._vectors_path(), dtype=storage_dtype(self.dtype, dim), mode="r",
+                                     shape=(total_rows,))
+        else:
+            self._matrix = None
+        self._live_rows = np.array(
+            [row for (row,) in self._conn.execute("SELECT row FROM rows WHERE live = 1 ORDER BY row")],
+            dtype=np.int64
+        )
+        self._hnsw = None
+        self._loaded_generation = generation
+
+    def _hnsw_index(self):
+        """Build (lazily) an HNSW graph over the live rows"""
+        if not self.use_hnsw or self._matrix is None or len(self._live_rows) < FLAT_INDEX_HNSW_MIN_SIZE:
+            return None
+        if self._hnsw is None:
+            index = hnswlib.Index(space="ip", dim=self._matrix.shape[1])
+            index.init_index(max_elements=len(self._live_rows), ef_construction=200, M=16)
+            index.add_items(decode(self._matrix[self._live_rows], self.dtype), self._live_rows)
+            self._hnsw = index
+        return self._hnsw
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # ---- writes ----
+    @contextmanager
+    def _writing(self):
+        """One writer at a time, across threads and processes.
+
+        BEGIN IMMEDIATE takes SQLite's write lock up front, so the next free
+        row, the vector file append and the row inserts of one write can't
+        interleave with another process's; the lock is held until commit.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        self.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+        # Tombstoning runs before the insert, so a repeated ID would stay live twice; the last copy wins
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids = [ids[i] for i in keep]
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            vectors = vectors[keep]
+        with self._writing():
+            dim = self._dim()
+            if dim is None:
+                self._set_meta("dim", vectors.shape[1])
+                self._set_meta("dtype", self.dtype)
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {dim}")
+
+            first_row = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+            self._tombstone(ids)
+            with open(self._vectors_path(), "ab") as f:
+                f.seek(first_row * storage_dtype(self.dtype, vectors.shape[1]).itemsize)
+                f.truncate()
+                f.write(encode(vectors, self.dtype).tobytes())
+            self._conn.executemany(
+                "INSERT INTO rows (row, id, document, metadata, live) VALUES (?, ?, ?, ?, 1)",
+                [
+                    (first_row + i, chunk_id, doc, json.dumps(meta) if meta else None)
+                    for i, (chunk_id, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                ]
+            )
+            self._bump_generation()
+        self._maybe_compact()
+
+    def update(self, ids: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+               documents: Optional[List[str]] = None) -> None:
+        """Change the metadata or documents of stored chunks in place (vectors change through upsert).
+
+        Like Chroma, metadata is merged key by key and a None value removes
+        the key; IDs that aren't stored are ignored.
+        """
+        if not ids:
+            return
+        with self._writing():
+            for i, chunk_id in enumerate(ids):
+                row = self._conn.execute("SELECT row, metadata FROM rows WHERE live = 1 AND id = ?", (chunk_id,)).fetchone()
+                if row is None:
+                    continue
+                if metadatas is not None:
+                    merged = {**(json.loads(row[1]) if row[1] else {}), **(metadatas[i] or {})}
+                    merged = {key: value for key, value in merged.items() if value is not None}
+                    self._conn.execute("UPDATE rows SET metadata = ? WHERE row = ?",
+                                       (json.dumps(merged) if merged else None, row[0]))
+                if documents is not None:
+                    self._conn.execute("UPDATE rows SET document = ? WHERE row = ?", (documents[i], row[0]))
+
+    def _tombstone(self, ids: List[str]) -> int:
+        dead = 0
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            dead += self._conn.execute(
+                f"UPDATE rows SET live = 0 WHERE live = 1 AND id IN ({placeholders})", chunk
+            ).rowcount
+        return dead
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        with self._writing():
+            if where:
+                ids = list(ids or []) + self.get(where=where, include=[])["ids"]
+            if not ids:
+                return
+            self._tombstone(ids)
+            self._bump_generation()
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        total, live = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(live), 0) FROM rows").fetchone()
+        if total < 1000 or live * 2 > total:
+            return
+        with self._writing():
+            compacted = self._compact()
+        if compacted:
+            self._remove_old_vector_files()
+
+    def _compact(self) -> bool:
+        # Re-checked under the write lock: another process may have compacted already
+        total, live = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(live), 0) FROM rows").fetchone()
+        if total < 1000 or live * 2 > total:
+            return False
+        self._refresh()
+        dim = self._dim()
+        rows = self._conn.execute("SELECT row, id, document, metadata FROM rows WHERE live = 1 ORDER BY row").fetchall()
+        # A new file, not a replacement: readers still on the old snapshot keep mapping the old one
+        vectors_file = f"{self.VECTOR_FILES[self.dtype]}.{int(self._meta('generation', 0)) + 1}"
+        with open(os.path.join(self.path, vectors_file), "wb") as f:
+            if rows and dim:
+                # Rows are copied as encoded, so compaction never re-quantizes
+                f.write(np.asarray(self._matrix[[row for row, *_ in rows]]).tobytes())
+        self._matrix = None
+        self._conn.execute("DELETE FROM rows")
+        self._conn.executemany(
+            "INSERT INTO rows (row, id, document, metadata, live) VALUES (?, ?, ?, ?, 1)",
+            [(i, chunk_id, doc, meta) for i, (_, chunk_id, doc, meta) in enumerate(rows)]
+        )
+        self._set_meta("vectors_file", vectors_file)
+        self._bump_generation()
+        print(f"🧹 Compacted flat index '{self.name}' to {len(rows)} live rows")
+        return True
+
+    def _remove_old_vector_files(self) -> None:
+        """Delete vector files replaced by compaction (or left by one that crashed) once it has committed"""
+        current = os.path.basename(self._vectors_path())
+        prefix = self.VECTOR_FILES[self.dtype]
+        for name in os.listdir(self.path):
+            if name.startswith(prefix) and name != current:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    # Still mapped on Windows; the next compaction retries
+                    pass
+
+    # ---- reads ----
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM rows WHERE live = 1").fetchone()[0]
+
+    def _fetch(self, rows: List[int]) -> Dict[int, Tuple[str, Optional[str], Optional[str]]]:
+        found = {}
+        for start in range(0, len(rows), 500):
+            chunk = [int(r) for r in rows[start:start + 500]]
+            placeholders = ",".join("?" * len(chunk))
+            for row, chunk_id, doc, meta in self._conn.execute(
+                f"SELECT row, id, document, metadata FROM rows WHERE row IN ({placeholders})", chunk
+            ):
+                found[row] = (chunk_id, doc, meta)
+        return found
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None) -> Dict[str, List[Any]]:
+        include = ["documents", "metadatas"] if include is None else include
+        condition, params = _where_to_sql(where or {})
+        sql = f"SELECT id, document, metadata FROM rows WHERE live = 1 AND {condition}"
+        rows = []
+        with self._lock:
+            if ids is not None:
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows.extend(self._conn.execute(f"{sql} AND id IN ({placeholders})", params + chunk).fetchall())
+            else:
+                rows = self._conn.execute(sql + (f" LIMIT {int(limit)}" if limit else ""), params).fetchall()
+        result = {"ids": [chunk_id for chunk_id, _, _ in rows]}
+        if "documents" in include:
+            result["documents"] = [doc for _, doc, _ in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(meta) if meta else None for _, _, meta in rows]
+        return result
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, List[List[Any]]]:
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        queries = self._normalize(query_embeddings)
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    with self._reading():
+                        self._refresh()
+                        result = self._search(queries, n_results, where)
+                    break
+                except FileNotFoundError:
+                    # A compaction committed after this snapshot began and removed its vector file
+                    self._loaded_generation = None
+                    if attempt:
+                        raise
+        return {key: value for key, value in result.items() if key == "ids" or key in include}
+
+    def _search(self, queries: np.ndarray, n_results: int,
+                where: Optional[Dict[str, Any]]) -> Dict[str, List[List[Any]]]:
+        """Nearest live rows per query, against the snapshot ``_refresh`` just mapped"""
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if self._matrix is None or not len(self._live_rows):
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        if where:
+            condition, params = _where_to_sql(where)
+            candidates = np.array(
+                [row for (row,) in self._conn.execute(
+                    f"SELECT row FROM rows WHERE live = 1 AND {condition}", params)],
+                dtype=np.int64
+            )
+            hnsw = None
+        else:
+            candidates = self._live_rows
+            hnsw = self._hnsw_index()
+
+        for query in queries:
+            if hnsw is None and len(candidates):
+                if where:
+                    scores = inner_products(self._matrix[candidates], query, self.dtype)
+                else:
+                    # One streaming pass over the mapped file, then drop tombstoned rows
+                    scores = inner_products(self._matrix, query, self.dtype)[candidates]
+
+            if not len(candidates):
+                top_rows, top_scores = np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+            elif hnsw is not None:
+                hnsw.set_ef(max(64, 2 * n_results))
+                labels, distances = hnsw.knn_query(query, k=min(n_results, len(candidates)))
+                top_rows, top_scores = labels[0].astype(np.int64), 1.0 - distances[0]
+            else:
+                k = min(n_results, len(candidates))
+                best = np.argpartition(-scores, k - 1)[:k]
+                best = best[np.argsort(-scores[best])]
+                top_rows, top_scores = candidates[best], scores[best]
+
+            fetched = self._fetch(top_rows.tolist())
+            result["ids"].append([fetched[row][0] for row in top_rows.tolist()])
+            result["documents"].append([fetched[row][1] for row in top_rows.tolist()])
+            result["metadatas"].append([json.loads(fetched[row][2]) if fetched[row][2] else None
+                                        for row in top_rows.tolist()])
+            result["distances"].append([float(1.0 - score) for score in top_scores])
+        return result
+
+
+class FlatClient:
+    """Chroma-style client over FlatCollection directories"""
+
+    def __init__(self, path: str, use_hnsw: bool = False):
+        self.path = path
+        self.use_hnsw = use_hnsw
+        self._collections: Dict[str, FlatCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def heartbeat(self) -> int:
+        if not os.path.isdir(self.path):
+            raise RuntimeError(f"Flat index directory '{self.path}' is missing")
+        return time.time_ns()
+
+    def _collection_path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def get_collection(self, name: str) -> FlatCollection:
+        with self._lock:
+            if name not in self._collections:
+                if not os.path.isdir(self._collection_path(name)):
+                    raise ValueError(f"Collection {name} does not exist")
+                self._collections[name] = FlatCollection(name, self._collection_path(name), self.use_hnsw)
+            return self._collections[name]
+
+    def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> FlatCollection:
+        with self._lock:
+            if os.path.isdir(self._collection_path(name)):
+                raise ValueError(f"Collection {name} already exists")
+            self._collections[name] = FlatCollection(name, self._collection_path(name), self.use_hnsw)
+            return self._collections[name]
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> FlatCollection:
+        try:
+            return self.get_collection(name)
+        except ValueError:
+            return self.create_collection(name, metadata)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection._conn.close()
+            if not os.path.isdir(self._collection_path(name)):
+                raise ValueError(f"Collection {name} does not exist")
+            shutil.rmtree(self._collection_path(name))
+
+
+# -------------------------
+# LOCAL CHROMA WRITE LOCK
+# -------------------------
+class _FileLock:
+    """An exclusive flock on ``path`` plus a thread lock: one writer at a time across threads and processes"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            self._file.close()  # closing releases the flock
+            self._file = None
+        self._lock.release()
+
+
+class LockedCollection:
+    """A collection whose writes hold the client's write lock; reads pass straight through"""
+
+    def __init__(self, collection, lock: _FileLock):
+        self._collection = collection
+        self._lock = lock
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def add(self, *args, **kwargs):
+        with self._lock:
+            return self._collection.add(*args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        with self._lock:
+            return self._collection.upsert(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        with self._lock:
+            return self._collection.update(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with self._lock:
+            return self._collection.delete(*args, **kwargs)
+
+
+class LockedClient:
+    """A Chroma client whose collection writes are serialized through a lock file"""
+
+    def __init__(self, client, lock_path: str):
+        self._client = client
+        self._lock = _FileLock(lock_path)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def get_collection(self, name: str, **kwargs) -> LockedCollection:
+        return LockedCollection(self._client.get_collection(name, **kwargs), self._lock)
+
+    def create_collection(self, name: str, **kwargs) -> LockedCollection:
+        with self._lock:
+            return LockedCollection(self._client.create_collection(name, **kwargs), self._lock)
+
+    def get_or_create_collection(self, name: str, **kwargs) -> LockedCollection:
+        with self._lock:
+            return LockedCollection(self._client.get_or_create_collection(name, **kwargs), self._lock)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            self._client.delete_collection(name)
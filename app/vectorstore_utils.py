@@ -1,119 +1,477 @@
 import openai 
-import chromadb 
-from typing import List 
+import hashlib
+import json
+import requests
+from requests.adapters import HTTPAdapter
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Iterator, Optional, Set, Tuple
+import numpy as np
 from app.config import OPENAI_EMBEDDING_BASE, OPENAI_EMBEDDING_KEY, EMBEDDING_MODEL
 from app.pdf_utils import clean_text
+from app.embedding_cache import get_cached, put_cached, get_cache_stats
+from app.vector_backends import get_backend_client, VECTOR_BACKEND
+from app.index_ledger import clear_ledger, record_indexed, get_entries as get_ledger_entries, \
+    remove_entries as remove_ledger_entries, indexed_keys as ledger_indexed_keys, bump_collection_version, \
+    collection_version
+from app.query_cache import LRUCache
+from app.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from app.context_packing import count_tokens
+from app.embedding_batcher import AdaptiveBatchSizer, EmbeddingRequestError, embed_with_retry, next_batch_length
+from app.embedding_codec import as_matrix, decode_base64
 
 # Configure OpenAI for self-hosted embeddings
 openai.api_base = OPENAI_EMBEDDING_BASE
 openai.api_key = OPENAI_EMBEDDING_KEY
 
-# ChromaDB Cloud Configuration
+# Vector store Configuration (backend is chosen by VECTOR_BACKEND, see app/vector_backends.py)
 import os
-CHROMA_API_KEY = os.getenv('CHROMA_API_KEY', '')
-CHROMA_TENANT = os.getenv('CHROMA_TENANT', '')
-CHROMA_DATABASE = os.getenv('CHROMA_DATABASE', 'medibot')
 CHROMA_COLLECTION = os.getenv('CHROMA_COLLECTION', 'medical_documents')
+CHROMA_HEALTHCHECK_INTERVAL = float(os.getenv('CHROMA_HEALTHCHECK_INTERVAL', '60'))
+
+# Embedding HTTP Configuration
+EMBEDDING_POOL_SIZE = int(os.getenv('EMBEDDING_POOL_SIZE', '8'))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv('EMBEDDING_MAX_IN_FLIGHT', '4'))
+EMBEDDING_TIMEOUT = float(os.getenv('EMBEDDING_TIMEOUT', '30'))
+# "base64" asks the server for packed float32 vectors instead of JSON number arrays
+EMBEDDING_ENCODING_FORMAT = os.getenv('EMBEDDING_ENCODING_FORMAT', 'float').lower()
+
+# In-process query caches (shared by every Streamlit session in the server)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+RETRIEVAL_CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', '256'))
+RETRIEVAL_CACHE_TTL = float(os.getenv('RETRIEVAL_CACHE_TTL', '60'))
+_query_embedding_cache = LRUCache("query_embeddings", QUERY_EMBEDDING_CACHE_SIZE)
+# Keys include the collection version, so writes from other processes invalidate too
+_retrieval_cache = LRUCache("retrieval", RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+
+# Hybrid retrieval: BM25 candidates fused with dense candidates by reciprocal rank
+HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', 'true').lower() in ('1', 'true', 'yes')
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '4'))
+
+# Embedding batches are sized by one controller per process (see app/embedding_batcher.py)
+_batch_sizer = AdaptiveBatchSizer()
+
+# Shared keep-alive session so embedding calls reuse TCP/TLS connections
+_embedding_session = requests.Session()
+_embedding_session.mount("http://", HTTPAdapter(pool_connections=EMBEDDING_POOL_SIZE, pool_maxsize=EMBEDDING_POOL_SIZE))
+_embedding_session.mount("https://", HTTPAdapter(pool_connections=EMBEDDING_POOL_SIZE, pool_maxsize=EMBEDDING_POOL_SIZE))
+_embedding_session.headers.update({
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {OPENAI_EMBEDDING_KEY}"
+})
+
+# Process-wide client/collection cache, shared by every Streamlit session
+_chroma_lock = threading.RLock()
+_chroma_client = None
+_chroma_collection = None
+_chroma_checked_at = 0.0
+
+def _new_chroma_client():
+    """Build a new client for the configured vector store backend"""
+    return get_backend_client()
 
 def get_chroma_client():
-    """Get ChromaDB cloud client"""
-    return chromadb.CloudClient(
-        api_key=CHROMA_API_KEY,
-        tenant=CHROMA_TENANT,
-        database=CHROMA_DATABASE
-    )
-
-def get_embeddings(texts:List[str])->List[List[float]]:
-    """Get embeddings for texts using self-hosted model"""
+    """Get the shared vector store client"""
+    global _chroma_client
+    with _chroma_lock:
+        if _chroma_client is None:
+            _chroma_client = _new_chroma_client()
+        return _chroma_client
+
+def reset_chroma_connection():
+    """Drop the cached client and collection so the next call reconnects"""
+    global _chroma_client, _chroma_collection, _chroma_checked_at
+    with _chroma_lock:
+        _chroma_client = None
+        _chroma_collection = None
+        _chroma_checked_at = 0.0
+
+def _collection_changed():
+    """Bump the collection version and drop memoized retrievals after a write"""
+    bump_collection_version(CHROMA_COLLECTION)
+    _retrieval_cache.clear()
+
+def _index_lexical(ids: List[str], texts: List[str]):
+    """Add chunks to the BM25 index; dense storage stays authoritative if this fails"""
     try:
-        pass
-        
-        # Use requests directly to avoid OpenAI client issues
-        import requests
-        import json
-        
-        url = f"{OPENAI_EMBEDDING_BASE}/embeddings"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAI_EMBEDDING_KEY}"
-        }
-        
-        payload = {
-            "model": EMBEDDING_MODEL,
-            "input": texts
-        }
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if "data" in data and isinstance(data["data"], list):
-                embeddings = [item["embedding"] for item in data["data"]]
-                return embeddings
-            else:
-                return []
-        else:
-            return []
-            
+        get_lexical_index(CHROMA_COLLECTION).add(ids, texts)
     except Exception as e:
-        return []
+        print(f"⚠️ Failed to update lexical index: {e}")
+
+def get_query_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Counters for the query-embedding LRU and the retrieval memo"""
+    return {"query_embeddings": _query_embedding_cache.stats(), "retrieval": _retrieval_cache.stats()}
 
-def create_chroma_collection(texts: List[str], batch_size: int = 10):
-    """Create ChromaDB collection and store documents in batches"""
+def get_query_embedding(query: str) -> Optional[List[float]]:
+    """Embed a single query, serving recently asked strings from memory"""
+    key = (EMBEDDING_MODEL, query)
+    embedding = _query_embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+    embeddings = get_embeddings([query])
+    if not len(embeddings) or not embeddings.shape[1]:
+        return None
+    # One small list is easier on the query caches and answer cache than an array
+    embedding = embeddings[0].tolist()
+    _query_embedding_cache.put(key, embedding)
+    return embedding
+
+def get_embeddings(texts:List[str])->np.ndarray:
+    """Get embeddings for texts as one float32 ``(n, dim)`` matrix, or a ``(0, dim)`` one if any could not be embedded"""
+    embeddings = embed_texts(texts)
+    if any(vector is None for vector in embeddings):
+        dim = next((len(vector) for vector in embeddings if vector is not None), 0)
+        return np.empty((0, dim), dtype=np.float32)
+    return as_matrix(embeddings)
+
+def embed_texts(texts:List[str])->List[Optional[np.ndarray]]:
+    """Embed texts, serving repeats from the local embedding cache.
+
+    Misses go out as one request with retries and bisection (see
+    app/embedding_batcher.py); the result lines up with ``texts`` and holds a
+    float32 vector for each text, or None for any that could not be embedded.
+    """
+    cached = get_cached(EMBEDDING_MODEL, texts)
+    missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+    if not missing_texts:
+        return cached
+    
+    fresh = embed_with_retry(missing_texts, _request_embeddings, _batch_sizer)
+    embedded = [(text, vector) for text, vector in zip(missing_texts, fresh) if vector is not None]
+    if embedded:
+        put_cached(EMBEDDING_MODEL, [text for text, _ in embedded], [vector for _, vector in embedded])
+    
+    fresh_by_text = dict(zip(missing_texts, fresh))
+    return [vector if vector is not None else fresh_by_text[text] for text, vector in zip(texts, cached)]
+
+def _request_embeddings(texts:List[str])->np.ndarray:
+    """Get embeddings for texts as a float32 matrix using self-hosted model, raising EmbeddingRequestError on failure"""
+    # Use requests directly to avoid OpenAI client issues
+    url = f"{OPENAI_EMBEDDING_BASE}/embeddings"
+    
+    payload = {
+        "model": EMBEDDING_MODEL,
+        "input": texts
+    }
+    if EMBEDDING_ENCODING_FORMAT == "base64":
+        payload["encoding_format"] = "base64"
+    
+    try:
+        response = _embedding_session.post(url, json=payload, timeout=EMBEDDING_TIMEOUT)
+    except requests.RequestException as e:
+        raise EmbeddingRequestError(f"{type(e).__name__}: {e}") from e
+    
+    if response.status_code != 200:
+        # Throttling and server errors may pass; anything else is about the request itself
+        retryable = response.status_code in (408, 429) or response.status_code >= 500
+        raise EmbeddingRequestError(f"HTTP {response.status_code}", response.status_code, retryable)
+    
+    try:
+        data = response.json()
+        # Servers that ignore encoding_format still answer with number arrays
+        return as_matrix([
+            decode_base64(item["embedding"]) if isinstance(item["embedding"], str) else item["embedding"]
+            for item in data["data"]
+        ])
+    except (ValueError, KeyError, TypeError) as e:
+        raise EmbeddingRequestError(f"Malformed embedding response: {e}", response.status_code, False) from e
+
+def get_embedding_batch_stats() -> Dict[str, float]:
+    """Counters and current batch size of the adaptive embedding batcher"""
+    return _batch_sizer.stats()
+
+def next_embedding_batch(texts:List[str], max_batch_size:Optional[int]=None)->int:
+    """How many leading ``texts`` to send in the next request, given the current adaptive batch size"""
+    limit = _batch_sizer.size if max_batch_size is None else min(_batch_sizer.size, max_batch_size)
+    return next_batch_length(texts, limit)
+
+def iter_embedding_batches(texts:List[str], max_in_flight:int=None,
+                           max_batch_size:Optional[int]=None)->Iterator[Tuple[List[int], List[Optional[np.ndarray]]]]:
+    """Embed texts in adaptive, token-packed batches with up to ``max_in_flight`` requests outstanding.
+
+    Yields ``(indices, embeddings)`` in input order so callers can store each
+    batch while later ones are still in flight. Each batch is sized when it is
+    sent, so the batch size follows the server's observed latency and errors;
+    ``max_batch_size`` caps it. A text that could not be embedded gets None.
+    """
+    token_counts = [count_tokens(text) for text in texts]
+
+    def batches():
+        start = 0
+        while start < len(texts):
+            limit = _batch_sizer.size if max_batch_size is None else min(_batch_sizer.size, max_batch_size)
+            length = next_batch_length(texts[start:start + limit], limit, token_counts=token_counts[start:start + limit])
+            yield list(range(start, start + length))
+            start += length
+
+    max_in_flight = max(1, max_in_flight or EMBEDDING_MAX_IN_FLIGHT)
+    if max_in_flight == 1:
+        for indices in batches():
+            yield indices, embed_texts([texts[i] for i in indices])
+        return
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed") as executor:
+        pending = deque()
+        batch_iter = batches()
+        # Prime the window, then refill it as the oldest batch completes
+        for indices in itertools.islice(batch_iter, max_in_flight):
+            pending.append((indices, executor.submit(embed_texts, [texts[i] for i in indices])))
+        while pending:
+            indices, future = pending.popleft()
+            embeddings = future.result()
+            next_indices = next(batch_iter, None)
+            if next_indices is not None:
+                pending.append((next_indices, executor.submit(embed_texts, [texts[i] for i in next_indices])))
+            yield indices, embeddings
+
+def make_chunk_ids(texts: List[str], doc_keys: Optional[List[str]] = None,
+                   embedding_model: Optional[str] = None) -> List[str]:
+    """Build stable chunk IDs from document key, chunk offset and a hash of the model and content.
+
+    The offset counts chunks within each document, so the same chunk of the
+    same S3 object always maps to the same ID across uploads and processes.
+    The embedding model is hashed in too: after a model change every chunk
+    gets a new ID, so it is re-embedded rather than skipped as already stored.
+    """
+    if doc_keys is None:
+        doc_keys = ["unkeyed"] * len(texts)
+    model = (embedding_model or EMBEDDING_MODEL).encode("utf-8")
+    offsets = {}
+    ids = []
+    for text, key in zip(texts, doc_keys):
+        offset = offsets.get(key, 0)
+        offsets[key] = offset + 1
+        digest = hashlib.sha256(model + b"\0" + text.encode("utf-8")).hexdigest()[:16]
+        ids.append(f"{key}::{offset}::{digest}")
+    return ids
+
+def get_existing_metadatas(collection, ids: List[str], page_size: int = 500) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Stored metadata of those ``ids`` already in the collection (None for chunks stored without any)"""
+    existing = {}
+    for start in range(0, len(ids), page_size):
+        result = collection.get(ids=ids[start:start + page_size], include=["metadatas"])
+        found = result.get("ids", [])
+        existing.update(zip(found, result.get("metadatas") or [None] * len(found)))
+    return existing
+
+def update_changed_metadata(collection, ids: List[str], metadatas: List[Optional[Dict[str, Any]]],
+                            existing: Dict[str, Optional[Dict[str, Any]]], page_size: int = 500) -> int:
+    """Rewrite the metadata of already stored chunks where it differs from ``existing``; returns how many changed.
+
+    Chunks stored before metadata existed, or re-uploaded under another
+    patient ID, keep their vectors and only get the new metadata.
+    """
+    changed: Dict[str, Dict[str, Any]] = {}
+    for chunk_id, metadata in zip(ids, metadatas):
+        if not metadata or chunk_id not in existing or existing[chunk_id] == metadata:
+            continue
+        # Updates merge key by key; None drops keys the new metadata no longer has
+        stored = existing[chunk_id] or {}
+        changed[chunk_id] = {**{field: None for field in stored if field not in metadata}, **metadata}
+    changed_ids = list(changed)
+    for start in range(0, len(changed_ids), page_size):
+        page = changed_ids[start:start + page_size]
+        collection.update(ids=page, metadatas=[changed[chunk_id] for chunk_id in page])
+    return len(changed)
+
+def prepare_chunks(collection, texts: List[str], doc_keys: Optional[List[str]] = None,
+                   metadatas: Optional[List[Optional[Dict[str, Any]]]] = None) -> Dict[str, Any]:
+    """Clean and ID chunks and split off the ones already stored.
+
+    Stored chunks keep their vectors but take the new metadata, and any that
+    predate the lexical index are added to it. Returns the ``ids`` and cleaned
+    ``texts`` of every chunk, the ``existing`` IDs, how many had their
+    metadata updated, and the ``pending`` ``(id, text, metadata)`` triples
+    still to embed, each ID once.
+    """
+    texts = [clean_text(text) for text in texts]
+    ids = make_chunk_ids(texts, doc_keys)
+    if metadatas is None:
+        metadatas = [None] * len(texts)
+    existing = get_existing_metadatas(collection, ids)
+    metadata_updated = update_changed_metadata(collection, ids, metadatas, existing)
+    if metadata_updated:
+        print(f"🏷️  Updated the metadata of {metadata_updated} already indexed chunk(s)")
+        _collection_changed()
+    if existing:
+        # Chunks stored before the lexical index existed get picked up here
+        _index_lexical([chunk_id for chunk_id in ids if chunk_id in existing],
+                       [text for chunk_id, text in zip(ids, texts) if chunk_id in existing])
+    # The same chunk can appear twice in one call; embed it once
+    pending = {chunk_id: (text, metadata) for chunk_id, text, metadata in zip(ids, texts, metadatas)
+               if chunk_id not in existing}
+    return {"ids": ids, "texts": texts, "existing": set(existing), "metadata_updated": metadata_updated,
+            "pending": [(chunk_id, text, metadata) for chunk_id, (text, metadata) in pending.items()]}
+
+def store_chunks(collection, ids: List[str], texts: List[str], metadatas: List[Optional[Dict[str, Any]]],
+                 embeddings: np.ndarray) -> None:
+    """Upsert one embedded batch, add it to the lexical index and invalidate cached retrievals"""
+    upsert_args = {"documents": texts, "embeddings": embeddings, "ids": ids}
+    if all(metadatas):
+        upsert_args["metadatas"] = metadatas
+    collection.upsert(**upsert_args)
+    _index_lexical(ids, texts)
+    _collection_changed()
+
+def stale_chunk_ids(ids_by_key: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Per S3 key, the chunk IDs its last indexed version had that ``ids_by_key`` no longer has"""
+    previous = get_ledger_entries(CHROMA_COLLECTION, list(ids_by_key))
+    stale = {}
+    for key, ids in ids_by_key.items():
+        current = set(ids)
+        stale[key] = [chunk_id for chunk_id in previous.get(key, {}).get("chunk_ids", []) if chunk_id not in current]
+    return stale
+
+def finish_document(key: str, etag: Optional[str], ids: List[str], stale: List[str], chunking: str,
+                    metadata: Optional[Dict[str, Any]]) -> int:
+    """Record a fully stored S3 object in the index ledger, first deleting the chunks only its previous version had.
+
+    Call it only once every chunk in ``ids`` is stored, so a partial failure
+    keeps the old version searchable. Returns how many stale chunks were deleted.
+    """
+    deleted = 0
+    if stale:
+        print(f"🧹 Deleting {len(stale)} stale chunk(s) of {key}")
+        deleted = delete_chunks(stale)
+    record_indexed(CHROMA_COLLECTION, key, etag, EMBEDDING_MODEL, ids, chunking, metadata)
+    return deleted
+
+def create_chroma_collection(texts: List[str], batch_size: Optional[int] = None, doc_keys: Optional[List[str]] = None,
+                             metadatas: Optional[List[Dict[str, Any]]] = None):
+    """Create ChromaDB collection and upsert documents in batches.
+
+    ``doc_keys`` gives the source document (e.g. S3 key) of each text; chunks
+    whose ID is already in the collection are skipped without re-embedding.
+    ``metadatas`` (source, page, upload time, ...) are stored alongside each chunk.
+    Batches are sized adaptively; ``batch_size`` only caps them.
+    """
+    return index_chunks(texts, batch_size, doc_keys, metadatas)["collection"]
+
+def index_chunks(texts: List[str], batch_size: Optional[int] = None, doc_keys: Optional[List[str]] = None,
+                 metadatas: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Embed and upsert chunks, reporting which IDs were stored, skipped or failed"""
+    result = {"collection": None, "ids": [], "stored": 0, "skipped": 0, "metadata_updated": 0, "failed_ids": set()}
     try:
-        pass
-        
         # Ensure collection exists and is not soft deleted
         collection = ensure_collection_exists()
         if not collection:
-            return None
+            return result
+        
+        prepared = prepare_chunks(collection, texts, doc_keys, metadatas)
+        result["ids"] = prepared["ids"]
+        result["metadata_updated"] = prepared["metadata_updated"]
+        pending = prepared["pending"]
+        existing_ids = prepared["existing"]
+        result["skipped"] = len(existing_ids)
+        if existing_ids:
+            print(f"⏭️  Skipping {len(existing_ids)} chunk(s) that are already indexed")
         
-        # Process documents in batches
+        # Process documents in adaptive, token-packed batches
         total_stored = 0
-        for i in range(0, len(texts), batch_size):
-            batch_texts = [clean_text(text) for text in texts[i:i + batch_size]]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(texts) + batch_size - 1) // batch_size
-            
-            print(f"🧠 Processing batch {batch_num}/{total_batches} ({len(batch_texts)} documents)...")
-            
-            # Get embeddings for this batch
-            embeddings = get_embeddings(batch_texts)
-            
-            if not embeddings:
-                print(f"❌ Failed to get embeddings for batch {batch_num}, skipping...")
+        print(f"🧠 Embedding {len(pending)} chunk(s) with up to {EMBEDDING_MAX_IN_FLIGHT} request(s) in flight "
+              f"(batch size {_batch_sizer.size})...")
+        
+        pending_texts = [text for _, text, _ in pending]
+        for batch_index, (indices, embeddings) in enumerate(iter_embedding_batches(pending_texts, max_batch_size=batch_size)):
+            batch_num = batch_index + 1
+            # Only chunks that still failed after retries and bisection are left out
+            failed = [pending[i][0] for i, vector in zip(indices, embeddings) if vector is None]
+            if failed:
+                print(f"❌ Failed to embed {len(failed)} chunk(s) in batch {batch_num}")
+                result["failed_ids"].update(failed)
+            batch = [(pending[i], vector) for i, vector in zip(indices, embeddings) if vector is not None]
+            if not batch:
                 continue
+            batch_ids = [chunk_id for (chunk_id, _, _), _ in batch]
+            batch_texts = [text for (_, text, _), _ in batch]
+            batch_metadatas = [metadata for (_, _, metadata), _ in batch]
+            # One contiguous float32 matrix per batch, not a list of Python float lists
+            embeddings = as_matrix([vector for _, vector in batch])
             
-            if len(embeddings) != len(batch_texts):
-                print(f"⚠️  Warning: Got {len(embeddings)} embeddings for {len(batch_texts)} texts in batch {batch_num}")
-                # Truncate to match
-                min_len = min(len(embeddings), len(batch_texts))
-                embeddings = embeddings[:min_len]
-                batch_texts = batch_texts[:min_len]
-            
-            # Prepare documents for storage
-            batch_ids = [f"doc_{i+j}_{hash(text[:50])}" for j, text in enumerate(batch_texts)]
-            
-            # Add documents to collection
+            # Upsert documents into collection
             print(f"💾 Storing batch {batch_num} ({len(batch_texts)} documents) in ChromaDB...")
-            collection.add(
-                documents=batch_texts,
-                embeddings=embeddings,
-                ids=batch_ids
-            )
+            store_chunks(collection, batch_ids, batch_texts, batch_metadatas, embeddings)
             
             total_stored += len(batch_texts)
             print(f"✅ Batch {batch_num} stored successfully. Total stored: {total_stored}")
         
-        print(f"🎉 Successfully stored {total_stored}/{len(texts)} documents in ChromaDB collection '{CHROMA_COLLECTION}'")
-        return collection
+        print(f"🎉 Successfully stored {total_stored}/{len(pending)} new documents in ChromaDB collection '{CHROMA_COLLECTION}' ({len(existing_ids)} unchanged)")
+        cache_stats = get_cache_stats()
+        print(f"🗃️  Embedding cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} entries)")
+        batch_stats = get_embedding_batch_stats()
+        print(f"📦 Embedding batches: size now {batch_stats['batch_size']}, {batch_stats['retries']} retries, "
+              f"{batch_stats['bisections']} bisections, {batch_stats['texts_per_second']:.0f} texts/s")
+        result["collection"] = collection
+        result["stored"] = total_stored
+        return result
         
     except Exception as e:
         print(f"❌ Error creating ChromaDB collection: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        reset_chroma_connection()
+        result["failed_ids"] = set(result["ids"])
+        return result
+
+def delete_chunks(ids: List[str], page_size: int = 500) -> int:
+    """Delete chunks by ID from the collection and return how many were requested"""
+    if not ids:
+        return 0
+    collection = ensure_collection_exists()
+    if not collection:
+        return 0
+    try:
+        for start in range(0, len(ids), page_size):
+            collection.delete(ids=ids[start:start + page_size])
+        get_lexical_index(CHROMA_COLLECTION).delete(ids)
+    finally:
+        _collection_changed()
+    return len(ids)
+
+def index_s3_documents(chunks: List[str], chunk_keys: List[str], etags: Dict[str, Optional[str]], chunking: str,
+                       batch_size: Optional[int] = None, metadatas: Optional[List[Dict[str, Any]]] = None,
+                       document_metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Index the chunks of whole S3 objects, split with the ``chunking`` config, and keep the index ledger in step.
+
+    Chunks an earlier version of an object had but this one doesn't are
+    deleted once every new chunk of that object is stored, and only then is
+    the object recorded in the ledger, so a partial failure keeps the old
+    version searchable and is retried on the next import.
+
+    ``document_metadata`` maps each key to the document-level part of its
+    chunks' metadata, which the ledger keeps to spot later metadata changes.
+    """
+    result = index_chunks(chunks, batch_size, chunk_keys, metadatas)
+    result["stale_deleted"] = 0
+    if not result["collection"]:
+        return result
+    ids_by_key: Dict[str, List[str]] = {}
+    for chunk_id, key in zip(result["ids"], chunk_keys):
+        ids_by_key.setdefault(key, []).append(chunk_id)
+    stale = stale_chunk_ids(ids_by_key)
+    for key, ids in ids_by_key.items():
+        if not result["failed_ids"].intersection(ids):
+            result["stale_deleted"] += finish_document(key, etags.get(key), ids, stale[key], chunking,
+                                                       (document_metadata or {}).get(key))
+    return result
+
+def remove_indexed_documents(s3_keys: List[str]) -> int:
+    """Delete every chunk of the given S3 objects and forget them in the ledger"""
+    entries = get_ledger_entries(CHROMA_COLLECTION, s3_keys)
+    deleted = delete_chunks([chunk_id for entry in entries.values() for chunk_id in entry["chunk_ids"]])
+    remove_ledger_entries(CHROMA_COLLECTION, list(entries))
+    return deleted
+
+def prune_removed_documents(live_keys: Set[str], prefix: str = "documents/") -> int:
+    """Delete chunks of indexed objects under ``prefix`` that are no longer in S3"""
+    removed = [key for key in ledger_indexed_keys(CHROMA_COLLECTION, prefix) if key not in live_keys]
+    if not removed:
+        return 0
+    deleted = remove_indexed_documents(removed)
+    print(f"🧹 Removed {deleted} chunk(s) of {len(removed)} document(s) deleted from S3")
+    return deleted
 
 def clear_chroma_collection():
     """Clear all documents from ChromaDB collection"""
@@ -131,65 +489,173 @@ def clear_chroma_collection():
     except Exception as e:
         print(f"❌ Error clearing ChromaDB collection: {e}")
         return False
+    finally:
+        # The cached handle points at the deleted collection
+        reset_chroma_connection()
+        clear_ledger(CHROMA_COLLECTION)
+        get_lexical_index(CHROMA_COLLECTION).clear()
+        _collection_changed()
+
+def _connect_collection(client):
+    """Get the collection from ChromaDB, creating it if it doesn't exist or is soft deleted"""
+    try:
+        # Try to get existing collection
+        collection = client.get_collection(CHROMA_COLLECTION)
+        print(f"📂 Using existing collection: {CHROMA_COLLECTION}")
+        return collection
+    except Exception as e:
+        print(f"📂 Collection doesn't exist or is soft deleted: {e}")
+        # Create new collection
+        collection = client.create_collection(CHROMA_COLLECTION)
+        print(f"📂 Created new collection: {CHROMA_COLLECTION}")
+        return collection
 
 def ensure_collection_exists():
-    """Ensure ChromaDB collection exists and is not soft deleted"""
+    """Return the cached ChromaDB collection, reconnecting if it is missing or unhealthy"""
+    global _chroma_collection, _chroma_checked_at
     try:
-        client = get_chroma_client()
-        try:
-            # Try to get existing collection
-            collection = client.get_collection(CHROMA_COLLECTION)
-            print(f"📂 Using existing collection: {CHROMA_COLLECTION}")
-            return collection
-        except Exception as e:
-            print(f"📂 Collection doesn't exist or is soft deleted: {e}")
-            # Create new collection
-            collection = client.create_collection(CHROMA_COLLECTION)
-            print(f"📂 Created new collection: {CHROMA_COLLECTION}")
-            return collection
+        with _chroma_lock:
+            now = time.monotonic()
+            if _chroma_collection is not None and now - _chroma_checked_at < CHROMA_HEALTHCHECK_INTERVAL:
+                return _chroma_collection
+            
+            if _chroma_collection is not None:
+                # Cheap health check before trusting the cached handle again
+                try:
+                    get_chroma_client().heartbeat()
+                    _chroma_checked_at = now
+                    return _chroma_collection
+                except Exception as e:
+                    print(f"🔌 ChromaDB health check failed, reconnecting: {e}")
+                    reset_chroma_connection()
+            
+            _chroma_collection = _connect_collection(get_chroma_client())
+            print(f"🗄️  Vector store backend: {VECTOR_BACKEND}")
+            _chroma_checked_at = time.monotonic()
+            return _chroma_collection
     except Exception as e:
         print(f"❌ Error ensuring collection exists: {e}")
+        reset_chroma_connection()
         return None
 
-def retrieve_relevant_docs(query: str, k: int = 10):
-    """Retrieve relevant documents from ChromaDB"""
-    try:
-        # Ensure collection exists
+def build_where(sources: Optional[List[str]] = None, patient_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Metadata filter scoping retrieval to some documents and/or one patient (None searches everything)"""
+    clauses = []
+    if sources:
+        clauses.append({"source": {"$in": list(sources)}})
+    if patient_id:
+        clauses.append({"patient_id": patient_id})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def list_indexed_documents(prefix: str = "") -> List[str]:
+    """S3 keys of the documents fully indexed in the collection, for choosing a retrieval scope"""
+    return sorted(ledger_indexed_keys(CHROMA_COLLECTION, prefix))
+
+def _query_collection(query_embeddings, k: int, where: Optional[Dict[str, Any]] = None):
+    """Query the cached collection, reconnecting once if the handle has gone stale"""
+    for attempt in range(2):
         collection = ensure_collection_exists()
         if not collection:
-            print("❌ Failed to ensure collection exists for retrieval")
-            return []
+            return None
+        try:
+            return collection.query(
+                query_embeddings=query_embeddings,
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas"]
+            )
+        except Exception as e:
+            if attempt:
+                raise
+            print(f"🔌 ChromaDB query failed, reconnecting: {e}")
+            reset_chroma_connection()
+
+def _to_documents(results: List[tuple]):
+    documents = []
+    for chunk_id, doc, metadata in results:
+        # Create a document-like object for compatibility
+        class Document:
+            def __init__(self, content, chunk_id=None, metadata=None):
+                self.page_content = content
+                self.id = chunk_id
+                self.metadata = metadata or {}
+        
+        documents.append(Document(doc, chunk_id, metadata))
+    return documents
+
+def _fuse_lexical(query: str, dense: List[tuple], k: int, n_candidates: int,
+                  where: Optional[Dict[str, Any]] = None) -> List[tuple]:
+    """Reciprocal-rank-fuse dense ``(id, text, metadata)`` candidates with BM25 candidates"""
+    try:
+        # BM25 knows nothing about metadata: with a filter, over-fetch and drop the chunks outside it
+        lexical_k = n_candidates * HYBRID_CANDIDATES if where else n_candidates
+        lexical_ids = [chunk_id for chunk_id, _ in get_lexical_index(CHROMA_COLLECTION).search(query, lexical_k)]
+    except Exception as e:
+        print(f"⚠️ Lexical search failed, using dense results only: {e}")
+        return dense
+    found = {chunk_id: (text, metadata) for chunk_id, text, metadata in dense}
+    collection = ensure_collection_exists()
+    if where and lexical_ids:
+        if not collection:
+            return dense
+        fetched = collection.get(ids=lexical_ids, where=where, include=["documents", "metadatas"])
+        found.update(zip(fetched["ids"], zip(fetched["documents"], fetched["metadatas"])))
+        lexical_ids = [chunk_id for chunk_id in lexical_ids if chunk_id in found][:n_candidates]
+    fused = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([[chunk_id for chunk_id, _, _ in dense], lexical_ids])[:k]]
+    # Chunks only BM25 found still need their text
+    missing = [chunk_id for chunk_id in fused if chunk_id not in found]
+    if missing and collection:
+        fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+        found.update(zip(fetched["ids"], zip(fetched["documents"], fetched["metadatas"])))
+    return [(chunk_id, *found[chunk_id]) for chunk_id in fused if chunk_id in found and found[chunk_id][0] is not None]
+
+def retrieve_relevant_docs(query: str, k: int = 10, query_embedding: Optional[List[float]] = None,
+                           where: Optional[Dict[str, Any]] = None):
+    """Retrieve relevant documents from ChromaDB.
+
+    Pass ``query_embedding`` if the caller already embedded the query, and a
+    ``where`` metadata filter (see ``build_where``) to search only some documents.
+    Results are memoized for RETRIEVAL_CACHE_TTL seconds per (query, k, filter,
+    collection version). With HYBRID_RETRIEVAL on, dense and BM25 candidates are
+    fused by reciprocal rank. Returned documents carry their chunk ``metadata``.
+    """
+    try:
+        start = time.perf_counter()
+        where_key = json.dumps(where, sort_keys=True) if where else None
+        cache_key = (query, k, where_key, HYBRID_RETRIEVAL, collection_version(CHROMA_COLLECTION))
+        cached = _retrieval_cache.get(cache_key)
+        if cached is not None:
+            return _to_documents(cached)
         
         # Get query embedding
-        query_embeddings = get_embeddings([query])
+        query_embedding = query_embedding or get_query_embedding(query)
+        embedded_at = time.perf_counter()
         
-        if not query_embeddings:
+        # Ensure we have a valid embedding
+        if not query_embedding:
             print("Failed to get query embedding")
             return []
         
-        # Ensure we have a valid embedding
-        if not query_embeddings[0]:
-            print("Empty query embedding")
+        # Search for similar documents (more candidates when they will be fused)
+        n_candidates = k * HYBRID_CANDIDATES if HYBRID_RETRIEVAL else k
+        results = _query_collection([query_embedding], n_candidates, where)
+        if results is None:
+            print("❌ Failed to ensure collection exists for retrieval")
             return []
         
-        # Search for similar documents
-        results = collection.query(
-            query_embeddings=query_embeddings,
-            n_results=k
-        )
-        
         # Format results for compatibility
-        documents = []
+        pairs = []
         if results['documents'] and results['documents'][0]:
-            for i, doc in enumerate(results['documents'][0]):
-                # Create a document-like object for compatibility
-                class Document:
-                    def __init__(self, content):
-                        self.page_content = content
-                
-                documents.append(Document(doc))
-        
-        return documents
+            metadatas = (results.get('metadatas') or [None])[0] or [None] * len(results['ids'][0])
+            pairs = list(zip(results['ids'][0], results['documents'][0], metadatas))
+        if HYBRID_RETRIEVAL:
+            pairs = _fuse_lexical(query, pairs, k, n_candidates, where)
+        pairs = pairs[:k]
+        print(f"🔎 Retrieval took {(time.perf_counter() - start) * 1000:.0f} ms (embedding {(embedded_at - start) * 1000:.0f} ms)")
+        _retrieval_cache.put(cache_key, pairs)
+        return _to_documents(pairs)
         
     except Exception as e:
         print(f"Error retrieving documents from ChromaDB: {e}")
@@ -0,0 +1,51 @@
+"""
+Chroma Connection Benchmark
+Compares acquiring the collection the old way (new CloudClient + get_collection
+on every query) against the cached, health-checked handle.
+
+Usage:
+    python benchmarks/bench_chroma_client.py [iterations]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import vectorstore_utils as vs
+
+
+def _time_ms(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _summary(name, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<28} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+    return p50
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    def reconnect_per_query():
+        vs._connect_collection(vs._new_chroma_client())
+
+    vs.ensure_collection_exists()  # warm the cache
+
+    before = _summary("reconnect per query", _time_ms(reconnect_per_query, iterations))
+    after = _summary("cached collection", _time_ms(vs.ensure_collection_exists, iterations))
+    print(f"Latency saved per query: {before - after:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Chunking Benchmark
+Builds a corpus by replicating the sample_data/ PDFs N times (1,000 by
+default) and reports chunks/sec and peak memory for:
+
+- legacy:   a new RecursiveCharacterTextSplitter per call, one text at a time
+- inline:   the shared splitter in chunk_utils, in-process
+- parallel: iter_document_chunks on the chunking process pool
+
+The corpus is generated lazily from the extracted sample pages, and every
+mode runs in its own subprocess so memory peaks don't leak between runs.
+Peak RSS is reported for the driver process and for the largest pool worker.
+
+Usage:
+    python benchmarks/bench_chunking.py [replicas] [workers]
+"""
+
+import glob
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("legacy", "inline", "parallel")
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _sample_pages():
+    from app.pdf_utils import iter_clean_pages
+
+    return [(os.path.basename(path), list(iter_clean_pages(path)))
+            for path in sorted(glob.glob(os.path.join(ROOT, "sample_data", "*.pdf")))]
+
+
+def _corpus(samples, replicas):
+    for replica in range(replicas):
+        for filename, pages in samples:
+            yield {"key": f"documents/replica_{replica}/{filename}", "pages": pages}
+
+
+def _legacy_chunks(corpus):
+    """get_document_chunks as it was: a fresh splitter for every call"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from app.pdf_utils import join_pages
+
+    for document in corpus:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+        )
+        text, _ = join_pages(document["pages"])
+        yield from text_splitter.split_text(text)
+
+
+def _run(mode, replicas, workers):
+    from app.chunk_utils import iter_document_chunks
+
+    samples = _sample_pages()
+    characters = replicas * sum(len(text) for _, pages in samples for _, text in pages)
+    start = time.perf_counter()
+    if mode == "legacy":
+        chunks = sum(1 for _ in _legacy_chunks(_corpus(samples, replicas)))
+    else:
+        chunks = sum(1 for _ in iter_document_chunks(_corpus(samples, replicas),
+                                                     max_workers=1 if mode == "inline" else workers))
+    elapsed = time.perf_counter() - start
+    print(f"{mode:<9} {chunks:>9} chunks  {elapsed:7.2f} s  {chunks / elapsed:>10,.0f} chunks/s  "
+          f"{characters / elapsed / 1e6:6.1f} MB/s  peak RSS {_peak_rss_mb():7.1f} MB "
+          f"(workers {_peak_rss_mb(resource.RUSAGE_CHILDREN):6.1f} MB)")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        _run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    replicas = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    files = len(glob.glob(os.path.join(ROOT, "sample_data", "*.pdf")))
+    print(f"{files} sample PDFs × {replicas} replicas = {files * replicas} documents, {workers} worker(s)")
+    for mode in MODES:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--run", mode, str(replicas), str(workers)],
+                       check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+clean_text Micro-benchmark
+Measures cleaning throughput (MB/s) on the raw text of the sample_data/ PDFs,
+comparing the original three-pass regex cleaner with the precompiled
+single-pass one, plus the cost of re-cleaning already cleaned text.
+
+Usage:
+    python benchmarks/bench_clean_text.py [target_megabytes]
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.pdf_utils import clean_text, iter_pdf_pages
+
+
+def legacy_clean_text(text: str) -> str:
+    """clean_text as it was before the single-pass rewrite"""
+    if not text:
+        return ""
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\n\s*\n', '\n', text)
+    return text.strip()
+
+
+def _throughput(func, pages, megabytes, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            func(page)
+        best = min(best, time.perf_counter() - start)
+    return megabytes / best
+
+
+def main():
+    target_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+
+    raw_pages = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "sample_data", "*.pdf"))):
+        raw_pages.extend(text for _, text in iter_pdf_pages(path))
+    if not raw_pages:
+        print("No text found in sample_data/")
+        return
+
+    # Replicate the sample pages until the corpus reaches the target size
+    sample_bytes = sum(len(page.encode("utf-8")) for page in raw_pages)
+    copies = max(1, int(target_mb * 1024 * 1024 / sample_bytes))
+    pages = raw_pages * copies
+    megabytes = sample_bytes * copies / (1024 * 1024)
+
+    assert all(legacy_clean_text(page) == clean_text(page) for page in raw_pages)
+
+    before = _throughput(legacy_clean_text, pages, megabytes)
+    after = _throughput(clean_text, pages, megabytes)
+    cleaned = [clean_text(page) for page in pages]
+    recleaned = _throughput(clean_text, cleaned, megabytes)
+
+    print(f"Corpus: {len(raw_pages)} sample pages × {copies} = {megabytes:.1f} MB")
+    print(f"three-pass clean_text     {before:9.1f} MB/s")
+    print(f"single-pass clean_text    {after:9.1f} MB/s  ({after / before:.2f}x)")
+    print(f"re-clean of CleanText     {recleaned:9.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
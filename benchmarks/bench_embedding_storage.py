@@ -0,0 +1,150 @@
+"""
+Embedding Storage Benchmark
+Compares the ways an embedding can be held and stored:
+
+- list:    List[List[float]] as parsed from a JSON response (the old in-memory format)
+- float32: one contiguous NumPy matrix (lossless)
+- float16: half-precision matrix
+- int8:    scalar-quantized codes plus one float32 scale per vector
+
+For each corpus size it reports memory footprint, serialization cost
+(response parsing and embedding-cache blob encode/decode) and recall@k of
+exact search over the quantized vectors against exact float32 search.
+
+The corpus is synthetic: normalised vectors scattered around random cluster
+centres, which is closer to real sentence embeddings than uniform noise.
+List memory is measured on a sample and extrapolated; building a million
+Python float lists would take tens of gigabytes.
+
+Usage:
+    python benchmarks/bench_embedding_storage.py [sizes] [dim] [num_queries]
+    python benchmarks/bench_embedding_storage.py 100000,1000000 384 200
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.embedding_codec import CODECS, as_matrix, decode, decode_base64, encode, from_bytes, inner_products
+
+K = 10
+SAMPLE = 10000
+RESPONSE_BATCH = 128
+BLOCK = 65536
+
+
+def _corpus(num_vectors, dim, rng):
+    """Clustered unit vectors, generated block by block into one float32 matrix"""
+    centres = rng.standard_normal((max(1, num_vectors // 1000), dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    vectors = np.empty((num_vectors, dim), dtype=np.float32)
+    for start in range(0, num_vectors, BLOCK):
+        block = vectors[start:start + BLOCK]
+        block[:] = centres[rng.integers(len(centres), size=len(block))]
+        block += rng.standard_normal(block.shape, dtype=np.float32) / np.sqrt(dim)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+def _top_k(matrix, queries, codec):
+    """Exact top-k row indices of every query, scoring the (encoded) matrix one block at a time"""
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(matrix), BLOCK):
+        block = decode(matrix[start:start + BLOCK], codec)
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))],
+                              axis=1)
+        keep = np.argpartition(-scores, K - 1, axis=1)[:, :K]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    return best_rows
+
+
+def _timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _list_bytes_per_vector(sample):
+    """Traced allocation of json.loads'd embeddings, the way they used to sit in memory"""
+    body = json.dumps({"data": [{"embedding": row} for row in sample.tolist()]})
+    tracemalloc.start()
+    embeddings = [item["embedding"] for item in json.loads(body)["data"]]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del embeddings
+    return size / len(sample)
+
+
+def _serialization(sample):
+    batch = sample[:RESPONSE_BATCH]
+    float_body = json.dumps({"data": [{"embedding": row} for row in batch.tolist()]})
+    base64_body = json.dumps({"data": [{"embedding": base64.b64encode(row.astype("<f4").tobytes()).decode()}
+                                        for row in batch]})
+    per_vector = 1e6 / len(batch)
+    print(f"  response parsing, {RESPONSE_BATCH} vectors (µs/vector):")
+    print(f"    {'float JSON -> list':<28} {_timed(lambda: [i['embedding'] for i in json.loads(float_body)['data']]) * per_vector:8.2f}"
+          f"   {len(float_body) / len(batch):8.0f} B/vector on the wire")
+    print(f"    {'float JSON -> float32':<28} {_timed(lambda: as_matrix([i['embedding'] for i in json.loads(float_body)['data']])) * per_vector:8.2f}")
+    print(f"    {'base64 JSON -> float32':<28} {_timed(lambda: as_matrix([decode_base64(i['embedding']) for i in json.loads(base64_body)['data']])) * per_vector:8.2f}"
+          f"   {len(base64_body) / len(batch):8.0f} B/vector on the wire")
+
+    per_vector = 1e6 / len(sample)
+    print(f"  embedding-cache blobs, {len(sample)} vectors (µs/vector):")
+    for codec in CODECS:
+        blobs = [row.tobytes() for row in encode(sample, codec)]
+        encode_s = _timed(lambda: [row.tobytes() for row in encode(sample, codec)])
+        decode_s = _timed(lambda: [from_bytes(blob, codec) for blob in blobs])
+        print(f"    {codec:<8} encode {encode_s * per_vector:6.2f}   decode {decode_s * per_vector:6.2f}   "
+              f"{len(blobs[0]):6d} B/vector")
+
+
+def _run(num_vectors, dim, num_queries, list_bytes, rng):
+    print(f"\n{num_vectors:,} vectors × {dim} dims, {num_queries} queries")
+    vectors = _corpus(num_vectors, dim, rng)
+    queries = vectors[rng.choice(num_vectors, num_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32) / np.sqrt(dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"  {'list':<8} {list_bytes * num_vectors / 2**20:10,.1f} MB  (extrapolated from {SAMPLE:,} parsed vectors)")
+    truth = _top_k(vectors, queries, "float32")
+    for codec in CODECS:
+        start = time.perf_counter()
+        encoded = vectors if codec == "float32" else encode(vectors, codec)
+        encode_s = time.perf_counter() - start
+        found = _top_k(encoded, queries, codec)
+        recall = np.mean([len(set(a) & set(b)) / K for a, b in zip(truth.tolist(), found.tolist())])
+        scan_ms = _timed(lambda: inner_products(encoded, queries[0], codec)) * 1000
+        print(f"  {codec:<8} {encoded.nbytes / 2**20:10,.1f} MB   recall@{K} {recall:6.3f}   "
+              f"encode {encode_s:6.2f} s   full scan {scan_ms:8.1f} ms/query")
+        del encoded
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1].split(",")] if len(sys.argv) > 1 else [100000, 1000000]
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    num_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    rng = np.random.default_rng(0)
+    sample = _corpus(SAMPLE, dim, rng)
+    list_bytes = _list_bytes_per_vector(sample)
+    print(f"{dim} dims: {list_bytes:,.0f} B/vector as a list of floats vs {4 * dim:,} B as float32")
+    _serialization(sample)
+    for num_vectors in sizes:
+        _run(num_vectors, dim, num_queries, list_bytes, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Hybrid Retrieval Benchmark
+Indexes the sample_data/ PDFs into a throwaway flat index plus the BM25 index,
+then asks exact-term questions (drug names with doses, lab values, vitals)
+taken from the chunks themselves. Reports recall@k and retrieval latency for
+pure vector search against BM25 + vector fused by reciprocal rank.
+
+Query embeddings come from the configured embedding endpoint.
+
+Usage:
+    python benchmarks/bench_hybrid_retrieval.py [chunk_size] [max_queries]
+"""
+
+import glob
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix="bench-hybrid-")
+os.environ.update({
+    "VECTOR_BACKEND": "flat",
+    "FLAT_INDEX_PATH": os.path.join(_workdir, "flat"),
+    "LEXICAL_INDEX_DIR": os.path.join(_workdir, "lexical"),
+    "INDEX_LEDGER_PATH": os.path.join(_workdir, "ledger.sqlite3"),
+    "CHROMA_COLLECTION": "bench_hybrid",
+})
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app import vectorstore_utils as vs
+from app.pdf_utils import clean_text, iter_pdf_pages
+
+K_VALUES = (1, 3, 5)
+
+# A term followed by a number and optional unit: "Metformin 500 mg", "HbA1c: 7.2%", "BP 130/85 mmHg"
+_EXACT_TERM_RE = re.compile(
+    r"\b[A-Za-z][A-Za-z0-9\-]{2,}:?\s+\d+(?:[./]\d+)?\s*(?:mg/dL|mmol/L|mmHg|mg|mcg|mL|ml|%|bpm|units|IU)?",
+)
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def _load_chunks(chunk_size):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_size // 5)
+    chunks, keys = [], []
+    for path in sorted(glob.glob(os.path.join(ROOT, "sample_data", "*.pdf"))):
+        text = clean_text("\n".join(page for _, page in iter_pdf_pages(path)))
+        for chunk in splitter.split_text(text):
+            chunks.append(chunk)
+            keys.append(os.path.basename(path))
+    return chunks, keys
+
+
+def _make_queries(chunks, ids, max_queries):
+    """Exact-term queries with every chunk that contains the term as ground truth"""
+    queries = {}
+    for chunk in chunks:
+        for match in _EXACT_TERM_RE.finditer(chunk):
+            term = match.group(0).strip()
+            if term.lower() not in queries:
+                relevant = {chunk_id for chunk_id, text in zip(ids, chunks) if term.lower() in text.lower()}
+                queries[term.lower()] = (term, relevant)
+    return list(queries.values())[:max_queries]
+
+
+def _run(name, queries, embeddings):
+    recall = {}
+    latencies = []
+    for k in K_VALUES:
+        hits = 0
+        for (term, relevant), embedding in zip(queries, embeddings):
+            vs._retrieval_cache.clear()
+            start = time.perf_counter()
+            docs = vs.retrieve_relevant_docs(term, k, query_embedding=embedding)
+            if k == max(K_VALUES):
+                latencies.append((time.perf_counter() - start) * 1000)
+            hits += bool(relevant & {doc.id for doc in docs})
+        recall[k] = hits / len(queries)
+    recall_text = "  ".join(f"recall@{k} {recall[k]:.2f}" for k in K_VALUES)
+    print(f"{name:<16} {recall_text}   p50 {statistics.median(latencies):6.2f} ms   "
+          f"p99 {_percentile(latencies, 0.99):6.2f} ms")
+
+
+def main():
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    max_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    chunks, keys = _load_chunks(chunk_size)
+    if not chunks:
+        print("No text found in sample_data/")
+        return
+    result = vs.index_chunks(chunks, batch_size=32, doc_keys=keys)
+    if result["collection"] is None or result["failed_ids"]:
+        print("Indexing failed; is the embedding endpoint configured?")
+        return
+    queries = _make_queries([clean_text(chunk) for chunk in chunks], result["ids"], max_queries)
+    if not queries:
+        print("No exact-term queries found in the sample chunks")
+        return
+    embeddings = [vs.get_query_embedding(term) for term, _ in queries]
+
+    print(f"{len(chunks)} chunks of ~{chunk_size} chars, {len(queries)} exact-term queries")
+    vs.HYBRID_RETRIEVAL = False
+    _run("vector only", queries, embeddings)
+    vs.HYBRID_RETRIEVAL = True
+    _run("BM25 + vector", queries, embeddings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+S3 Import Memory Benchmark
+Uploads N large PDFs (built by repeating the sample_data/ pages) and reports the
+peak RSS of importing them with each download strategy. Every strategy runs in
+its own subprocess so peaks don't leak between runs.
+
+Point S3_ENDPOINT_URL at a scratch bucket (e.g. `moto_server` or MinIO).
+
+Usage:
+    python benchmarks/bench_s3_import_memory.py [num_files] [pages_per_file]
+"""
+
+import glob
+import os
+import resource
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PREFIX = "documents/bench-memory/"
+MODES = ("buffered", "spooled", "tempfile")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _build_pdf(pages_per_file: int) -> bytes:
+    from pypdf import PdfReader, PdfWriter
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "sample_data", "*.pdf"))):
+        pages.extend(PdfReader(path).pages)
+    writer = PdfWriter()
+    for i in range(pages_per_file):
+        writer.add_page(pages[i % len(pages)])
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _upload(num_files: int, pages_per_file: int):
+    from app.s3_utils import S3_CONFIG, get_s3_client
+
+    s3 = get_s3_client()
+    body = _build_pdf(pages_per_file)
+    keys = []
+    for i in range(num_files):
+        key = f"{PREFIX}report_{i}.pdf"
+        s3.put_object(Bucket=S3_CONFIG["bucket"], Key=key, Body=body, ContentType="application/pdf")
+        keys.append(key)
+    return keys, len(body)
+
+
+def _import(mode: str, keys):
+    from app.pdf_utils import extract_text_from_pdf, extract_texts_parallel
+    from app.s3_utils import download_from_s3, download_many_to_files, open_s3_document
+
+    start = time.perf_counter()
+    if mode == "buffered":
+        # The old path: whole object in memory, then a second copy in BytesIO
+        for key in keys:
+            content = download_from_s3(key)["content"]
+            extract_text_from_pdf(BytesIO(content))
+    elif mode == "spooled":
+        for key in keys:
+            with open_s3_document(key) as spool:
+                extract_text_from_pdf(spool)
+    else:
+        results = download_many_to_files(keys)
+        paths = [result["path"] for result in results]
+        try:
+            extract_texts_parallel(paths)
+        finally:
+            for path in paths:
+                os.unlink(path)
+    print(f"{mode:<10} peak RSS {_peak_rss_mb():8.1f} MB   {time.perf_counter() - start:6.2f} s")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        _import(sys.argv[2], sys.argv[3:])
+        return
+
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    pages_per_file = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    keys, size = _upload(num_files, pages_per_file)
+    print(f"{num_files} files × {size / (1024 * 1024):.1f} MB")
+    for mode in MODES:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--run", mode, *keys], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Vector Backend Benchmark
+Loads the same synthetic, normalised embeddings into each local backend and
+reports recall@k against exact search plus p50/p99 query latency.
+
+Usage:
+    python benchmarks/bench_vector_backends.py [num_vectors] [dim] [num_queries]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import vector_backends
+
+K = 10
+BATCH = 1000
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def _load(collection, ids, vectors):
+    for start in range(0, len(ids), BATCH):
+        collection.upsert(
+            ids=ids[start:start + BATCH],
+            embeddings=vectors[start:start + BATCH].tolist(),
+            documents=ids[start:start + BATCH]
+        )
+
+
+def _run(name, collection, ids, queries, truth):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=K, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(result["ids"][0]) & expected)
+    recall = hits / (len(queries) * K)
+    print(f"{name:<22} recall@{K} {recall:6.3f}   p50 {statistics.median(latencies):8.2f} ms   "
+          f"p99 {_percentile(latencies, 0.99):8.2f} ms")
+
+
+def main():
+    num_vectors = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    num_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(num_vectors, num_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    ids = [f"vec_{i}" for i in range(num_vectors)]
+
+    # Exact cosine top-k is the ground truth for recall
+    scores = queries @ vectors.T
+    truth = [set(ids[j] for j in np.argsort(-row)[:K]) for row in scores]
+
+    print(f"{num_vectors} vectors × {dim} dims, {num_queries} queries")
+    with tempfile.TemporaryDirectory() as tmp:
+        flat = vector_backends.FlatClient(os.path.join(tmp, "flat")).create_collection("bench")
+        _load(flat, ids, vectors)
+        _run("flat (exact)", flat, ids, queries, truth)
+
+        if vector_backends.hnswlib is not None:
+            vector_backends.FLAT_INDEX_HNSW_MIN_SIZE = 0
+            hnsw = vector_backends.FlatClient(os.path.join(tmp, "flat"), use_hnsw=True).get_collection("bench")
+            hnsw.query(query_embeddings=[queries[0].tolist()], n_results=K)  # build the graph
+            _run("flat + hnsw", hnsw, ids, queries, truth)
+
+        try:
+            import chromadb
+        except ImportError:
+            print("chromadb not installed, skipping chroma_local")
+        else:
+            client = chromadb.PersistentClient(path=os.path.join(tmp, "chroma"))
+            chroma = client.create_collection("bench", metadata={"hnsw:space": "cosine"})
+            _load(chroma, ids, vectors)
+            _run("chroma_local", chroma, ids, queries, truth)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+RAG API Load Test
+Starts local stub embedding and LLM servers, seeds a flat vector index, launches
+the API under uvicorn and fires concurrent streaming queries at it. Reports
+QPS and p50/p90/p99 latency to the first answer token and to the full answer.
+
+Pass --url to load-test an already running deployment instead (no stubs),
+with --api-key (or API_KEY in the environment) for its authentication.
+
+Usage:
+    python benchmarks/load_test_api.py [--requests 500] [--concurrency 32] [--workers 2]
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DIM = 64
+
+
+# ---- stub backends ----
+def _fake_embedding(text):
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(DIM)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+def _make_stub_handler(embed_delay, ttft, tokens, token_delay):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _json(self, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path.endswith("/embeddings"):
+                time.sleep(embed_delay)
+                texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+                self._json({"data": [{"index": i, "embedding": _fake_embedding(t)} for i, t in enumerate(texts)]})
+                return
+            words = [f"word{i} " for i in range(tokens)]
+            if not request.get("stream"):
+                time.sleep(ttft + token_delay * tokens)
+                self._json({"choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}}]})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            time.sleep(ttft)
+            for word in words:
+                chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": word}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return StubHandler
+
+
+def _start_stub(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _seed_index(chunks):
+    from app.vectorstore_utils import create_chroma_collection
+    texts = [f"Synthetic lab report {i}: haemoglobin {10 + i % 7} g/dL, glucose {80 + i % 40} mg/dL." for i in range(chunks)]
+    if create_chroma_collection(texts, batch_size=64) is None:
+        raise SystemExit("Failed to seed the vector index")
+
+
+def _wait_healthy(base_url, timeout=60):
+    parsed = urlparse(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=2)
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"API at {base_url} did not become healthy")
+
+
+# ---- load generation ----
+def _one_request(base_url, question, api_key):
+    parsed = urlparse(base_url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=120)
+    start = time.perf_counter()
+    first_token = None
+    conn.request("POST", "/v1/query", body=json.dumps({"question": question, "stream": True}),
+                 headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"})
+    response = conn.getresponse()
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status}")
+    while True:
+        line = response.readline()
+        if not line:
+            break
+        event = json.loads(line)
+        if event["type"] == "token" and first_token is None:
+            first_token = time.perf_counter() - start
+    conn.close()
+    return first_token, time.perf_counter() - start
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+def _report(name, samples):
+    samples_ms = [s * 1000 for s in samples if s is not None]
+    if not samples_ms:
+        return
+    print(f"{name:<14} p50 {statistics.median(samples_ms):8.1f} ms   p90 {_percentile(samples_ms, 0.90):8.1f} ms   "
+          f"p99 {_percentile(samples_ms, 0.99):8.1f} ms")
+
+
+def run_load(base_url, requests, concurrency, api_key):
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def task(i):
+        try:
+            outcome = _one_request(base_url, f"What was the glucose level in report {i}?", api_key)
+            with lock:
+                results.append(outcome)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(task, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"Requests: {len(results)} ok, {len(errors)} failed in {elapsed:.1f}s at concurrency {concurrency}")
+    print(f"QPS: {len(results) / elapsed:.1f}")
+    _report("first token", [first for first, _ in results])
+    _report("full answer", [total for _, total in results])
+    if errors:
+        print(f"First error: {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target an existing API instead of starting stubs")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", ""), help="Key for --url deployments")
+    parser.add_argument("--chunks", type=int, default=2000, help="synthetic chunks to index")
+    parser.add_argument("--embed-delay", type=float, default=0.005)
+    parser.add_argument("--llm-ttft", type=float, default=0.05)
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    if args.url:
+        _wait_healthy(args.url)
+        run_load(args.url, args.requests, args.concurrency, args.api_key)
+        return
+
+    stub, stub_url = _start_stub(_make_stub_handler(args.embed_delay, args.llm_ttft, args.llm_tokens, args.token_delay))
+    workdir = tempfile.mkdtemp(prefix="rag-load-")
+    api_key = secrets.token_urlsafe(24)
+    # Set before any app module is imported so both this process and the API see it
+    os.environ.update({
+        "OPENAI_API_BASE": stub_url,
+        "OPENAI_EMBEDDING_BASE": stub_url,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_EMBEDDING_KEY": "stub",
+        "VECTOR_BACKEND": "flat",
+        "FLAT_INDEX_PATH": os.path.join(workdir, "index"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+        "INDEX_LEDGER_PATH": os.path.join(workdir, "ledger.sqlite3"),
+        "ANSWER_CACHE_PATH": os.path.join(workdir, "answers.sqlite3"),
+        "API_KEYS": api_key,
+    })
+    print(f"🧪 Stub backends at {stub_url}, seeding {args.chunks} chunks...")
+    _seed_index(args.chunks)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.api:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=ROOT, env=os.environ.copy()
+    )
+    try:
+        _wait_healthy(base_url)
+        print(f"🚀 API up with {args.workers} worker(s); {args.requests} requests at concurrency {args.concurrency}")
+        run_load(base_url, args.requests, args.concurrency, api_key)
+    finally:
+        api.terminate()
+        api.wait(timeout=10)
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
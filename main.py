@@ -1,14 +1,17 @@
 import streamlit as st 
 
 from app.ui import pdf_uploader
-from app.pdf_utils import extract_text_from_pdf, clean_text
-from io import BytesIO
-from app.s3_utils import process_uploaded_files, list_s3_documents, download_from_s3
+from app.s3_manifest import ensure_manifest, refresh_manifest, query_manifest, count_manifest, manifest_keys
 #from app.config import EURI_API_KEY
-from app.vectorstore_utils import create_chroma_collection, retrieve_relevant_docs, clear_chroma_collection
-from app.chat_utils import get_chat_model, ask_chat_model
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.vectorstore_utils import CHROMA_COLLECTION, ensure_collection_exists, \
+    prune_removed_documents, get_query_embedding, build_where, list_indexed_documents
+from app.answer_cache import lookup_answer, store_answer
+from app.reranker import get_reranker, retrieve_reranked_docs
+from app.jobs import JOB_EMBEDDED_WORKERS, JOB_POLL_INTERVAL, cancel_job, list_jobs, retry_job, start_workers, \
+    submit_s3_import_job, submit_upload_job
+from app.chat_utils import get_chat_model, stream_chat_model, build_rag_prompt, get_sources, NO_CONTEXT_RESPONSE
 import os 
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -123,18 +126,59 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Helper functions
-def get_document_chunks(texts):
-    """Split documents into chunks for vectorstore"""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
-    )
-    chunks = []
-    for text in texts:
-        text_chunks = text_splitter.split_text(text)
-        chunks.extend(text_chunks)
-    return chunks
+S3_PAGE_SIZE = 200
+
+def date_range_bounds(dates):
+    """Turn a st.date_input range into UTC datetime bounds (end date inclusive)"""
+    dates = list(dates) if isinstance(dates, (list, tuple)) else [dates]
+    after = datetime.combine(dates[0], datetime.min.time(), tzinfo=timezone.utc) if len(dates) > 0 else None
+    before = datetime.combine(dates[1], datetime.min.time(), tzinfo=timezone.utc) + timedelta(days=1) if len(dates) > 1 else None
+    return after, before
+
+# Background ingestion workers (once per server process, not per browser tab)
+JOB_PANEL_SIZE = 5
+if JOB_EMBEDDED_WORKERS:
+    start_workers()
+# Load the cross-encoder (when enabled) now rather than inside the first question's time budget
+get_reranker()
+
+JOB_ICONS = {"queued": "⏳", "running": "🔄", "succeeded": "✅", "failed": "❌", "cancelled": "🛑"}
+JOB_LABELS = {"upload": "Upload", "s3_import": "S3 import"}
+
+@st.fragment(run_every=JOB_POLL_INTERVAL * 2)
+def show_jobs():
+    """Poll this session's recent ingestion jobs and make the collection available once one finishes"""
+    # Other users' jobs share the queue; only the ones queued here are shown and controllable
+    job_ids = st.session_state.get("job_ids", [])
+    jobs = list_jobs(limit=JOB_PANEL_SIZE, job_ids=job_ids) if job_ids else []
+    if not jobs:
+        return
+    st.markdown('<div class="sidebar-box">', unsafe_allow_html=True)
+    st.header("🧵 Background Jobs")
+    for job in jobs:
+        st.progress(job["progress"], text=f"{JOB_ICONS[job['status']]} {JOB_LABELS.get(job['kind'], job['kind'])} · {job['message']}")
+        if job["status"] in ("queued", "running") and not job["cancel_requested"]:
+            if st.button("🛑 Cancel", key=f"cancel_{job['id']}"):
+                cancel_job(job["id"])
+        elif job["status"] in ("failed", "cancelled"):
+            if job["error"]:
+                st.caption(f"❌ {job['error']}")
+            if st.button("🔁 Retry", key=f"retry_{job['id']}"):
+                retry_job(job["id"])
+        elif job["status"] == "succeeded" and job["result"]:
+            result = job["result"]
+            st.caption(f"💾 {result['stored']} chunk(s) stored, {result['skipped']} already indexed")
+            for item in result.get("failed", []):
+                st.caption(f"⚠️ {item['filename']}: {item.get('error', 'Unknown error')}")
+        
+        # A job this session queued has finished: chat can use the new documents
+        finished = st.session_state.setdefault("finished_job_ids", [])
+        if job["status"] == "succeeded" and job["id"] not in finished:
+            finished.append(job["id"])
+            st.session_state.collection = ensure_collection_exists()
+            st.session_state.chat_model = get_chat_model(EURI_API_KEY)
+            st.success("✅ Processing complete! Ready for questions.")
+    st.markdown('</div>', unsafe_allow_html=True)
 
 # --- APP LAYOUT ---
 
@@ -153,40 +197,23 @@ with st.sidebar:
     # PROCESSING BOX
     if uploaded_files:
         st.markdown('<div class="sidebar-box">', unsafe_allow_html=True)
+        upload_patient_id = st.text_input("🧑 Patient ID (optional)", key="upload_patient_id")
         if st.button("⚙️ Process Documents", type="primary"):
-            with st.spinner("🔄 Processing your medical documents..."):
-                # Process files: extract text and upload to S3
-                process_results = process_uploaded_files(uploaded_files, extract_text_from_pdf)
-                
-                # Show S3 upload status
-                if process_results["uploaded"]:
-                    st.success(f"✅ {len(process_results['uploaded'])} file(s) uploaded to S3")
-                    for item in process_results["uploaded"]:
-                        st.info(f"📄 {item['filename']} → S3: {item['s3_key']}")
-                
-                if process_results["failed"]:
-                    st.warning(f"⚠️ {len(process_results['failed'])} file(s) failed to upload")
-                    for item in process_results["failed"]:
-                        st.error(f"❌ {item['filename']}: {item.get('error', 'Unknown error')}")
-                
-                # Process texts for ChromaDB
-                if process_results["texts"]:
-                    documents = get_document_chunks(process_results["texts"])
-                    collection = create_chroma_collection(documents)
-                    st.session_state.collection = collection
-                    chat_model = get_chat_model(EURI_API_KEY)
-                    st.session_state.chat_model = chat_model
-                    st.success("✅ Processing complete! Ready for questions.")
-                else:
-                    st.error("❌ No text could be extracted from the uploaded files.")
+            # Indexing runs in a background worker; the jobs panel below tracks it
+            job_id = submit_upload_job([(file.name, file.getvalue()) for file in uploaded_files],
+                                       patient_id=upload_patient_id.strip() or None)
+            st.session_state.setdefault("job_ids", []).append(job_id)
+            st.info(f"🧵 Queued {len(uploaded_files)} file(s) for processing. Progress is shown under Background Jobs.")
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Show existing S3 documents
         st.markdown('<div class="sidebar-box">', unsafe_allow_html=True)
         if st.button("📋 List S3 Documents"):
-            s3_docs = list_s3_documents()
+            ensure_manifest()
+            s3_total = count_manifest()
+            s3_docs = query_manifest(limit=S3_PAGE_SIZE)
             if s3_docs:
-                st.write(f"**Found {len(s3_docs)} document(s) in S3:**")
+                st.write(f"**Found {s3_total} document(s) in S3** (showing the {len(s3_docs)} most recent):")
                 for doc in s3_docs:
                     st.write(f"📄 {doc['filename']} ({doc['size']} bytes)")
             else:
@@ -198,12 +225,30 @@ with st.sidebar:
     st.header("☁️ Import from S3")
     st.markdown("📥 **Import documents from your S3 bucket:**")
     
-    if st.button("🔄 Load S3 Files", type="secondary"):
+    # Filters run against the local manifest, not the bucket
+    s3_prefix = st.text_input("Prefix", value="documents/", key="s3_prefix")
+    s3_name_filter = st.text_input("Filename contains", key="s3_name_filter")
+    s3_dates = st.date_input("Modified between", value=(), key="s3_dates")
+    s3_after, s3_before = date_range_bounds(s3_dates)
+    
+    col_load, col_rescan = st.columns(2)
+    load_clicked = col_load.button("🔄 Load S3 Files", type="secondary")
+    rescan_clicked = col_rescan.button("♻️ Rescan Bucket")
+    if load_clicked or rescan_clicked:
         with st.spinner("🔄 Loading files from S3..."):
-            s3_docs = list_s3_documents()
+            if rescan_clicked:
+                refresh_stats = refresh_manifest(s3_prefix)
+            else:
+                # Only re-list the bucket when the cached manifest has gone stale
+                refresh_stats = ensure_manifest(s3_prefix)
+            if refresh_stats and refresh_stats["success"]:
+                # Objects deleted from the bucket should not keep answering questions
+                prune_removed_documents(manifest_keys(s3_prefix), s3_prefix)
+            s3_total = count_manifest(s3_prefix, s3_name_filter, s3_after, s3_before)
+            s3_docs = query_manifest(s3_prefix, s3_name_filter, s3_after, s3_before, limit=S3_PAGE_SIZE)
             if s3_docs:
                 st.session_state.s3_documents = s3_docs
-                st.success(f"✅ Found {len(s3_docs)} file(s) in S3")
+                st.success(f"✅ Found {s3_total} file(s) in S3" + (f", showing the {len(s3_docs)} most recent" if s3_total > len(s3_docs) else ""))
             else:
                 st.session_state.s3_documents = []
                 st.warning("⚠️ No documents found in S3 bucket.")
@@ -222,52 +267,26 @@ with st.sidebar:
         )
         
         if selected_indices:
+            import_patient_id = st.text_input("🧑 Patient ID (optional)", key="import_patient_id")
             if st.button("⬇️ Import Selected Files", type="primary"):
-                with st.spinner("🔄 Importing and processing files from S3..."):
-                    imported_texts = []
-                    imported_count = 0
-                    failed_count = 0
-                    
-                    for idx in selected_indices:
-                        doc = st.session_state.s3_documents[idx]
-                        s3_key = doc["key"]
-                        
-                        # Download file from S3
-                        download_result = download_from_s3(s3_key)
-                        
-                        if download_result["success"]:
-                            try:
-                                # Extract text from downloaded PDF
-                                file_bytes = download_result["content"]
-                                text = extract_text_from_pdf(BytesIO(file_bytes))
-                                
-                                if text:
-                                    imported_texts.append(text)
-                                    imported_count += 1
-                                    st.success(f"✅ Imported: {doc['filename']}")
-                                else:
-                                    st.warning(f"⚠️ No text extracted from: {doc['filename']}")
-                                    failed_count += 1
-                            except Exception as e:
-                                st.error(f"❌ Error processing {doc['filename']}: {str(e)}")
-                                failed_count += 1
-                        else:
-                            st.error(f"❌ Failed to download {doc['filename']}: {download_result.get('error', 'Unknown error')}")
-                            failed_count += 1
-                    
-                    # Process imported texts for ChromaDB
-                    if imported_texts:
-                        documents = get_document_chunks(imported_texts)
-                        collection = create_chroma_collection(documents)
-                        st.session_state.collection = collection
-                        chat_model = get_chat_model(EURI_API_KEY)
-                        st.session_state.chat_model = chat_model
-                        st.success(f"✅ Successfully imported and processed {imported_count} file(s)! Ready for questions.")
-                        if failed_count > 0:
-                            st.warning(f"⚠️ {failed_count} file(s) failed to import.")
-                    else:
-                        st.error("❌ No files could be imported successfully.")
+                # Unchanged objects are skipped by the worker using the index ledger
+                selected_docs = [st.session_state.s3_documents[idx] for idx in selected_indices]
+                job_id = submit_s3_import_job(selected_docs, patient_id=import_patient_id.strip() or None)
+                st.session_state.setdefault("job_ids", []).append(job_id)
+                st.info(f"🧵 Queued {len(selected_docs)} file(s) for import. Progress is shown under Background Jobs.")
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # SEARCH SCOPE
+    st.markdown('<div class="sidebar-box">', unsafe_allow_html=True)
+    st.header("🎯 Search Scope")
+    # Empty selections search every indexed document
+    st.multiselect("Only these documents:", options=list_indexed_documents(), format_func=os.path.basename,
+                   key="scope_sources")
+    st.text_input("Only this patient ID:", key="scope_patient_id")
     st.markdown('</div>', unsafe_allow_html=True)
+    
+    # BACKGROUND JOBS
+    show_jobs()
 
                 
                 
@@ -322,23 +341,41 @@ if prompt := st.chat_input("Ask about your medical documents..."):
     #Check if documents have been uploaded before responding
     if st.session_state.collection:
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
+            with st.spinner("Searching your documents..."):
                 #RAG PIEPLINE
-                context_docs=retrieve_relevant_docs(prompt, k=4)
-
-                # Handle no relevant context ---
-                if context_docs:
-                    context_text="\n\n".join([doc.page_content for doc in context_docs])
-                    full_prompt=f"""Based on this context:{context_text}\n\n Answer this question: {prompt}"""
-                    response=ask_chat_model(st.session_state.chat_model,full_prompt)
+                query_embedding=get_query_embedding(prompt)
+                where=build_where(st.session_state.get("scope_sources"), st.session_state.get("scope_patient_id", "").strip())
+                context_docs=retrieve_reranked_docs(prompt, k=4, query_embedding=query_embedding, where=where)
+
+            # Handle no relevant context ---
+            if context_docs:
+                chunk_ids=[doc.id for doc in context_docs]
+                cached=lookup_answer(CHROMA_COLLECTION, query_embedding, chunk_ids)
+                if cached:
+                    # A near-identical question over the same chunks was already answered
+                    response=cached["answer"]
+                    st.markdown(response)
+                    st.caption(f"⚡ Answered from cache (similarity {cached['similarity']:.2f} to an earlier question)")
                 else:
-                    response="I'm sorry, but I couldn't find any information related to your question in the uploaded documents. Could you please ask something else?"
-
+                    full_prompt=build_rag_prompt(prompt,context_docs)
+                    # Stream the answer as it is generated
+                    stream_stats={}
+                    response=st.write_stream(stream_chat_model(st.session_state.chat_model,full_prompt,stats=stream_stats))
+                    if stream_stats.get("ttft") is not None:
+                        st.caption(f"⏱️ First token in {stream_stats['ttft']:.2f}s · full answer in {stream_stats['total']:.2f}s")
+                    if not stream_stats.get("error"):
+                        store_answer(CHROMA_COLLECTION, prompt, query_embedding, chunk_ids, response, stream_stats["total"])
+                sources=get_sources(context_docs)
+                if sources:
+                    st.caption("📎 Sources: " + "; ".join(
+                        os.path.basename(item["source"]) + (f" p.{item['page']}" if item["page"] else "") for item in sources))
+            else:
+                response=NO_CONTEXT_RESPONSE
                 # Display the response
                 st.markdown(response)
 
-                ## Adding the assiant response to history
-                st.session_state.messages.append({"role":"assistant","content":response})
+            ## Adding the assiant response to history
+            st.session_state.messages.append({"role":"assistant","content":response})
     else:
         #Show an error if no documents are uploaded 
         st.session_state.messages.append({
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import sys
+import types
+
+import pytest
+
+# Let the tests import the app package when pytest is run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app/config.py holds deployment endpoints and keys and is not checked in;
+# without one, give the tests placeholder settings (no test calls them)
+try:
+    import app.config  # noqa: F401
+except ImportError:
+    config = types.ModuleType("app.config")
+    config.OPENAI_API_BASE = config.OPENAI_EMBEDDING_BASE = "http://127.0.0.1:9/v1"
+    config.OPENAI_API_KEY = config.OPENAI_EMBEDDING_KEY = "test-key"
+    config.LLM_MODEL = "test-llm"
+    config.EMBEDDING_MODEL = "test-embedding"
+    sys.modules["app.config"] = config
+
+DIM = 8
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+
+def fake_vector(model, text):
+    """A deterministic unit vector per (model, text)"""
+    import numpy as np
+    digest = hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+    vector = np.frombuffer(digest[:DIM * 4], dtype=np.uint32).astype(np.float32) + 1.0
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Flat vector store, ledger, lexical index, embedding and answer caches under tmp_path,
+    with a fake embedding endpoint whose requests land in ``store.requests``"""
+    pytest.importorskip("numpy")
+    import numpy as np
+    from app import answer_cache, embedding_cache, index_ledger, lexical_index, vector_backends, vectorstore_utils
+
+    monkeypatch.setattr(vector_backends, "VECTOR_BACKEND", "flat")
+    monkeypatch.setattr(vectorstore_utils, "VECTOR_BACKEND", "flat")
+    monkeypatch.setattr(vector_backends, "FLAT_INDEX_PATH", str(tmp_path / "flat_index"))
+    monkeypatch.setattr(index_ledger, "INDEX_LEDGER_PATH", str(tmp_path / "index_ledger.sqlite3"))
+    monkeypatch.setattr(index_ledger, "_conn", None)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    monkeypatch.setattr(embedding_cache, "_conn", None)
+    monkeypatch.setattr(embedding_cache, "_entries", None)
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_PATH", str(tmp_path / "answers.sqlite3"))
+    monkeypatch.setattr(answer_cache, "_conn", None)
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+    monkeypatch.setattr(lexical_index, "_indexes", {})
+    vectorstore_utils.reset_chroma_connection()
+    vectorstore_utils._query_embedding_cache.clear()
+    vectorstore_utils._retrieval_cache.clear()
+
+    requests = []
+
+    def request_embeddings(texts):
+        requests.append(list(texts))
+        return np.stack([fake_vector(vectorstore_utils.EMBEDDING_MODEL, text) for text in texts])
+
+    monkeypatch.setattr(vectorstore_utils, "_request_embeddings", request_embeddings)
+    yield types.SimpleNamespace(path=tmp_path, requests=requests)
+    vectorstore_utils.reset_chroma_connection()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """The shared S3 client, against moto's in-process S3 with the configured bucket created"""
+    pytest.importorskip("moto")
+    from moto import mock_aws
+    from app import s3_utils
+
+    with mock_aws():
+        # The shared client must be built inside the mock
+        monkeypatch.setattr(s3_utils, "_s3_client", None)
+        client = s3_utils.get_s3_client()
+        client.create_bucket(Bucket=s3_utils.S3_CONFIG["bucket"])
+        yield client
+    s3_utils._s3_client = None
@@ -0,0 +1,103 @@
+"""The semantic answer cache: similarity threshold, context key, TTL, version invalidation and eviction"""
+
+import time
+
+import pytest
+
+from app import answer_cache, index_ledger
+from app.answer_cache import get_answer_cache_stats, lookup_answer, store_answer
+
+COLLECTION = "docs"
+QUESTION = [1.0, 0.0, 0.0]
+CHUNKS = ["documents/meds.pdf::0::a", "documents/meds.pdf::120::b"]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Empty answer cache and index ledger under tmp_path with fresh counters"""
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_PATH", str(tmp_path / "answers.sqlite3"))
+    monkeypatch.setattr(answer_cache, "_conn", None)
+    monkeypatch.setattr(answer_cache, "_stats", dict.fromkeys(answer_cache._stats, 0))
+    monkeypatch.setattr(index_ledger, "INDEX_LEDGER_PATH", str(tmp_path / "index_ledger.sqlite3"))
+    monkeypatch.setattr(index_ledger, "_conn", None)
+    yield answer_cache
+    for module in (answer_cache, index_ledger):
+        if module._conn is not None:
+            module._conn.close()
+
+
+def store(answer="Metformin 500 mg.", embedding=QUESTION, chunk_ids=CHUNKS, seconds=2.5):
+    store_answer(COLLECTION, "What metformin dose?", embedding, chunk_ids, answer, seconds)
+
+
+def test_similar_question_over_the_same_chunks_hits(cache):
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS) is None
+    store()
+
+    hit = lookup_answer(COLLECTION, [0.99, 0.05, 0.0], list(reversed(CHUNKS)))
+    assert hit["answer"] == "Metformin 500 mg."
+    assert hit["query"] == "What metformin dose?"
+    assert hit["similarity"] > 0.99
+    stats = get_answer_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 1, 1, 1)
+    assert stats["saved_seconds"] == pytest.approx(2.5)
+
+
+def test_closest_answer_above_the_threshold_wins(cache, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_THRESHOLD", 0.9)
+    store("near", [1.0, 0.2, 0.0])
+    store("nearest", [1.0, 0.05, 0.0])
+    store("far", [0.0, 1.0, 0.0])
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS)["answer"] == "nearest"
+    assert lookup_answer(COLLECTION, [0.0, 0.0, 1.0], CHUNKS) is None
+
+
+def test_different_context_or_dissimilar_question_misses(cache):
+    store()
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS[:1]) is None
+    assert lookup_answer(COLLECTION, [0.7, 0.7, 0.0], CHUNKS) is None
+    assert lookup_answer("other", QUESTION, CHUNKS) is None
+    assert lookup_answer(COLLECTION, [], CHUNKS) is None
+    assert lookup_answer(COLLECTION, QUESTION, []) is None
+
+
+def test_answers_expire_after_the_ttl(cache, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_TTL", 60)
+    store()
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS) is not None
+    connection = answer_cache._get_connection()
+    connection.execute("UPDATE answers SET created_at = ?", (time.time() - 61,))
+    connection.commit()
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS) is None
+
+
+def test_collection_writes_invalidate_cached_answers(cache):
+    store()
+    index_ledger.bump_collection_version(COLLECTION)
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS) is None
+    stats = get_answer_cache_stats()
+    assert stats["invalidated"] == 1 and stats["entries"] == 0
+
+    store("after the write")
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS)["answer"] == "after the write"
+
+
+def test_oldest_answers_are_evicted_past_the_bound(cache, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_MAX_ENTRIES", 2)
+    contexts = [[f"chunk-{i}"] for i in range(3)]
+    for i, chunk_ids in enumerate(contexts):
+        store(f"answer {i}", chunk_ids=chunk_ids)
+        # Distinct creation times, oldest first, however coarse the clock
+        connection = answer_cache._get_connection()
+        connection.execute("UPDATE answers SET created_at = ? WHERE answer = ?", (time.time() - 10 + i, f"answer {i}"))
+        connection.commit()
+    assert get_answer_cache_stats()["entries"] == 2
+    assert lookup_answer(COLLECTION, QUESTION, contexts[0]) is None
+    assert lookup_answer(COLLECTION, QUESTION, contexts[2])["answer"] == "answer 2"
+
+
+def test_disabled_cache_neither_stores_nor_hits(cache, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_ENABLED", False)
+    store()
+    assert lookup_answer(COLLECTION, QUESTION, CHUNKS) is None
+    assert get_answer_cache_stats()["entries"] == 0
@@ -0,0 +1,115 @@
+"""The headless API through FastAPI's TestClient, over the flat backend with a fake embedding endpoint and LLM"""
+
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("numpy")
+from fastapi.testclient import TestClient
+
+from app import api, vectorstore_utils
+
+KEY = {"Authorization": "Bearer secret"}
+CHUNKS = {
+    "documents/bp.pdf": "Blood pressure was 120/80 mmHg at the follow-up visit.",
+    "documents/meds.pdf": "Metformin 500 mg twice daily was continued for type 2 diabetes.",
+}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Fake chat model; every prompt it is sent lands in the returned list"""
+    prompts = []
+
+    def ask_chat_model(chat_model, prompt):
+        prompts.append(prompt)
+        return "Metformin 500 mg."
+
+    def stream_chat_model(chat_model, prompt, stats=None):
+        prompts.append(prompt)
+        stats.update({"ttft": 0.01, "total": 0.02})
+        yield from ("Metformin ", "500 mg.")
+
+    monkeypatch.setattr(api, "ask_chat_model", ask_chat_model)
+    monkeypatch.setattr(api, "stream_chat_model", stream_chat_model)
+    return prompts
+
+
+@pytest.fixture
+def client(store, llm, monkeypatch):
+    monkeypatch.setattr(api, "API_KEYS", ["secret", "rotated"])
+    keys = list(CHUNKS)
+    result = vectorstore_utils.index_chunks([CHUNKS[key] for key in keys], doc_keys=keys,
+                                            metadatas=[{"source": key, "page": 1} for key in keys])
+    assert result["stored"] == len(keys)
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_probes_need_no_key(client):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    assert client.get("/readyz").json() == {"status": "ready"}
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer wrong"}, {"X-API-Key": "wrong"},
+                                     {"Authorization": "Basic secret"}])
+def test_protected_routes_reject_missing_or_wrong_keys(client, headers):
+    for response in (client.get("/metrics", headers=headers),
+                     client.post("/v1/query", json={"question": "dose?"}, headers=headers)):
+        assert response.status_code == 401
+        assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+@pytest.mark.parametrize("headers", [KEY, {"Authorization": "bearer rotated"}, {"X-API-Key": "rotated"}])
+def test_bearer_token_or_api_key_header_is_accepted(client, headers):
+    assert client.get("/metrics", headers=headers).status_code == 200
+
+
+def test_no_configured_keys_refuses_every_request(client, monkeypatch):
+    monkeypatch.setattr(api, "API_KEYS", [])
+    assert client.get("/metrics", headers=KEY).status_code == 503
+
+
+def test_query_answers_from_context_then_from_cache(client, llm):
+    body = {"question": "What metformin dose is the patient on?", "stream": False}
+    first = client.post("/v1/query", json=body, headers=KEY).json()
+    assert first["answer"] == "Metformin 500 mg."
+    assert first["cached"] is False
+    assert {"source": "documents/meds.pdf", "page": 1} in first["sources"]
+    assert "Metformin 500 mg twice daily" in llm[0]
+
+    second = client.post("/v1/query", json=body, headers=KEY).json()
+    assert second["answer"] == first["answer"]
+    assert second["cached"] is True
+    assert len(llm) == 1
+
+
+def test_query_scoped_to_other_documents_has_no_context(client, llm):
+    body = {"question": "What metformin dose?", "stream": False, "patient_id": "nobody"}
+    response = client.post("/v1/query", json=body, headers=KEY).json()
+    assert response["chunks"] == 0
+    assert response["answer"] == api.NO_CONTEXT_RESPONSE
+    assert not llm
+
+
+def test_streamed_query_sends_ndjson_events(client):
+    response = client.post("/v1/query", json={"question": "What metformin dose?"}, headers=KEY)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["type"] for event in events] == ["context", "token", "token", "done"]
+    assert events[0]["chunks"] > 0 and events[0]["cached"] is False
+    assert "".join(event["text"] for event in events if event["type"] == "token") == "Metformin 500 mg."
+
+
+def test_metrics_report_cache_counters(client):
+    body = {"question": "What metformin dose?", "stream": False}
+    client.post("/v1/query", json=body, headers=KEY)
+    client.post("/v1/query", json=body, headers=KEY)
+    metrics = client.get("/metrics", headers=KEY).json()
+    assert {"answer_cache", "embedding_cache", "embedding_batches", "rerank", "query_embeddings",
+            "retrieval"} <= set(metrics)
+    assert metrics["answer_cache"]["entries"] == 1
+    assert metrics["answer_cache"]["hits"] >= 1
+    assert metrics["query_embeddings"]["hits"] >= 1
@@ -0,0 +1,101 @@
+"""Context packing: merging adjacent chunks, dropping near-duplicates and fitting blocks into a token budget"""
+
+import types
+
+import pytest
+
+from app import context_packing
+from app.context_packing import count_tokens, drop_near_duplicates, merge_adjacent, pack_context
+
+
+@pytest.fixture(autouse=True)
+def length_estimate(monkeypatch):
+    """Count tokens as ceil(len / 4) so budgets don't depend on which tokenizer is installed"""
+    monkeypatch.setattr(context_packing, "_encoding", False)
+
+
+def doc(text, chunk_id=None, **metadata):
+    return types.SimpleNamespace(page_content=text, id=chunk_id, metadata=metadata)
+
+
+def words(prefix, n):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_adjacent_chunks_merge_without_their_overlap():
+    first = "Blood pressure was 120/80 mmHg at the cardiology follow-up"
+    second = "at the cardiology follow-up visit; heart rate 72 bpm."
+    docs = [
+        doc(second, "documents/a.pdf::1::x", source="documents/a.pdf", page=2),
+        doc("Unrelated note.", "documents/b.pdf::0::y"),
+        doc(first, "documents/a.pdf::0::z", source="documents/a.pdf", page=1),
+        doc("Far away chunk.", "documents/a.pdf::5::w"),
+        doc("No chunk ID.", None),
+    ]
+    blocks = merge_adjacent(docs)
+
+    assert [block["text"] for block in blocks] == [
+        "Blood pressure was 120/80 mmHg at the cardiology follow-up visit; heart rate 72 bpm.",
+        "Unrelated note.", "Far away chunk.", "No chunk ID.",
+    ]
+    # A merged block ranks as its best member and cites the page it starts on
+    assert (blocks[0]["rank"], blocks[0]["chunks"], blocks[0]["metadata"]["page"]) == (0, 2, 1)
+
+
+def test_short_overlaps_are_joined_with_a_space():
+    docs = [doc("Patient is stable.", "k::0::a"), doc("Discharged home.", "k::1::b")]
+    assert merge_adjacent(docs)[0]["text"] == "Patient is stable. Discharged home."
+
+
+def test_near_duplicates_keep_the_best_ranked_block():
+    text = words("w", 40)
+    blocks = [
+        {"text": text, "rank": 0, "chunks": 1, "metadata": {}},
+        {"text": text + " extra", "rank": 1, "chunks": 1, "metadata": {}},
+        {"text": words("w", 30), "rank": 2, "chunks": 1, "metadata": {}},
+        {"text": words("v", 40), "rank": 3, "chunks": 1, "metadata": {}},
+    ]
+    kept = drop_near_duplicates(blocks)
+    assert [block["rank"] for block in kept] == [0, 3]
+    assert [block["rank"] for block in drop_near_duplicates(blocks, threshold=1.01)] == [0, 1, 2, 3]
+
+
+def test_blocks_fill_the_budget_in_rank_order_with_source_labels():
+    docs = [doc("a" * 40, "d1.pdf::0::a", source="documents/d1.pdf", page=3),
+            doc("b" * 40, "d2.pdf::0::b", source="documents/d2.pdf"),
+            doc("c" * 40, "d3.pdf::0::c")]
+    packed = pack_context(docs, token_budget=1000)
+
+    assert packed["text"] == ("[Source: d1.pdf, page 3]\n" + "a" * 40 + "\n\n"
+                              + "[Source: d2.pdf]\n" + "b" * 40 + "\n\n" + "c" * 40)
+    # Each block and separator is counted on its own
+    parts = packed["text"].split("\n\n")
+    assert packed["tokens"] == sum(map(count_tokens, parts)) + 2 * count_tokens("\n\n")
+    assert (packed["blocks"], packed["chunks_in"], packed["duplicates_dropped"], packed["truncated"]) == (3, 3, 0, False)
+
+
+def test_the_first_block_that_does_not_fit_is_truncated_then_packing_stops(monkeypatch):
+    monkeypatch.setattr(context_packing, "CONTEXT_MIN_TRUNCATED_TOKENS", 5)
+    docs = [doc("a" * 40, "d1::0::a"), doc("b" * 400, "d2::0::b"), doc("c" * 4, "d3::0::c")]
+    packed = pack_context(docs, token_budget=30)
+
+    first, second = packed["text"].split("\n\n")
+    assert first == "a" * 40
+    assert set(second) == {"b"} and len(second) < 400
+    assert packed["truncated"] and packed["blocks"] == 2
+    assert packed["tokens"] <= 30
+
+
+def test_a_tail_too_small_to_be_useful_is_left_out(monkeypatch):
+    monkeypatch.setattr(context_packing, "CONTEXT_MIN_TRUNCATED_TOKENS", 64)
+    packed = pack_context([doc("a" * 40, "d1::0::a"), doc("b" * 400, "d2::0::b")], token_budget=30)
+    assert packed["text"] == "a" * 40
+    assert not packed["truncated"] and packed["blocks"] == 1
+
+
+def test_duplicates_are_dropped_before_they_cost_budget():
+    text = words("w", 40)
+    packed = pack_context([doc(text, "d1::0::a"), doc(text, "d2::0::b"), doc(words("v", 5), "d3::0::c")],
+                          token_budget=1000)
+    assert packed["duplicates_dropped"] == 1
+    assert packed["text"] == text + "\n\n" + words("v", 5)
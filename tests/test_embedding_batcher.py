@@ -0,0 +1,141 @@
+"""Adaptive embedding batches against stub endpoints: batch sizing, retries, bisection and failed chunk reporting"""
+
+import pytest
+
+from app import embedding_batcher
+from app.embedding_batcher import AdaptiveBatchSizer, EmbeddingRequestError, embed_with_retry, next_batch_length
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(embedding_batcher, "EMBEDDING_RETRY_BASE_DELAY", 0)
+
+
+class StubEndpoint:
+    """Embeds each text as ``[len(text)]``, failing requests as the test says; every request lands in ``calls``"""
+
+    def __init__(self, reject=(), overloaded_calls=0):
+        self.reject = set(reject)
+        self.overloaded_calls = overloaded_calls
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if len(self.calls) <= self.overloaded_calls:
+            raise EmbeddingRequestError("HTTP 503", 503)
+        if self.reject.intersection(texts):
+            raise EmbeddingRequestError("HTTP 413", 413, retryable=False)
+        return [[float(len(text))] for text in texts]
+
+
+def test_fast_full_batches_grow_and_slow_ones_shrink():
+    sizer = AdaptiveBatchSizer(initial=20, minimum=2, maximum=24, target_latency=1.0)
+    sizer.record_success(20, 0.1)
+    assert sizer.size == 22
+    # A partial batch says nothing about whether the server keeps up at this size
+    sizer.record_success(5, 0.1)
+    assert sizer.size == 22
+    sizer.record_success(22, 0.1)
+    sizer.record_success(24, 0.1)
+    assert sizer.size == 24
+    sizer.record_success(24, 3.0)
+    assert sizer.size == 18
+
+
+def test_overload_halves_the_batch_size_down_to_the_minimum():
+    sizer = AdaptiveBatchSizer(initial=16, minimum=3, maximum=64)
+    sizer.record_failure()
+    assert sizer.size == 8
+    sizer.record_failure(overloaded=False)
+    assert sizer.size == 8
+    sizer.record_failure()
+    sizer.record_failure()
+    assert sizer.size == 3
+    assert sizer.stats()["failures"] == 4
+
+
+def test_transient_errors_are_retried_and_shrink_later_batches():
+    sizer = AdaptiveBatchSizer(initial=16, maximum=64)
+    endpoint = StubEndpoint(overloaded_calls=2)
+    assert embed_with_retry(["a", "bb", "ccc"], endpoint, sizer) == [[1.0], [2.0], [3.0]]
+    assert endpoint.calls == [["a", "bb", "ccc"]] * 3
+    assert sizer.size == 4
+    assert sizer.stats()["retries"] == 2
+
+
+def test_a_server_that_stays_down_fails_every_text_without_bisecting(monkeypatch):
+    monkeypatch.setattr(embedding_batcher, "EMBEDDING_MAX_RETRIES", 2)
+    sizer = AdaptiveBatchSizer()
+    endpoint = StubEndpoint(overloaded_calls=100)
+    assert embed_with_retry(["a", "b", "c", "d"], endpoint, sizer) == [None] * 4
+    assert len(endpoint.calls) == 3
+    stats = sizer.stats()
+    assert stats["bisections"] == 0 and stats["unembedded"] == 4
+
+
+def test_a_rejected_text_is_isolated_without_shrinking_the_batch():
+    sizer = AdaptiveBatchSizer(initial=16, maximum=64)
+    texts = ["a", "bb", "BAD", "dddd", "eeeee", "ffffff", "g", "hh"]
+    endpoint = StubEndpoint(reject={"BAD"})
+    vectors = embed_with_retry(texts, endpoint, sizer)
+
+    assert vectors == [None if text == "BAD" else [float(len(text))] for text in texts]
+    # Halves without the bad text go out once; only the halves holding it are split again
+    assert endpoint.calls[0] == texts
+    assert ["dddd", "eeeee", "ffffff", "g", "hh"] not in endpoint.calls
+    assert ["eeeee", "ffffff", "g", "hh"] in endpoint.calls
+    assert endpoint.calls[-1] == ["eeeee", "ffffff", "g", "hh"]
+    assert ["BAD"] in endpoint.calls
+    stats = sizer.stats()
+    assert stats["unembedded"] == 1 and stats["retries"] == 0
+    assert sizer.size >= 16
+
+
+def test_wrong_number_of_vectors_is_treated_as_a_rejection():
+    sizer = AdaptiveBatchSizer()
+    calls = []
+
+    def drops_the_last_vector(texts):
+        calls.append(list(texts))
+        return [[1.0]] * max(1, len(texts) - 1)
+
+    assert embed_with_retry(["a", "b"], drops_the_last_vector, sizer) == [[1.0], [1.0]]
+    assert calls == [["a", "b"], ["a"], ["b"]]
+
+
+def test_batches_stop_at_the_token_limit():
+    counts = [3, 4, 5, 20, 1]
+    texts = ["t"] * len(counts)
+    assert next_batch_length(texts, 10, max_tokens=10, token_counts=counts) == 2
+    assert next_batch_length(texts, 1, max_tokens=10, token_counts=counts) == 1
+    # A text over the limit on its own still goes out alone
+    assert next_batch_length(texts[3:], 10, max_tokens=10, token_counts=counts[3:]) == 1
+    assert next_batch_length([], 10, max_tokens=10) == 0
+
+
+def test_index_chunks_reports_only_the_rejected_chunk_as_failed(store, monkeypatch):
+    pytest.importorskip("numpy")
+    import numpy as np
+    from app import vectorstore_utils
+    from conftest import fake_vector
+
+    monkeypatch.setattr(vectorstore_utils, "_batch_sizer", AdaptiveBatchSizer(initial=8))
+
+    def request_embeddings(texts):
+        store.requests.append(list(texts))
+        if any("REJECTED" in text for text in texts):
+            raise EmbeddingRequestError("HTTP 413", 413, retryable=False)
+        return np.stack([fake_vector(vectorstore_utils.EMBEDDING_MODEL, text) for text in texts])
+
+    monkeypatch.setattr(vectorstore_utils, "_request_embeddings", request_embeddings)
+    texts = [f"Progress note {i}: vitals stable." for i in range(6)]
+    texts[4] = "REJECTED chunk the server cannot embed"
+    keys = ["documents/notes.pdf"] * len(texts)
+    result = vectorstore_utils.index_chunks(texts, doc_keys=keys)
+
+    rejected_id = result["ids"][4]
+    assert result["failed_ids"] == {rejected_id}
+    assert result["stored"] == 5
+    stored = set(vectorstore_utils.ensure_collection_exists().get()["ids"])
+    assert stored == set(result["ids"]) - {rejected_id}
+    assert vectorstore_utils.get_embedding_batch_stats()["batch_size"] >= 8
@@ -0,0 +1,116 @@
+"""The persistent embedding cache: hits and misses per model, stored encodings, access times and LRU eviction"""
+
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app import embedding_cache
+from app.embedding_cache import get_cache_stats, get_cached, put_cached
+
+MODEL = "test-embedding"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """An empty cache under tmp_path with fresh counters"""
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    monkeypatch.setattr(embedding_cache, "_conn", None)
+    monkeypatch.setattr(embedding_cache, "_entries", None)
+    monkeypatch.setattr(embedding_cache, "_stats", dict.fromkeys(embedding_cache._stats, 0))
+    yield embedding_cache
+    if embedding_cache._conn is not None:
+        embedding_cache._conn.close()
+
+
+def vectors(n, dim=8):
+    return np.random.default_rng(n).standard_normal((n, dim)).astype(np.float32)
+
+
+def stored_access_times():
+    return dict(embedding_cache._get_connection().execute("SELECT key, last_access FROM embeddings"))
+
+
+def test_hits_are_exact_and_keyed_by_model_and_text(cache):
+    stored = vectors(2)
+    put_cached(MODEL, ["fever", "cough"], stored)
+
+    found = get_cached(MODEL, ["cough", "rash", "fever", "cough"])
+    assert found[1] is None
+    np.testing.assert_array_equal(found[0], stored[1])
+    np.testing.assert_array_equal(found[2], stored[0])
+    np.testing.assert_array_equal(found[3], stored[1])
+    assert found[0].dtype == np.float32
+    assert get_cached("other-model", ["fever"]) == [None]
+
+    stats = get_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["writes"], stats["entries"]) == (3, 2, 2, 2)
+    assert stats["hit_rate"] == pytest.approx(0.6)
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-2), ("int8", 3e-2)])
+def test_quantized_entries_decode_close_to_the_original(cache, monkeypatch, dtype, tolerance):
+    put_cached(MODEL, ["float32 text"], vectors(1))
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DTYPE", dtype)
+    stored = vectors(3)
+    put_cached(MODEL, ["a", "b", "c"], stored)
+
+    found = get_cached(MODEL, ["a", "b", "c", "float32 text"])
+    np.testing.assert_allclose(np.stack(found[:3]), stored, atol=tolerance * np.abs(stored).max())
+    # Entries written before the switch keep their own encoding
+    np.testing.assert_array_equal(found[3], vectors(1)[0])
+
+
+def test_hits_refresh_only_stale_access_times(cache):
+    put_cached(MODEL, ["old", "new"], vectors(2))
+    connection = embedding_cache._get_connection()
+    connection.execute("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                       (time.time() - 2 * embedding_cache.EMBEDDING_CACHE_TOUCH_INTERVAL,
+                        embedding_cache.cache_key(MODEL, "old")))
+    connection.commit()
+    before = stored_access_times()
+
+    get_cached(MODEL, ["old", "new"])
+    after = stored_access_times()
+    old, new = embedding_cache.cache_key(MODEL, "old"), embedding_cache.cache_key(MODEL, "new")
+    assert after[old] > before[old] and after[old] >= after[new]
+    assert after[new] == before[new]
+
+
+def test_eviction_drops_the_least_recently_used_below_the_bound(cache, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_MAX_ENTRIES", 10)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_EVICTION_SLACK", 0.2)
+    texts = [f"note {i}" for i in range(12)]
+    for i, text in enumerate(texts):
+        put_cached(MODEL, [text], vectors(1))
+        connection = embedding_cache._get_connection()
+        connection.execute("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                           (1000.0 + i, embedding_cache.cache_key(MODEL, text)))
+        connection.commit()
+
+    # The 11th write passed the bound and evicted down to 8; the 12th fits
+    assert get_cache_stats()["entries"] == 9
+    assert get_cache_stats()["evictions"] == 3
+    assert [vector is not None for vector in get_cached(MODEL, texts)] == [False] * 3 + [True] * 9
+
+
+def test_writes_below_the_bound_do_not_count_rows(cache):
+    put_cached(MODEL, ["first"], vectors(1))
+    statements = []
+    embedding_cache._get_connection().set_trace_callback(statements.append)
+    for i in range(20):
+        put_cached(MODEL, [f"text {i}", f"other {i}"], vectors(2))
+    embedding_cache._get_connection().set_trace_callback(None)
+
+    assert not [statement for statement in statements if "COUNT(*)" in statement]
+    assert get_cache_stats()["entries"] == 41
+
+
+def test_database_errors_degrade_to_misses(cache, tmp_path, monkeypatch):
+    # A directory where the database file should be can't be opened
+    (tmp_path / "blocked.sqlite3").mkdir()
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_PATH", str(tmp_path / "blocked.sqlite3"))
+    put_cached(MODEL, ["fever"], vectors(1))
+    assert get_cached(MODEL, ["fever"]) == [None]
+    assert get_cache_stats()["errors"] >= 2
@@ -0,0 +1,87 @@
+"""The upload pipeline end to end: moto S3, real PDF extraction, the flat backend and a fake embedding endpoint"""
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pypdf")
+pytest.importorskip("langchain_text_splitters")
+
+from app import ingest_pipeline, s3_utils, vectorstore_utils
+from app.index_ledger import get_entries
+
+
+def make_pdf(*pages):
+    """A minimal PDF with one line of Helvetica text per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return out
+
+
+FILES = [
+    ("a.pdf", make_pdf("Blood pressure 120/80 mmHg on admission", "Metformin 500 mg twice daily")),
+    ("b.pdf", make_pdf("Chest X-ray shows no acute findings")),
+]
+KEYS = [f"documents/{filename}" for filename, _ in FILES]
+
+
+def ingest(files, **kwargs):
+    events = list(ingest_pipeline.iter_ingestion_events(files, **kwargs))
+    assert events[-1]["type"] == "done", events[-1]
+    return events[-1]["summary"]
+
+
+def stored_ids():
+    return set(vectorstore_utils.ensure_collection_exists().get()["ids"])
+
+
+def test_upload_is_indexed_and_recorded_like_an_s3_import(s3, store):
+    summary = ingest(FILES, metadata={"patient_id": "p-1"})
+    assert not summary["failed"] and summary["failed_chunks"] == 0
+    assert summary["stored"] > 0
+
+    entries = get_entries(vectorstore_utils.CHROMA_COLLECTION, KEYS)
+    assert sorted(entries) == KEYS
+    for key, entry in entries.items():
+        head = s3.head_object(Bucket=s3_utils.S3_CONFIG["bucket"], Key=key)
+        assert entry["etag"] == head["ETag"].strip('"')
+        # What an S3 import of the same object would record, so it plans it as unchanged
+        assert entry["metadata"] == {"uploaded_at": head["LastModified"].timestamp(), "patient_id": "p-1"}
+    assert stored_ids() == {chunk_id for entry in entries.values() for chunk_id in entry["chunk_ids"]}
+
+
+def test_reupload_skips_stored_chunks(s3, store):
+    first = ingest(FILES)
+    store.requests.clear()
+    second = ingest(FILES)
+    assert second["stored"] == 0
+    assert second["skipped"] == first["stored"]
+    assert not store.requests
+
+
+def test_reupload_after_model_change_replaces_old_vectors(s3, store, monkeypatch):
+    ingest(FILES)
+    old_ids = stored_ids()
+
+    monkeypatch.setattr(vectorstore_utils, "EMBEDDING_MODEL", "test-embedding-v2")
+    summary = ingest(FILES)
+    assert summary["skipped"] == 0
+    assert summary["stored"] == len(old_ids)
+    new_ids = stored_ids()
+    assert len(new_ids) == len(old_ids) and not new_ids & old_ids
+    entries = get_entries(vectorstore_utils.CHROMA_COLLECTION, KEYS)
+    assert {entry["embedding_model"] for entry in entries.values()} == {"test-embedding-v2"}
@@ -0,0 +1,150 @@
+"""The SQLite job queue: claiming, cancellation, retries and requeueing jobs of lost workers"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app import jobs
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    """An empty queue under tmp_path with a ``test`` job kind whose handler the test sets"""
+    monkeypatch.setattr(jobs, "JOB_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "_conn", None)
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_INTERVAL", 60)
+    handler = {"run": lambda context: {"ok": True}}
+    monkeypatch.setitem(jobs.HANDLERS, "test", lambda context: handler["run"](context))
+    yield handler
+    if jobs._conn is not None:
+        jobs._conn.close()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def mark_running(job_id, pid, heartbeat_age):
+    jobs._execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, worker_pid = ?, heartbeat_at = ? "
+                  "WHERE id = ?", (pid, time.time() - heartbeat_age, job_id))
+
+
+def test_submit_rejects_unknown_kinds(queue):
+    with pytest.raises(ValueError):
+        jobs.submit_job("nope", {})
+
+
+def test_jobs_are_claimed_oldest_first_and_once(queue):
+    first = jobs.submit_job("test", {"n": 1})
+    second = jobs.submit_job("test", {"n": 2})
+
+    claimed = jobs._claim_next_job()
+    assert claimed["id"] == first and claimed["payload"] == {"n": 1}
+    assert claimed["attempts"] == 1
+    stored = jobs.get_job(first)
+    assert stored["status"] == "running" and stored["worker_pid"] == os.getpid()
+
+    assert jobs._claim_next_job()["id"] == second
+    assert jobs._claim_next_job() is None
+
+
+def test_run_job_records_the_result(queue):
+    job_id = jobs.submit_job("test", {})
+    jobs.run_job(jobs._claim_next_job())
+    job = jobs.get_job(job_id)
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"ok": True}
+    assert job["progress"] == 1
+    assert [listed["id"] for listed in jobs.list_jobs(statuses=["succeeded"], job_ids=[job_id])] == [job_id]
+    assert jobs.list_jobs(statuses=["failed"]) == []
+
+
+def test_cancel_a_queued_job(queue):
+    job_id = jobs.submit_job("test", {})
+    assert jobs.cancel_job(job_id)
+    assert jobs.get_job(job_id)["status"] == "cancelled"
+    assert jobs._claim_next_job() is None
+    assert not jobs.cancel_job(job_id)
+
+
+def test_cancel_a_running_job_at_its_next_checkpoint(queue):
+    job_id = jobs.submit_job("test", {})
+    job = jobs._claim_next_job()
+
+    def handler(context):
+        assert jobs.cancel_job(job_id)
+        context.update(0.5, "Working")
+        raise AssertionError("update() should have raised JobCancelled")
+
+    queue["run"] = handler
+    jobs.run_job(job)
+    job = jobs.get_job(job_id)
+    assert job["status"] == "cancelled" and job["cancel_requested"]
+
+
+def test_failures_back_off_then_fail_and_can_be_retried(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0)
+    job_id = jobs.submit_job("test", {}, max_attempts=2)
+
+    def handler(context):
+        raise RuntimeError(f"boom {context.attempt}")
+
+    queue["run"] = handler
+    jobs.run_job(jobs._claim_next_job())
+    job = jobs.get_job(job_id)
+    assert job["status"] == "queued" and job["error"] == "boom 1"
+
+    jobs.run_job(jobs._claim_next_job())
+    job = jobs.get_job(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2 and job["error"] == "boom 2"
+    assert jobs._claim_next_job() is None
+
+    queue["run"] = lambda context: {"ok": context.attempt}
+    assert jobs.retry_job(job_id)
+    assert not jobs.retry_job(job_id)
+    jobs.run_job(jobs._claim_next_job())
+    job = jobs.get_job(job_id)
+    assert job["status"] == "succeeded" and job["result"] == {"ok": 1} and job["error"] is None
+
+
+def test_retry_waits_for_the_backoff(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 3600)
+    jobs.submit_job("test", {})
+    queue["run"] = lambda context: 1 / 0
+    jobs.run_job(jobs._claim_next_job())
+    assert jobs._claim_next_job() is None
+
+
+def test_jobs_of_dead_workers_are_requeued_or_failed(queue):
+    requeue = jobs.submit_job("test", {}, max_attempts=2)
+    give_up = jobs.submit_job("test", {}, max_attempts=1)
+    recent = jobs.submit_job("test", {})
+    pid = dead_pid()
+    mark_running(requeue, pid, jobs.JOB_STALE_AFTER + 5)
+    mark_running(give_up, pid, jobs.JOB_STALE_AFTER + 5)
+    mark_running(recent, pid, 1)
+
+    jobs._requeue_stale_jobs()
+    assert jobs.get_job(requeue)["status"] == "queued"
+    assert jobs.get_job(requeue)["worker_pid"] is None
+    assert jobs.get_job(give_up)["status"] == "failed"
+    assert jobs.get_job(recent)["status"] == "running"
+
+
+@pytest.mark.skipif(os.name == "nt", reason="worker PIDs are not checked on Windows")
+def test_live_worker_pid_delays_requeue_only_up_to_the_lost_limit(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_LOST_AFTER", 600)
+    slow = jobs.submit_job("test", {})
+    silent = jobs.submit_job("test", {})
+    # This process stands in for a worker that is still running, or a new process that reused its PID
+    mark_running(slow, os.getpid(), jobs.JOB_STALE_AFTER + 5)
+    mark_running(silent, os.getpid(), 601)
+
+    jobs._requeue_stale_jobs()
+    assert jobs.get_job(slow)["status"] == "running"
+    assert jobs.get_job(silent)["status"] == "queued"
@@ -0,0 +1,80 @@
+"""The in-process LRU caches, and the query-embedding and retrieval memos built on them"""
+
+import types
+
+import pytest
+
+from app import query_cache
+from app.query_cache import LRUCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock for the cache module; advance it by setting ``clock.now``"""
+    fake = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(query_cache, "time", types.SimpleNamespace(monotonic=lambda: fake.now))
+    return fake
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache("test", 2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    # Overwriting refreshes recency too
+    cache.put("a", 10)
+    cache.put("d", 4)
+    assert cache.get("c") is None and cache.get("a") == 10
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (4, 2, 2, 2)
+    assert stats["hit_rate"] == pytest.approx(4 / 6)
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = LRUCache("test", 10, ttl=5)
+    cache.put("a", 1)
+    clock.now += 4
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["expired"], stats["misses"], stats["entries"]) == (1, 1, 0)
+
+
+def test_clear_and_zero_size():
+    cache = LRUCache("test", 10)
+    cache.put("a", 1)
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == 1
+
+    disabled = LRUCache("disabled", 0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None and disabled.stats()["entries"] == 0
+
+
+def test_repeated_retrieval_is_memoized_until_the_collection_changes(store):
+    pytest.importorskip("numpy")
+    from app import vectorstore_utils
+
+    vectorstore_utils.index_chunks(["Metformin 500 mg twice daily."], doc_keys=["documents/meds.pdf"])
+    store.requests.clear()
+    hits = vectorstore_utils.get_query_cache_stats()["retrieval"]["hits"]
+    first = vectorstore_utils.retrieve_relevant_docs("metformin dose", k=5)
+    assert [doc.page_content for doc in first] == ["Metformin 500 mg twice daily."]
+    assert store.requests == [["metformin dose"]]
+
+    assert [doc.page_content for doc in vectorstore_utils.retrieve_relevant_docs("metformin dose", k=5)] == \
+        ["Metformin 500 mg twice daily."]
+    assert vectorstore_utils.get_query_cache_stats()["retrieval"]["hits"] == hits + 1
+
+    vectorstore_utils.index_chunks(["Lisinopril 10 mg daily."], doc_keys=["documents/bp.pdf"])
+    store.requests.clear()
+    after_write = vectorstore_utils.retrieve_relevant_docs("metformin dose", k=5)
+    assert len(after_write) == 2
+    # The retrieval ran again, but the query embedding still came from memory
+    assert store.requests == []
@@ -0,0 +1,141 @@
+"""S3 helpers against moto's in-process S3 stand-in"""
+
+import os
+
+import pytest
+
+pytest.importorskip("moto")
+
+from app import s3_utils
+
+BUCKET = s3_utils.S3_CONFIG["bucket"]
+
+
+def test_get_s3_client_is_shared(s3):
+    assert s3_utils.get_s3_client() is s3
+
+
+def test_upload_small_file(s3):
+    result = s3_utils.upload_to_s3(b"%PDF-small", "small.pdf")
+    assert result["success"]
+    assert result["s3_key"] == "documents/small.pdf"
+    head = s3.head_object(Bucket=BUCKET, Key="documents/small.pdf")
+    assert head["ETag"].strip('"') == result["etag"]
+    assert head["LastModified"] == result["last_modified"]
+    assert head["ContentType"] == "application/pdf"
+
+
+def test_upload_large_file_uses_transfer_manager(s3, monkeypatch):
+    monkeypatch.setitem(s3_utils.S3_CONFIG, "multipart_threshold", 1024)
+    body = os.urandom(4096)
+    result = s3_utils.upload_to_s3(body, "large.pdf")
+    assert result["success"]
+    assert result["last_modified"] is not None
+    assert s3.get_object(Bucket=BUCKET, Key="documents/large.pdf")["Body"].read() == body
+
+
+@pytest.mark.parametrize("threshold", [1024, 10 ** 9])
+def test_upload_failure_is_reported_not_raised(s3, monkeypatch, threshold):
+    # Covers put_object's ClientError and upload_fileobj's S3UploadFailedError
+    monkeypatch.setitem(s3_utils.S3_CONFIG, "multipart_threshold", threshold)
+    monkeypatch.setitem(s3_utils.S3_CONFIG, "bucket", "missing-bucket")
+    result = s3_utils.upload_to_s3(os.urandom(2048), "lost.pdf")
+    assert result["success"] is False
+    assert result["error"]
+
+
+def test_download_many_to_files_streams_ranges(s3, monkeypatch):
+    monkeypatch.setitem(s3_utils.S3_CONFIG, "range_size", 1000)
+    bodies = {f"documents/{i}.pdf": os.urandom(2500 + i) for i in range(3)}
+    for key, body in bodies.items():
+        s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+    results = s3_utils.download_many_to_files(list(bodies) + ["documents/missing.pdf"])
+    try:
+        for (key, body), result in zip(bodies.items(), results):
+            assert result["success"]
+            with open(result["path"], "rb") as f:
+                assert f.read() == body
+        assert results[-1]["success"] is False
+    finally:
+        for result in results:
+            if result["success"]:
+                os.unlink(result["path"])
+
+
+def test_download_many_from_s3_keeps_order(s3):
+    for name in ("a", "b", "c"):
+        s3.put_object(Bucket=BUCKET, Key=f"documents/{name}.pdf", Body=name.encode())
+    results = s3_utils.download_many_from_s3([f"documents/{name}.pdf" for name in ("c", "a", "b")])
+    assert [result["content"] for result in results] == [b"c", b"a", b"b"]
+
+
+def test_iter_s3_documents_paginates(s3):
+    for i in range(1005):
+        s3.put_object(Bucket=BUCKET, Key=f"documents/{i:04d}.pdf", Body=b"x")
+    s3.put_object(Bucket=BUCKET, Key="documents/folder/", Body=b"")
+    documents = list(s3_utils.iter_s3_documents())
+    assert len(documents) == 1005
+    assert documents[0]["filename"] == "0000.pdf"
+
+
+def test_streamed_download_ignores_stale_listing_size(s3, monkeypatch):
+    monkeypatch.setitem(s3_utils.S3_CONFIG, "range_size", 1000)
+    body = os.urandom(3500)
+    etag = s3.put_object(Bucket=BUCKET, Key="documents/grown.pdf", Body=body)["ETag"].strip('"')
+    with s3_utils.open_s3_document("documents/grown.pdf", etag) as spool:
+        assert spool.read() == body
+
+
+def test_streamed_download_of_empty_object(s3):
+    s3.put_object(Bucket=BUCKET, Key="documents/empty.pdf", Body=b"")
+    result = s3_utils.download_s3_to_file("documents/empty.pdf")
+    try:
+        assert result["success"]
+        assert os.path.getsize(result["path"]) == 0
+    finally:
+        os.unlink(result["path"])
+
+
+def test_streamed_download_fails_for_a_replaced_version(s3):
+    old_etag = s3.put_object(Bucket=BUCKET, Key="documents/report.pdf", Body=b"old")["ETag"].strip('"')
+    s3.put_object(Bucket=BUCKET, Key="documents/report.pdf", Body=b"new version")
+    result = s3_utils.download_s3_to_file("documents/report.pdf", old_etag)
+    assert result["success"] is False
+
+
+def test_object_replaced_mid_download_fails(s3, monkeypatch):
+    monkeypatch.setitem(s3_utils.S3_CONFIG, "range_size", 1000)
+    s3.put_object(Bucket=BUCKET, Key="documents/moving.pdf", Body=os.urandom(2500))
+    get_object = s3.get_object
+
+    def replace_after_first_range(**kwargs):
+        response = get_object(**kwargs)
+        if kwargs["Range"].startswith("bytes=0-"):
+            s3.put_object(Bucket=BUCKET, Key="documents/moving.pdf", Body=os.urandom(2500))
+        return response
+
+    monkeypatch.setattr(s3, "get_object", replace_after_first_range)
+    result = s3_utils.download_s3_to_file("documents/moving.pdf")
+    assert result["success"] is False
+    assert "PreconditionFailed" in result["error"] or "412" in result["error"]
+
+
+def test_server_ignoring_range_is_read_once(s3, monkeypatch):
+    monkeypatch.setitem(s3_utils.S3_CONFIG, "range_size", 1000)
+    body = os.urandom(2500)
+    s3.put_object(Bucket=BUCKET, Key="documents/whole.pdf", Body=body)
+    get_object = s3.get_object
+    calls = []
+
+    def ignore_range(**kwargs):
+        calls.append(kwargs)
+        kwargs.pop("Range")
+        response = get_object(**kwargs)
+        response.pop("ContentRange", None)
+        return response
+
+    monkeypatch.setattr(s3, "get_object", ignore_range)
+    with s3_utils.open_s3_document("documents/whole.pdf") as spool:
+        assert spool.read() == body
+    assert len(calls) == 1
@@ -0,0 +1,152 @@
+"""The flat vector backend: upserts, where filters, metadata updates, deletes and compaction, per storage dtype"""
+
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.vector_backends import FlatClient, FlatCollection
+
+DTYPES = ["float32", "float16", "int8"]
+DIM = 16
+
+
+def vector(seed):
+    return np.random.default_rng([seed]).standard_normal((1, DIM)).astype(np.float32)[0]
+
+
+@pytest.fixture(params=DTYPES)
+def collection(request, tmp_path):
+    return FlatCollection("test", str(tmp_path / "test"), dtype=request.param)
+
+
+def add(collection, n, start=0, metadata=None):
+    ids = [f"c{i}" for i in range(start, start + n)]
+    collection.upsert(ids=ids, embeddings=np.stack([vector(i) for i in range(start, start + n)]),
+                      documents=[f"doc {i}" for i in range(start, start + n)],
+                      metadatas=[metadata(i) for i in range(start, start + n)] if metadata else None)
+    return ids
+
+
+def nearest(collection, seed, **kwargs):
+    return collection.query(vector(seed), n_results=kwargs.pop("n_results", 1), **kwargs)
+
+
+def test_upsert_then_query_finds_each_vector(collection):
+    add(collection, 50, metadata=lambda i: {"source": f"s{i % 5}"})
+    assert collection.count() == 50
+    for seed in (0, 17, 49):
+        result = nearest(collection, seed)
+        assert result["ids"] == [[f"c{seed}"]]
+        assert result["documents"] == [[f"doc {seed}"]]
+        assert result["metadatas"] == [[{"source": f"s{seed % 5}"}]]
+        assert result["distances"][0][0] == pytest.approx(0.0, abs=0.02)
+
+
+def test_upsert_replaces_an_existing_id(collection):
+    add(collection, 10)
+    collection.upsert(ids=["c3", "c3"], embeddings=np.stack([vector(100), vector(101)]), documents=["old", "new"])
+    assert collection.count() == 10
+    assert collection.get(ids=["c3"])["documents"] == ["new"]
+    assert nearest(collection, 101)["ids"] == [["c3"]]
+    assert nearest(collection, 3, n_results=10)["ids"][0].count("c3") == 1
+
+
+def test_dimension_mismatch_is_rejected(collection):
+    add(collection, 2)
+    with pytest.raises(ValueError):
+        collection.upsert(ids=["x"], embeddings=np.ones((1, DIM + 1)))
+
+
+def test_where_filters(collection):
+    add(collection, 40, metadata=lambda i: {"source": f"s{i % 4}", "page": i, "patient_id": "p1" if i < 20 else "p2"})
+
+    def ids(where):
+        return set(collection.get(where=where, include=[])["ids"])
+
+    assert ids({"source": "s1"}) == {f"c{i}" for i in range(1, 40, 4)}
+    assert ids({"source": {"$in": ["s0", "s1"]}}) == {f"c{i}" for i in range(40) if i % 4 in (0, 1)}
+    assert ids({"source": {"$nin": ["s0", "s1"]}}) == {f"c{i}" for i in range(40) if i % 4 in (2, 3)}
+    assert ids({"$and": [{"patient_id": "p2"}, {"page": {"$lt": 24}}]}) == {"c20", "c21", "c22", "c23"}
+    assert ids({"$or": [{"page": {"$gte": 38}}, {"page": 0}]}) == {"c0", "c38", "c39"}
+    assert ids({"$and": []}) == {f"c{i}" for i in range(40)}
+
+    result = nearest(collection, 5, n_results=3, where={"patient_id": "p2"})
+    assert len(result["ids"][0]) == 3
+    assert all(int(chunk_id[1:]) >= 20 for chunk_id in result["ids"][0])
+    assert nearest(collection, 5, where={"source": "none"})["ids"] == [[]]
+
+
+def test_update_merges_metadata_and_none_removes_keys(collection):
+    add(collection, 3, metadata=lambda i: {"source": "a.pdf", "patient_id": "p1", "page": i})
+    collection.update(ids=["c0", "c1", "missing"],
+                      metadatas=[{"patient_id": "p2"}, {"patient_id": None}, {"patient_id": "p3"}])
+    collection.update(ids=["c2"], documents=["rewritten"])
+    stored = collection.get(ids=["c0", "c1", "c2"])
+    by_id = dict(zip(stored["ids"], zip(stored["documents"], stored["metadatas"])))
+    assert by_id["c0"] == ("doc 0", {"source": "a.pdf", "patient_id": "p2", "page": 0})
+    assert by_id["c1"] == ("doc 1", {"source": "a.pdf", "page": 1})
+    assert by_id["c2"] == ("rewritten", {"source": "a.pdf", "patient_id": "p1", "page": 2})
+    assert collection.count() == 3
+    assert nearest(collection, 2)["ids"] == [["c2"]]
+
+
+def test_delete_by_ids_and_where(collection):
+    add(collection, 10, metadata=lambda i: {"source": "even" if i % 2 == 0 else "odd"})
+    collection.delete(ids=["c1"])
+    collection.delete(where={"source": "even"})
+    assert sorted(collection.get(include=[])["ids"]) == ["c3", "c5", "c7", "c9"]
+    assert sorted(nearest(collection, 0, n_results=10)["ids"][0]) == ["c3", "c5", "c7", "c9"]
+    collection.delete(ids=["c3", "c5", "c7", "c9"])
+    assert collection.count() == 0
+    assert nearest(collection, 3)["ids"] == [[]]
+
+
+def test_compaction_keeps_live_rows_and_replaces_the_vector_file(collection):
+    add(collection, 1200, metadata=lambda i: {"page": i})
+    files_before = sorted(name for name in os.listdir(collection.path) if name.startswith("vectors"))
+    collection.delete(ids=[f"c{i}" for i in range(1200) if i % 4])
+
+    assert collection._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0] == 300
+    files_after = sorted(name for name in os.listdir(collection.path) if name.startswith("vectors"))
+    assert len(files_after) == 1 and files_after != files_before
+    assert collection.count() == 300
+    for seed in (0, 4, 1196):
+        result = nearest(collection, seed)
+        assert result["ids"] == [[f"c{seed}"]]
+        assert result["metadatas"] == [[{"page": seed}]]
+    add(collection, 5, start=5000)
+    assert nearest(collection, 5004)["ids"] == [["c5004"]]
+
+
+def test_reader_on_an_old_snapshot_follows_a_compaction(collection):
+    add(collection, 1200)
+    # A second handle, as another process would have, mapped before the compaction
+    reader = FlatCollection("test", collection.path)
+    assert nearest(reader, 8)["ids"] == [["c8"]]
+    collection.delete(ids=[f"c{i}" for i in range(1200) if i % 4])
+
+    assert reader.count() == 300
+    for seed in (8, 12, 1196):
+        assert nearest(reader, seed)["ids"] == [[f"c{seed}"]]
+    assert nearest(reader, 9, n_results=300)["ids"][0].count("c9") == 0
+
+
+def test_reopened_index_keeps_dtype_and_data(collection):
+    add(collection, 20)
+    reopened = FlatCollection("test", collection.path, dtype="float32" if collection.dtype != "float32" else "int8")
+    assert reopened.dtype == collection.dtype
+    assert reopened.count() == 20
+    assert nearest(reopened, 11)["ids"] == [["c11"]]
+
+
+def test_client_manages_collections(tmp_path):
+    client = FlatClient(str(tmp_path / "flat"))
+    created = client.get_or_create_collection("docs")
+    assert client.get_or_create_collection("docs") is created
+    with pytest.raises(ValueError):
+        client.create_collection("docs")
+    client.delete_collection("docs")
+    with pytest.raises(ValueError):
+        client.get_collection("docs")
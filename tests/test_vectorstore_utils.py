@@ -0,0 +1,61 @@
+"""Indexing and the index ledger against the flat backend, with a fake embedding endpoint"""
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_text_splitters")
+
+from app import vectorstore_utils
+from app.chunk_utils import CHUNKING_CONFIG, get_document_chunks_with_metadata
+from app.index_ledger import get_entries, plan_import
+
+DOCUMENTS = [
+    {"key": "documents/a.pdf", "etag": "etag-a", "metadata": {"patient_id": "p-1"}, "patient_id": "p-1",
+     "pages": [(1, "Blood pressure 120/80 mmHg. " * 60), (2, "Metformin 500 mg twice daily. " * 40)]},
+    {"key": "documents/b.pdf", "etag": "etag-b", "metadata": {},
+     "pages": [(1, "Chest X-ray shows no acute findings. " * 30)]},
+]
+
+
+def import_documents(documents):
+    """What an S3 import job does with already extracted documents"""
+    plan = plan_import(vectorstore_utils.CHROMA_COLLECTION, documents, vectorstore_utils.EMBEDDING_MODEL,
+                       CHUNKING_CONFIG)
+    changed = plan["new"] + plan["modified"]
+    chunks, chunk_keys, metadatas = get_document_chunks_with_metadata(
+        [{key: value for key, value in doc.items() if key not in ("etag", "metadata")} for doc in changed])
+    result = vectorstore_utils.index_s3_documents(chunks, chunk_keys, {doc["key"]: doc["etag"] for doc in changed},
+                                                  CHUNKING_CONFIG, metadatas=metadatas,
+                                                  document_metadata={doc["key"]: doc["metadata"] for doc in changed})
+    return plan, result
+
+
+def test_reimport_of_unchanged_documents_embeds_nothing(store):
+    _, first = import_documents(DOCUMENTS)
+    assert first["stored"] > 0 and not first["failed_ids"]
+    embedded = sum(len(texts) for texts in store.requests)
+
+    plan, second = import_documents(DOCUMENTS)
+    assert [doc["key"] for doc in plan["unchanged"]] == [doc["key"] for doc in DOCUMENTS]
+    assert second["stored"] == 0
+    assert sum(len(texts) for texts in store.requests) == embedded
+
+
+def test_model_change_re_embeds_and_drops_old_vectors(store, monkeypatch):
+    _, first = import_documents(DOCUMENTS)
+    collection = first["collection"]
+    old_ids = set(first["ids"])
+    assert collection.count() == len(old_ids)
+
+    monkeypatch.setattr(vectorstore_utils, "EMBEDDING_MODEL", "test-embedding-v2")
+    store.requests.clear()
+    plan, second = import_documents(DOCUMENTS)
+
+    assert [doc["key"] for doc in plan["modified"]] == [doc["key"] for doc in DOCUMENTS]
+    assert second["skipped"] == 0
+    assert second["stored"] == len(second["ids"]) == sum(len(texts) for texts in store.requests)
+    assert not old_ids.intersection(second["ids"])
+    assert second["stale_deleted"] == len(old_ids)
+    assert set(collection.get()["ids"]) == set(second["ids"])
+    entries = get_entries(vectorstore_utils.CHROMA_COLLECTION, [doc["key"] for doc in DOCUMENTS])
+    assert {entry["embedding_model"] for entry in entries.values()} == {"test-embedding-v2"}